@@ -2,6 +2,15 @@ from dataclasses import dataclass, field
 from omegaconf import MISSING
 # from hydra.core.config_store import ConfigStore
 
+@dataclass
+class EvalSchedule:
+    kind: str = 'every' # 'every' k epochs, 'log'-spaced or evenly spaced ('count') epochs
+    every: int = 5
+    num_points: int = 0 # number of evaluations for 'log' and 'count'
+    subset_size: int = 0 # evaluate test losses during training on a fixed random subset; 0 uses all
+    subset_seed: int = 0
+
+
 @dataclass
 class TrainingParams:
     eta_0: float = 0.1
@@ -9,9 +18,23 @@ class TrainingParams:
     weight_decay: float = 1e-5 # TODO: not implemented; replace with batch_size
     batch_size: int = 128
     epochs: int = 80
+    epochs_per_call: int = 1 # epochs run by each compiled call; losses are fetched once per call
+    step_train_losses: bool = False # record the mean minibatch loss of each epoch as the training curve
+    train_loss_milestones: list[int] = field(default_factory=list) # full-pass training losses with step_train_losses
+    eval_schedule: EvalSchedule = field(default_factory=EvalSchedule)
     full_batch_gradient: bool = False
 
 
+@dataclass
+class Transforms:
+    # applied on the host in this order; see `src.experiment.dataset.transforms`
+    classes: list[int] = field(default_factory=lambda: [0, 1, 3, 4, 5, 7, 8, 9]) # classes kept; [] keeps all
+    positive_classes: list[int] = field(default_factory=lambda: [0, 1, 8, 9]) # labels are 1 for these, else -1; [] keeps class indices
+    grayscale: bool = False
+    center: bool = True # subtract the mean training image
+    sphere_scale: bool = True # scale so that training images have unit mean norm
+
+
 @dataclass
 class DataParams:
     P: int = MISSING
@@ -20,6 +43,8 @@ class DataParams:
     random_subset: bool = True
     data_seed: int = MISSING
     root_dir: str = 'data-dir'
+    transforms: Transforms = field(default_factory=Transforms)
+    device_dtype: str = 'float32' # 'uint8' keeps images as uint8 on device and normalizes each batch in the step
 
 
 @dataclass
@@ -34,7 +59,9 @@ class TaskConfig:
     model_params: ModelParams = field(default_factory=ModelParams)
     repeat: int = 12
     parallelize: bool = True
+    replicas_per_device: int = 1
     seed: int = MISSING
+    dependencies: list[int] = field(default_factory=list) # indices into task_list
 
 
 @dataclass
@@ -47,11 +74,54 @@ class Setting:
   dataset: str = 'cifar10'
   model: str = 'resnet18'
 
+@dataclass
+class SchedulerParams:
+    devices_per_task: int = 0 # 0 runs every task on all devices
+    fuse_tasks: bool = False # train tasks that differ only in alpha / eta_0 together, when that saves batches
+
+
+@dataclass
+class CompilationCacheParams:
+    local_dir: str = '' # node-local cache read by JAX; '' disables the cache
+    shared_dir: str = '' # shared cache that the node-local one is synced with
+
+
+@dataclass
+class DataCacheParams:
+    dir: str = '' # preprocessed datasets, keyed by data params and preprocessing code; '' disables the cache
+
+
+@dataclass
+class ResultsParams:
+    save_params: bool = True # store the final params of every trial next to its metrics
+    pack: bool = True # move the files of complete tasks into the run's pack
+
+
+@dataclass
+class CheckpointParams:
+    dir: str = '' # persistent directory for training checkpoints; '' disables checkpoints
+    every_seconds: float = 1800.0
+
+
+@dataclass
+class SyncParams:
+    every_seconds: float = 60.0 # how often new and changed results are copied to permanent storage
+    max_mbytes_per_second: float = 0.0 # 0 does not cap the copy rate
+    retries: int = 5
+
+
 @dataclass
 class Config:
     setting: Setting
     hyperparams: TaskListConfig
     base_dir: str = ''
+    results_name: str = '' # permanent results folder, shared by re-runs; '' uses a new timestamped one
+    scheduler: SchedulerParams = field(default_factory=SchedulerParams)
+    compilation_cache: CompilationCacheParams = field(default_factory=CompilationCacheParams)
+    data_cache: DataCacheParams = field(default_factory=DataCacheParams)
+    checkpoint: CheckpointParams = field(default_factory=CheckpointParams)
+    results: ResultsParams = field(default_factory=ResultsParams)
+    sync: SyncParams = field(default_factory=SyncParams)
 
 
 # def conf_register() -> None:
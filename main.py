@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 import logging
+import sys
 import time
 
 from omegaconf import DictConfig
@@ -8,11 +9,14 @@ import hydra
 
 from os.path import join
 
-from src.run.save_helpers import copy_results_into_permanent
+from src.run.syncer import ResultSyncer
+from src.run.ledger import Ledger, LEDGER_FNAME
+from src.run.catalog import Catalog, CATALOG_FNAME
+from src.run.pack import PackWriter, PACK_FNAME, INDEX_FNAME
 
 from src.experiment.names import names
-from src.run.run_tasks import run_tasks
-from src.run import constants
+from src.run.run_tasks import run_tasks, prewarm_tasks
+from src.run import constants, compilation_cache, checkpoint
 
 import jax
 
@@ -22,6 +26,11 @@ log = logging.getLogger(__name__)
 
 @hydra.main(version_base=None, config_path='conf', config_name='config')
 def main(cfg: DictConfig):
+    # before the backend starts, which reads the XLA flags the cache needs
+    cache_params = cfg.get('compilation_cache', {})
+    if cache_params.get('local_dir'):
+        compilation_cache.initialize(cache_params['local_dir'], cache_params.get('shared_dir', ''))
+
     log.info(f'Found {len(jax.devices())} device(s).')
     # cfg = (setting, hyperparams)
     setting = cfg.setting
@@ -31,26 +40,66 @@ def main(cfg: DictConfig):
     except KeyError:
         raise ValueError('Invalid experimental setting.')
 
+    checkpoint_params = cfg.get('checkpoint', {})
+    if checkpoint_params.get('dir'):
+        checkpoint.initialize(checkpoint_params['dir'], checkpoint_params.get('every_seconds', 1800.0))
+
     hp_list = cfg.hyperparams.task_list
+    scheduler_params = cfg.get('scheduler', {})
     
-    reader = module_.TaskReader(hp_list)
+    reader = module_.TaskReader(hp_list, cfg.hyperparams.data_params, 
+                                fuse=scheduler_params.get('fuse_tasks', False),
+                                devices_per_task=scheduler_params.get('devices_per_task', 0))
     
     base_dir = cfg.base_dir
     
-    PD = module_.PreprocessDevice(base_dir, cfg.hyperparams.data_params)
+    PD = module_.PreprocessDevice(base_dir, cfg.hyperparams.data_params, 
+                                  cache_dir=cfg.get('data_cache', {}).get('dir', ''))
     
     log.info('Loading data...')
     PD.preprocess()
     log.info('...done.')
 
+    if cfg.get('prewarm', False):
+        log.info('Pre-warming compilation cache...')
+        prewarm_tasks(reader.distinct_shapes(), PD, scheduler_params.get('devices_per_task', 0))
+        compilation_cache.push()
+        log.info('...done.')
+        return
+
+    # a named results folder is appended to by re-runs, which skip the trials in its ledger
+    results_name = cfg.get('results_name') or 'results-' + time.strftime("%Y%m%d-%H%M%S")
+    # results are mirrored into permanent while tasks run, so a killed job keeps what it finished
+    sync_params = cfg.get('sync', {})
+    syncer = ResultSyncer(PD.save_dir, join(constants.REMOTE_RESULTS_FOLDER, results_name),
+                          sync_params.get('every_seconds', 60.0),
+                          sync_params.get('max_mbytes_per_second', 0.0) * 2 ** 20,
+                          sync_params.get('retries', 5), append_only=(PACK_FNAME, INDEX_FNAME))
+    # a re-run starts from the results, ledger and catalog of the earlier runs
+    syncer.restore()
+    ledger = Ledger(join(PD.save_dir, LEDGER_FNAME))
+    catalog = Catalog(join(PD.save_dir, CATALOG_FNAME))
+    # trials are inserted while the catalog is synced, so a snapshot is copied instead
+    syncer.add_snapshot(CATALOG_FNAME, catalog.backup)
+    # the files of complete tasks are packed into a few large files; see `src.run.pack`
+    pack = PackWriter(PD.save_dir) if cfg.get('results', {}).get('pack', True) else None
+    syncer.start()
+
     log.info('Running tasks...')
-    run_tasks(reader.tasks, PD)
+    try:
+        run_tasks(reader.tasks, PD, scheduler_params.get('devices_per_task', 0), ledger, 
+                  cfg.get('results', {}).get('save_params', True), catalog, pack)
+    except checkpoint.Preempted:
+        log.warning('...preempted; the job will resume from its checkpoints.')
+        syncer.finish()
+        catalog.close()
+        sys.exit(constants.PREEMPTED_EXIT_CODE)
     log.info('...all tasks complete.')
 
-    log.info('Moving results into permanent...')
-    timestr = time.strftime("%Y%m%d-%H%M%S")
-    permanent_results_dirname = 'results-' + timestr
-    copy_results_into_permanent(PD.save_dir, permanent_results_dirname)
+    log.info('Syncing the remaining results into permanent...')
+    syncer.finish()
+    catalog.close()
+    checkpoint.clear()
     log.info('...done.')
 
 
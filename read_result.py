@@ -1,7 +1,8 @@
 from omegaconf import OmegaConf
 
 from src.run.constants import REMOTE_RESULTS_FOLDER
-from src.experiment.training.Result import Result
+from src.run import catalog, result_store
+from src.analysis import aggregate, ensemble_curves, legacy
 
 from collections import defaultdict
 
@@ -131,6 +132,48 @@ def average_f_train_loss(trials):
     trial_losses = [trials[i].train_losses[-1] for i in range(num_trials) if i not in nan_indices]
     return np.mean(trial_losses), len(nan_indices)
 
+def get_catalog_losses(FOLDER=REMOTE_RESULTS_FOLDER):
+    """Mean test losses and accuracies of the trials, and their numbers of NaN trials, per 
+    (data_seed, P, alpha, N, eta_0), read from the catalogs of the results folders rather than 
+    from the results. The catalogs hold no predictions, so there are no ensemble losses; see 
+    `get_sweep_table` for those."""
+    catalogs = catalog.open_catalogs(FOLDER)
+    keys, mean_losses, num_nan = catalog.losses(catalogs)
+    _, mean_accuracies, _ = catalog.accuracies(catalogs)
+    return keys, mean_losses, mean_accuracies, num_nan
+
+def load_results_fields(FOLDER=REMOTE_RESULTS_FOLDER, prefix='results-', fields=legacy.DEFAULT_FIELDS, processes=None):
+    """Like `see_lr_deviations`, but loads only `fields` of each trial, on a process pool; see 
+    `legacy.load_archives`."""
+    folders = [join(FOLDER, rf) for rf in sorted(os.listdir(FOLDER)) if rf.startswith(prefix)]
+    return legacy.load_archives(folders, fields, processes)
+
+def get_sweep_table(FOLDER=REMOTE_RESULTS_FOLDER, prefix='results-'):
+    """Mean and ensemble losses and accuracies, mean train losses and NaN counts of every task in 
+    the results folders, as one table keyed by (data_seed, P, alpha, N, eta_0); see 
+    `aggregate.aggregate`."""
+    folders = [join(FOLDER, rf) for rf in sorted(os.listdir(FOLDER)) if rf.startswith(prefix)]
+    return aggregate.aggregate(folders)
+
+def get_ensemble_curves(FOLDER=REMOTE_RESULTS_FOLDER, prefix='results-', num_samples=200, processes=None):
+    """Test loss and accuracy against ensemble size, with bootstrap confidence intervals, for 
+    every task in the results folders; see `ensemble_curves.sweep_curves`."""
+    folders = [join(FOLDER, rf) for rf in sorted(os.listdir(FOLDER)) if rf.startswith(prefix)]
+    return ensemble_curves.sweep_curves(folders, num_samples=num_samples, processes=processes)
+
+def get_task_results(results_folder, task_name, FOLDER=REMOTE_RESULTS_FOLDER):
+    """The results of one task, whether its folder was packed or not; fields are memory-mapped 
+    and read on access. See `result_store.TaskResults`."""
+    return result_store.load_task(join(FOLDER, results_folder, task_name))
+
+def get_task_config(results_folder, task_name, FOLDER=REMOTE_RESULTS_FOLDER):
+    task_folder = join(FOLDER, results_folder, task_name)
+    return OmegaConf.create(result_store.read_file(task_folder, 'task_config.yaml').decode())
+
+def list_tasks(results_folder, FOLDER=REMOTE_RESULTS_FOLDER):
+    """Names of the tasks in a results folder, whether packed or not."""
+    return result_store.task_folders(join(FOLDER, results_folder))
+
 def get_overall_losses(results_list):
     nested = defaultdict(lambda: defaultdict(dict))
     for res in results_list:
@@ -9,6 +9,7 @@ import numpy as np
 from template import SBATCH_TEMPLATE
 from math import ceil
 from config_structs import Config, DataParams, ModelParams, TrainingParams, Setting, TaskConfig, TaskListConfig
+from config_structs import CompilationCacheParams, CheckpointParams, DataCacheParams
 
 CONFIG_DIR = '../conf/experiment'
 SBATCH_DIR = '../sbatch_files'
@@ -17,9 +18,23 @@ BASE_DIR = '/tmp/{id}'
 
 CONFIG_NAME = 'sweep_{id}.yaml'
 SBATCH_NAME = 'sweep_{id}.bat'
+PREWARM_SBATCH_NAME = 'prewarm_{id}.bat'
+
+# node-local compilation cache, backed by a shared one on holystore
+LOCAL_XLA_CACHE_DIR = '/tmp/xla-cache'
+SHARED_XLA_CACHE_DIR = '/n/holystore01/LABS/pehlevan_lab/Users/sab/xla-cache'
+
+# training checkpoints must survive the requeue of a job onto another node
+CHECKPOINT_DIR = '/n/holystore01/LABS/pehlevan_lab/Users/sab/checkpoints/sweep_{id}'
+
+# preprocessed datasets, shared by the jobs of every sweep with the same data params
+DATA_CACHE_DIR = '/n/holystore01/LABS/pehlevan_lab/Users/sab/data-cache'
 
 def gen_sweeps(mo_vals, lr_vals, alpha_vals, N_vals, P_vals, ensemble_size: int, ngpus: int,
-            bagging_size: int, seed: int, data_seed: int):
+            bagging_size: int, seed: int, data_seed: int, prewarm: bool = True):
+    """Writes one config and sbatch file per sweep. If `prewarm`, also writes one sbatch file per 
+    distinct training set size that only compiles the sweep's programs into the shared compilation 
+    cache; `run_sweeps.sh` submits these first."""
     k = jr.PRNGKey(seed)
     lP, la, lN = len(P_vals), len(alpha_vals), len(N_vals)
     seeds = asarray(jr.randint(k, (lP * la * lN,), 0, 10**6
@@ -32,6 +47,7 @@ def gen_sweeps(mo_vals, lr_vals, alpha_vals, N_vals, P_vals, ensemble_size: int,
     config_save_folder = join(curr_dir, CONFIG_DIR)
     sbatch_save_folder = join(curr_dir, SBATCH_DIR)
 
+    prewarm_ids = {} # P -> id of the first sweep with that P
     id = 0
     for mo in mo_vals:
         for lr in lr_vals:
@@ -45,7 +61,7 @@ def gen_sweeps(mo_vals, lr_vals, alpha_vals, N_vals, P_vals, ensemble_size: int,
                     config_fname = CONFIG_NAME.format(id=id)
                     config_rel_loc = join(config_save_folder, config_fname)
 
-                    sbatch_str = SBATCH_TEMPLATE.format(id=id, ngpus=ngpus)
+                    sbatch_str = SBATCH_TEMPLATE.format(id=id, ngpus=ngpus, args='')
 
                     sbatch_fname = SBATCH_NAME.format(id=id)
                     sbatch_rel_loc = join(sbatch_save_folder, sbatch_fname)
@@ -56,8 +72,15 @@ def gen_sweeps(mo_vals, lr_vals, alpha_vals, N_vals, P_vals, ensemble_size: int,
                         fi.write(config_str) # TODO: add file exists exception handler + clean up
                     with open(sbatch_rel_loc, mode='x') as fi:
                         fi.write(sbatch_str) # TODO: add file exists exception handler + clean up
+                    prewarm_ids.setdefault(P, id)
                     id += 1
 
+    if prewarm:
+        for id in prewarm_ids.values():
+            prewarm_str = SBATCH_TEMPLATE.format(id=id, ngpus=ngpus, args=' +prewarm=true')
+            with open(join(sbatch_save_folder, PREWARM_SBATCH_NAME.format(id=id)), mode='x') as fi:
+                fi.write(prewarm_str)
+
 
 def _gen_sweep(id, lr, mo, alpha_vals, N_vals, P, es, seed_matrix, data_seed):
     dp = DataParams(P=P, data_seed=int(data_seed))
@@ -76,7 +99,9 @@ def _gen_sweep(id, lr, mo, alpha_vals, N_vals, P, es, seed_matrix, data_seed):
             tasks.task_list.append(a_N_task)
     
     setting = Setting()
-    conf = Config(setting, tasks, BASE_DIR.format(id=id))
+    cache = CompilationCacheParams(LOCAL_XLA_CACHE_DIR, SHARED_XLA_CACHE_DIR)
+    conf = Config(setting, tasks, BASE_DIR.format(id=id), results_name=f'results-sweep-{id}', compilation_cache=cache, 
+                  checkpoint=CheckpointParams(CHECKPOINT_DIR.format(id=id)), data_cache=DataCacheParams(DATA_CACHE_DIR))
 
     str_conf = OmegaConf.to_yaml(conf)
     return '# @package _global_\n' + str_conf
@@ -2,11 +2,16 @@ from torchvision.datasets import CIFAR10
 
 import sys
 
-def download_cifar10(loc):
+from src.experiment.dataset.cifar10 import write_flat
+
+def download_cifar10(loc, flat=False):
     training_data = CIFAR10(loc, train=True, download=True)
     test_data = CIFAR10(loc, train=False, download=True)
+    # jobs memory-map the flat file instead of decoding the batches
+    if flat:
+        write_flat(loc)
 
 
 if __name__ == '__main__':
     loc = sys.argv[1]
-    download_cifar10(loc)
\ No newline at end of file
+    download_cifar10(loc, flat='--flat' in sys.argv[2:])
@@ -1,4 +1,20 @@
+SBATCH_FOLDER="/n/home07/ssainathan/workplace/gpu_scheduler/sbatch_files"
+
+# pre-warm the shared compilation cache before the sweeps start
+PREWARM_JOBS=""
+for prewarm in "${SBATCH_FOLDER}"/prewarm_*.bat
+do
+    [ -e "$prewarm" ] || continue
+    PREWARM_JOBS="${PREWARM_JOBS}:$(sbatch --parsable "$prewarm")"
+done
+
+DEPENDENCY=""
+if [ -n "$PREWARM_JOBS" ]
+then
+    DEPENDENCY="--dependency=afterany${PREWARM_JOBS}"
+fi
+
 for sweep in {0..34}
 do
-    sbatch "/n/home07/ssainathan/workplace/gpu_scheduler/sbatch_files/sweep_${sweep}.bat"
-done
\ No newline at end of file
+    sbatch $DEPENDENCY "${SBATCH_FOLDER}/sweep_${sweep}.bat"
+done
@@ -10,6 +10,7 @@ SBATCH_TEMPLATE = '''#!/bin/bash
 #SBATCH --ntasks=1       
 #SBATCH --gres=gpu:{ngpus}
 #SBATCH --requeue
+#SBATCH --signal=USR1@600
 
 module load cuda/11.7.1-fasrc01 cudnn/8.5.0.96_cuda11-fasrc01 Anaconda3/2020.11
 
@@ -30,4 +31,9 @@ rm conf/config.yaml
 
 printf "defaults:\\n  - experiment: sweep_{id}" > conf/config.yaml
 
-srun python3 main.py'''
\ No newline at end of file
+srun python3 main.py{args}
+
+# checkpointed after SIGUSR1 / SIGTERM; see src/run/constants.py:PREEMPTED_EXIT_CODE
+if [ $? -eq 75 ]; then
+    scontrol requeue $SLURM_JOB_ID
+fi'''
\ No newline at end of file
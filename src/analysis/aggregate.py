@@ -0,0 +1,123 @@
+"""Single-pass aggregation of sweep results into a tidy table with one row per task.
+
+Each task's trials are stacked into arrays once, and every metric is computed from those arrays
+with numpy: mean and ensemble test MSE, mean and ensemble accuracy, mean final train loss and the
+number of NaN trials. Trials whose final test loss is NaN are left out of every mean and ensemble.
+"""
+from os.path import join, exists
+from typing import Iterable, Mapping, Optional, Sequence
+
+import numpy as np
+from omegaconf import OmegaConf
+
+from src.run.result_store import is_store, load_task, task_folders, read_file
+from src.analysis import legacy
+
+TABLE_KEYS = ('data_seed', 'P', 'alpha', 'N', 'eta_0')
+METRICS = ('mean_loss', 'ensemble_loss', 'mean_accuracy', 'ensemble_accuracy', 'mean_train_loss',
+           'num_nan', 'num_trials')
+
+
+def task_metrics(test_loss_f: np.ndarray, final_train_loss: np.ndarray, yhat: np.ndarray,
+                 y: np.ndarray) -> dict:
+    """Metrics of one task, given its trials stacked along the first axis: final test losses (T,),
+    final train losses (T,), test predictions (T, n, ...) and the shared test labels (n, ...)."""
+    valid = ~np.isnan(test_loss_f)
+    num_valid = int(valid.sum())
+    yhat = np.asarray(yhat)[valid]
+    y = np.asarray(y)
+    sample_axes = tuple(range(1, yhat.ndim))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if num_valid:
+            ensemble = yhat.mean(axis=0)
+            ensemble_loss = np.mean((ensemble - y) ** 2)
+            ensemble_accuracy = np.mean(y * ensemble > 0)
+            mean_accuracy = np.mean(np.mean(y * yhat > 0, axis=sample_axes))
+        else:
+            ensemble_loss = ensemble_accuracy = mean_accuracy = np.nan
+        return dict(mean_loss=np.mean(test_loss_f[valid]) if num_valid else np.nan,
+                    ensemble_loss=ensemble_loss,
+                    mean_accuracy=mean_accuracy, ensemble_accuracy=ensemble_accuracy,
+                    mean_train_loss=np.mean(final_train_loss[valid]) if num_valid else np.nan,
+                    num_nan=len(test_loss_f) - num_valid, num_trials=len(test_loss_f))
+
+
+def stack_trials(trials: Sequence) -> dict:
+    """Stacks the fields of a list of `Result`s that the metrics need."""
+    return dict(test_loss_f=np.array([float(t.test_loss_f) for t in trials]),
+                final_train_loss=np.array([np.asarray(t.train_losses)[-1] for t in trials], dtype=float),
+                yhat=np.stack([np.asarray(t.test_yhat_f) for t in trials]),
+                y=np.asarray(trials[0].test_y))
+
+
+def stack_store(folder: str) -> dict:
+    """Reads the fields that the metrics need from the result store in `folder`."""
+    task = load_task(folder)
+    train_losses = task['train_losses']
+    return dict(test_loss_f=np.asarray(task['test_loss_f'], dtype=float),
+                final_train_loss=np.asarray(train_losses[:, -1], dtype=float),
+                yhat=np.asarray(task['test_yhat_f']), y=np.asarray(task.test_y))
+
+
+def table_row(data_config: Mapping, task_config: Mapping, stacked: dict) -> dict:
+    row = dict(data_seed=data_config['data_seed'], P=data_config['P'],
+               alpha=task_config['model_params']['alpha'], N=task_config['model_params']['N'],
+               eta_0=task_config['training_params']['eta_0'])
+    row.update(task_metrics(**stacked))
+    return row
+
+
+def to_table(rows: Iterable[dict]) -> dict[str, np.ndarray]:
+    """Collects rows into columns, sorted by `TABLE_KEYS`."""
+    rows = list(rows)
+    table = {name: np.array([row[name] for row in rows]) for name in (*TABLE_KEYS, *METRICS)}
+    if rows:
+        order = np.lexsort([table[k] for k in reversed(TABLE_KEYS)])
+        table = {name: column[order] for name, column in table.items()}
+    return table
+
+
+def results_folder_rows(folder: str) -> list[dict]:
+    """One row per task folder in the results folder `folder`; tasks without finished trials are
+    skipped. Task folders may hold a result store, packed or not, or legacy per-trial pickles."""
+    data_config = OmegaConf.load(join(folder, 'data_config.yaml'))
+    rows = []
+    for name in task_folders(folder):
+        task_folder = join(folder, name)
+        task_config = OmegaConf.create(read_file(task_folder, 'task_config.yaml').decode())
+        stacked = stack_folder(task_folder)
+        if stacked is not None:
+            rows.append(table_row(data_config, task_config, stacked))
+    return rows
+
+
+def stack_folder(task_folder: str) -> Optional[dict]:
+    """Stacks the trials of the task folder `task_folder`, or returns None if it has none."""
+    if is_store(task_folder):
+        stacked = stack_store(task_folder)
+        return stacked if len(stacked['test_loss_f']) else None
+    # legacy pickles; only the fields needed here are kept
+    loaded = legacy.load_task(task_folder, ('test_loss_f', 'train_losses', 'test_yhat_f', 'test_y'))
+    if loaded is None:
+        return None
+    return dict(test_loss_f=np.asarray(loaded['test_loss_f'], dtype=float),
+                final_train_loss=np.asarray(loaded['train_losses'][:, -1], dtype=float),
+                yhat=loaded['test_yhat_f'], y=loaded['test_y'])
+
+
+def aggregate(folders: Sequence[str]) -> dict[str, np.ndarray]:
+    """The tidy table of every task in the results folders `folders`."""
+    return to_table(row for folder in folders if exists(join(folder, 'data_config.yaml'))
+                    for row in results_folder_rows(folder))
+
+
+def aggregate_results_list(results_list: Sequence[Mapping]) -> dict[str, np.ndarray]:
+    """The tidy table of results loaded by `read_result.see_lr_deviations`."""
+    rows = []
+    for res in results_list:
+        for name, value in res.items():
+            if name.startswith('task-') and len(value[1]):
+                task_config, trials = value
+                rows.append(table_row(res['data_config'], task_config, stack_trials(trials)))
+    return to_table(rows)
@@ -0,0 +1,82 @@
+"""Test loss and accuracy of ensembles of k = 1..T trials, with bootstrap confidence intervals.
+
+Each bootstrap sample draws T trials with replacement. The ensemble of its first k draws is the
+cumulative sum of their predictions divided by k, so one cumulative sum gives the ensembles of
+every size for a whole batch of samples. Trials whose final test loss is NaN are left out.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from os.path import join, exists
+from typing import Optional, Sequence
+
+import numpy as np
+from omegaconf import OmegaConf
+
+from src.analysis.aggregate import stack_folder, TABLE_KEYS
+from src.run.result_store import task_folders, read_file
+
+MAX_CHUNK_BYTES = 2 ** 28 # memory for the resampled predictions of one batch of samples
+
+
+def ensemble_curves(yhat: np.ndarray, y: np.ndarray, test_loss_f: Optional[np.ndarray] = None,
+                    num_samples: int = 200, confidence: float = 0.95, seed=0) -> dict:
+    """Returns, for k = 1..T, the bootstrap mean and confidence interval of the test MSE and
+    accuracy of ensembles of k trials. `yhat` holds the predictions of T trials (T, n, ...) and
+    `y` the test labels (n, ...). The intervals have shape (2, T)."""
+    yhat = np.asarray(yhat, dtype=np.float64)
+    if test_loss_f is not None:
+        yhat = yhat[~np.isnan(test_loss_f)]
+    num_trials = len(yhat)
+    y = np.asarray(y, dtype=np.float64).reshape(-1)
+    yhat = yhat.reshape(num_trials, -1)
+
+    rng = np.random.default_rng(seed)
+    losses = np.empty((num_samples, num_trials))
+    accuracies = np.empty((num_samples, num_trials))
+    k = np.arange(1, num_trials + 1)[None, :, None]
+
+    chunk = max(1, MAX_CHUNK_BYTES // max(1, yhat.nbytes))
+    for start in range(0, num_samples, chunk):
+        stop = min(start + chunk, num_samples)
+        draws = rng.integers(0, num_trials, (stop - start, num_trials))
+        sums = np.cumsum(yhat[draws], axis=1) # (samples, k, n)
+        losses[start:stop] = np.mean((sums / k - y) ** 2, axis=-1)
+        accuracies[start:stop] = np.mean(sums * y > 0, axis=-1)
+
+    tails = 100 * np.array([(1 - confidence) / 2, (1 + confidence) / 2])
+    return dict(k=k.reshape(-1),
+                loss=losses.mean(axis=0), loss_ci=np.percentile(losses, tails, axis=0),
+                accuracy=accuracies.mean(axis=0), accuracy_ci=np.percentile(accuracies, tails, axis=0))
+
+
+def _task_curves(args) -> Optional[dict]:
+    task_folder, data_config, num_samples, confidence, seed = args
+    stacked = stack_folder(task_folder)
+    if stacked is None or np.all(np.isnan(stacked['test_loss_f'])):
+        return None
+    task_config = OmegaConf.create(read_file(task_folder, 'task_config.yaml').decode())
+    row = dict(data_seed=data_config['data_seed'], P=data_config['P'],
+               alpha=task_config['model_params']['alpha'], N=task_config['model_params']['N'],
+               eta_0=task_config['training_params']['eta_0'], folder=task_folder)
+    row.update(ensemble_curves(stacked['yhat'], stacked['y'], stacked['test_loss_f'],
+                               num_samples, confidence, seed))
+    return row
+
+
+def sweep_curves(folders: Sequence[str], num_samples: int = 200, confidence: float = 0.95,
+                 seed: int = 0, processes: Optional[int] = None) -> list[dict]:
+    """Ensemble curves of every task in the results folders `folders`, computed on a pool of
+    `processes` processes. Returns one dict per task with its `TABLE_KEYS`, sorted by them. Each
+    task gets its own random stream, so results do not depend on the number of processes."""
+    jobs = [] # (task folder, data config)
+    for folder in folders:
+        if not exists(join(folder, 'data_config.yaml')):
+            continue
+        data_config = dict(OmegaConf.load(join(folder, 'data_config.yaml')))
+        jobs += [(join(folder, name), data_config) for name in task_folders(folder)]
+    seeds = np.random.SeedSequence(seed).spawn(len(jobs))
+    args = [(task_folder, data_config, num_samples, confidence, s)
+            for (task_folder, data_config), s in zip(jobs, seeds)]
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        rows = [row for row in executor.map(_task_curves, args) if row is not None]
+    return sorted(rows, key=lambda row: tuple(row[k] for k in TABLE_KEYS))
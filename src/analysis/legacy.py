@@ -0,0 +1,116 @@
+"""Loader for legacy result archives, which hold one pickled `Result` per trial in
+`results-*/task-*/trial_{i}_result.pkl`.
+
+Task folders are loaded on a process pool. Only the requested fields of each trial are kept, so
+`params_f` is dropped as soon as a trial is unpickled. Archives can also be converted into result
+stores (see `src.run.result_store`) in one pass.
+"""
+import pickle
+import re
+
+from concurrent.futures import ProcessPoolExecutor
+from os import listdir
+from os.path import join, isdir, exists
+from typing import Optional, Sequence
+
+import numpy as np
+from omegaconf import OmegaConf
+
+from src.run.result_store import TaskStoreWriter, SHARED_FIELDS
+
+TRIAL_FNAME = re.compile(r'trial_(\d+)_result\.pkl$')
+DEFAULT_FIELDS = ('test_loss_f', 'train_losses', 'test_yhat_f', 'test_y')
+
+
+def trial_files(task_folder: str) -> dict[int, str]:
+    """Maps trial indices to the result files in `task_folder`."""
+    files = {}
+    for name in listdir(task_folder):
+        if (m := TRIAL_FNAME.match(name)) is not None:
+            files[int(m.group(1))] = join(task_folder, name)
+    return dict(sorted(files.items()))
+
+
+def load_trial(path: str, fields: Sequence[str]) -> dict:
+    """Returns the requested fields of the result in `path` as numpy arrays."""
+    with open(path, 'rb') as f:
+        result = pickle.load(f)
+    return {name: np.asarray(getattr(result, name)) for name in fields
+            if getattr(result, name, None) is not None}
+
+
+def load_task(task_folder: str, fields: Sequence[str] = DEFAULT_FIELDS) -> Optional[dict]:
+    """Loads the requested fields of every trial in `task_folder`, stacked along a trial axis.
+    Fields shared by the trials, like `test_y`, are kept once. Returns None without trials."""
+    files = trial_files(task_folder)
+    if not files:
+        return None
+    trials = [load_trial(path, fields) for path in files.values()]
+    stacked = dict(trials=np.array(list(files)))
+    for name in fields:
+        values = [t[name] for t in trials if name in t]
+        if not values:
+            continue
+        stacked[name] = values[0] if name in SHARED_FIELDS else np.stack(values)
+    return stacked
+
+
+def _load_task_job(args) -> Optional[dict]:
+    results_folder, task_name, data_config, fields = args
+    task_folder = join(results_folder, task_name)
+    stacked = load_task(task_folder, fields)
+    if stacked is None:
+        return None
+    return dict(results_folder=results_folder, task=task_name, data_config=data_config,
+                task_config=OmegaConf.to_container(OmegaConf.load(join(task_folder, 'task_config.yaml'))),
+                fields=stacked)
+
+
+def _task_jobs(results_folders: Sequence[str], *extra) -> list[tuple]:
+    jobs = []
+    for folder in results_folders:
+        if not exists(join(folder, 'data_config.yaml')):
+            continue
+        data_config = OmegaConf.to_container(OmegaConf.load(join(folder, 'data_config.yaml')))
+        jobs += [(folder, name, data_config, *extra) for name in sorted(listdir(folder))
+                    if name.startswith('task-') and isdir(join(folder, name))]
+    return jobs
+
+
+def load_archives(results_folders: Sequence[str], fields: Sequence[str] = DEFAULT_FIELDS,
+                  processes: Optional[int] = None) -> list[dict]:
+    """Loads the requested fields of every task in `results_folders` on a pool of `processes`
+    processes. Returns one dict per task with its results folder, task folder name, data and
+    task configs, and the stacked fields."""
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        tasks = executor.map(_load_task_job, _task_jobs(results_folders, tuple(fields)))
+        return [task for task in tasks if task is not None]
+
+
+def convert_task(task_folder: str, save_params: bool = False) -> int:
+    """Writes the trials of a legacy task folder into a result store in the same folder, one
+    trial at a time. Returns the number of trials converted."""
+    files = trial_files(task_folder)
+    if not files:
+        return 0
+    writer = TaskStoreWriter(task_folder, max(files) + 1, save_params)
+    for trial, path in files.items():
+        if writer.is_done(trial):
+            continue
+        with open(path, 'rb') as f:
+            result = pickle.load(f)
+        writer.write(trial, result)
+    return len(files)
+
+
+def _convert_task_job(args) -> int:
+    results_folder, task_name, _, save_params = args
+    return convert_task(join(results_folder, task_name), save_params)
+
+
+def convert_archives(results_folders: Sequence[str], save_params: bool = False,
+                     processes: Optional[int] = None) -> int:
+    """Converts every task in `results_folders` into a result store, on a process pool. The pickles
+    are kept; readers prefer the store. Returns the number of trials converted."""
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return sum(executor.map(_convert_task_job, _task_jobs(results_folders, save_params)))
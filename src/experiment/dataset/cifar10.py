@@ -1,25 +1,93 @@
 # _CIFAR_10_LINK = 'https://www.cs.toronto.edu/~kriz/cifar-10-python.tar.gz'
 
-from logging import warning
+import os
+import pickle
+
+from concurrent.futures import ThreadPoolExecutor
+from logging import warning, info
+from os.path import join, exists
 from typing import Mapping
 
-from torchvision.datasets import CIFAR10
+import numpy as np
 
-import jax.numpy as jnp
 import jax.random as jr
 
 from jax.numpy import float32, array
 
+# layout of the python version of CIFAR-10, as downloaded by `scripts/download_cifar.py`
+BATCHES_FOLDER = 'cifar-10-batches-py'
+TRAIN_BATCHES = tuple(f'data_batch_{i}' for i in range(1, 6))
+TEST_BATCHES = ('test_batch',)
+IMAGE_SHAPE = (32, 32, 3)
+NUM_TRAIN, NUM_TEST = 50000, 10000
+
+# all images, then all labels, as raw uint8: train images, test images, train labels, test labels
+FLAT_FNAME = 'cifar-10.bin'
+
+
+def _read_batch(path: str) -> tuple[np.ndarray, np.ndarray]:
+    with open(path, 'rb') as f:
+        batch = pickle.load(f, encoding='bytes')
+    # rows hold the red, green and blue planes of an image in turn
+    images = np.asarray(batch[b'data'], dtype=np.uint8).reshape(-1, 3, 32, 32).transpose(0, 2, 3, 1)
+    return images, np.asarray(batch[b'labels'], dtype=np.uint8)
+
+
+def read_batches(data_dir: str, num_workers: int = 6) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+    """Decodes the pickled CIFAR-10 batches in `data_dir` in parallel. Returns uint8 images (N, 32, 
+    32, 3) and labels (N,) per split."""
+    folder = join(data_dir, BATCHES_FOLDER)
+    paths = [join(folder, name) for name in TRAIN_BATCHES + TEST_BATCHES]
+    with ThreadPoolExecutor(num_workers) as executor:
+        batches = list(executor.map(_read_batch, paths))
+    splits = dict(train=batches[:len(TRAIN_BATCHES)], test=batches[len(TRAIN_BATCHES):])
+    return {split: tuple(np.concatenate(arrays) for arrays in zip(*parts))
+            for split, parts in splits.items()}
+
+
+def write_flat(data_dir: str) -> str:
+    """Converts the batches in `data_dir` into one flat binary file, which `read_cifar10` then 
+    memory-maps. Returns its path."""
+    data = read_batches(data_dir)
+    path = join(data_dir, FLAT_FNAME)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        for array in (data['train'][0], data['test'][0], data['train'][1], data['test'][1]):
+            f.write(np.ascontiguousarray(array).tobytes())
+    os.replace(tmp, path)
+    return path
+
+
+def read_flat(path: str) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+    """Memory-maps the flat binary file written by `write_flat`."""
+    image_size = int(np.prod(IMAGE_SHAPE))
+    flat = np.memmap(path, dtype=np.uint8, mode='r')
+    if flat.size != (NUM_TRAIN + NUM_TEST) * (image_size + 1):
+        raise ValueError(f'{path} is not a flat CIFAR-10 file.')
+    images = flat[:(NUM_TRAIN + NUM_TEST) * image_size].reshape(-1, *IMAGE_SHAPE)
+    labels = flat[(NUM_TRAIN + NUM_TEST) * image_size:]
+    return dict(train=(images[:NUM_TRAIN], labels[:NUM_TRAIN]), 
+                test=(images[NUM_TRAIN:], labels[NUM_TRAIN:]))
+
+
+def read_cifar10(data_dir: str) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+    """uint8 images and labels of CIFAR-10 per split, memory-mapped from the flat binary file in 
+    `data_dir` if there is one, else decoded from the pickled batches."""
+    if exists(join(data_dir, FLAT_FNAME)):
+        info(f'Reading CIFAR-10 from {FLAT_FNAME}.')
+        return read_flat(join(data_dir, FLAT_FNAME))
+    return read_batches(data_dir)
+
 
 def load_cifar_data(data_dir:str, data_params: Mapping) -> dict[str, tuple]:
-    training_data = CIFAR10(data_dir, train=True, download=False)
-    test_data = CIFAR10(data_dir, train=False, download=False)
+    data = read_cifar10(data_dir)
+    (X0, y), (X_test0, y_test) = data['train'], data['test']
 
-    X0 = training_data.data.astype(float32)
-    y = array(training_data.targets, dtype=float32)
+    X0 = X0.astype(float32)
+    y = array(y, dtype=float32)
 
-    X_test0 = test_data.data.astype(float32)
-    y_test = array(test_data.targets, dtype=float32)
+    X_test0 = X_test0.astype(float32)
+    y_test = array(y_test, dtype=float32)
 
     # rs, ds, P = data_params['random_subset'], data_params['data_seed'], data_params['P']
     # (X0, y) = take_subset((X0, y), rs, ds, P)
@@ -41,23 +109,21 @@ def take_01_subset(X, y):
 
 
 def take_subset(data: tuple, random_subset: bool, data_seed, P: int):
+    """Selects P training points on the host. Random subsets draw indices with 
+    `jax.random.choice`, so a data seed always selects the same points."""
     X, y = data
     examples = X.shape[0]
     
     if P > examples:
         warning('Dataset size (P) exceeds training dataset size.')
-        r, s= divmod(P, examples)
-        temp_X, temp_y = jnp.repeat(X, r), jnp.repeat(y, r)
-        X_sub, y_sub = jnp.stack([temp_X, X[:s]]), jnp.stack([temp_y, y[0:s]])
+        r, s = divmod(P, examples)
+        inds = np.concatenate([np.tile(np.arange(examples), r), np.arange(s)])
     elif P == examples:
-        X_sub, y_sub = X, y
+        return X, y
+    elif random_subset:
+        key = jr.PRNGKey(data_seed)
+        inds = np.asarray(jr.choice(key, examples, shape=(P,)))
     else:
-        inds = None
-        if random_subset:
-            key = jr.PRNGKey(data_seed)
-            inds = jr.choice(key, examples, shape=(P,))
-        else:
-            inds = jnp.arange(P)
-        X_sub, y_sub = X[inds], y[inds]
+        inds = np.arange(P)
     
-    return X_sub, y_sub
+    return X[inds], y[inds]
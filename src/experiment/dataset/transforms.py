@@ -0,0 +1,92 @@
+"""Host-side preprocessing of image datasets, configured by `DataParams.transforms`.
+
+The transforms run as vectorized numpy on the host, in a fixed order:
+1. keep the images of `classes`
+2. map labels to 1 for `positive_classes` and -1 otherwise
+3. take the training subset
+4. convert to grayscale in [0, 1]
+5. center with the mean training image
+6. scale so that training images have unit mean norm ('sphere scaling')
+Statistics are computed from the training subset in float64 and applied to both splits. The
+result is float32, ready for a single transfer to each device.
+
+With `device_dtype` 'uint8', the images are left as uint8 and the last two steps are not applied.
+The mean image and scale are returned as the 'norm' entry instead, and the trainers normalize
+each batch on device (see `momentum.prepare`). This keeps a quarter of the memory on device.
+"""
+from typing import Callable, Mapping, Optional
+
+import numpy as np
+
+# the four-class split: airplane, automobile, ship and truck against cat, deer, dog and horse
+DEFAULT_TRANSFORMS = dict(classes=[0, 1, 3, 4, 5, 7, 8, 9], positive_classes=[0, 1, 8, 9],
+                          grayscale=False, center=True, sphere_scale=True)
+DEVICE_DTYPES = ('float32', 'uint8')
+GRAY_WEIGHTS = np.array([0.2989, 0.5870, 0.1140])
+CHUNK = 4096 # images per step of the norm computation
+
+
+def transforms_for(data_params: Mapping) -> dict:
+    """The transforms of `data_params`, with defaults for the entries it lacks."""
+    transforms = {**DEFAULT_TRANSFORMS, **dict(data_params.get('transforms') or {})}
+    for name in ('classes', 'positive_classes'):
+        transforms[name] = list(transforms[name])
+    return transforms
+
+
+def filter_classes(X: np.ndarray, y: np.ndarray, classes) -> tuple[np.ndarray, np.ndarray]:
+    keep = np.isin(y.reshape(-1), classes)
+    return X[keep], y[keep]
+
+
+def map_labels(y: np.ndarray, positive_classes) -> np.ndarray:
+    return np.where(np.isin(y, positive_classes), 1.0, -1.0).astype(np.float32)
+
+
+def to_grayscale(X: np.ndarray) -> np.ndarray:
+    return (X @ GRAY_WEIGHTS / 255.0)[..., None]
+
+
+def normalization(X: np.ndarray, center: bool, sphere_scale: bool) -> tuple[np.ndarray, float]:
+    """The mean image and scale of the training images `X`; images are normalized as
+    (X - mean) / scale."""
+    mean = X.mean(axis=0, dtype=np.float64) if center else np.zeros(X.shape[1:])
+    scale = 1.0
+    if sphere_scale:
+        # in chunks, so the centered images are never all in memory in float64
+        norms = [np.linalg.norm((X[i:i + CHUNK] - mean).reshape(len(X[i:i + CHUNK]), -1), axis=1)
+                    for i in range(0, len(X), CHUNK)]
+        scale = float(np.mean(np.concatenate(norms)))
+    return mean, scale
+
+
+def normalize(X: np.ndarray, mean: np.ndarray, scale: float) -> np.ndarray:
+    X = X.astype(np.float32)
+    X -= mean.astype(np.float32)
+    X /= np.float32(scale)
+    return X
+
+
+def apply_transforms(data: Mapping, transforms: Mapping, take_subset: Optional[Callable] = None, 
+                     device_dtype: str = 'float32') -> dict[str, tuple[np.ndarray, np.ndarray]]:
+    """Applies `transforms` to `data`, a mapping from 'train' and 'test' to (images, labels).
+    `take_subset` maps the training (images, labels) to the subset to train on."""
+    if device_dtype not in DEVICE_DTYPES:
+        raise ValueError(f'Unknown device dtype {device_dtype}; expected one of {DEVICE_DTYPES}.')
+    if device_dtype == 'uint8' and transforms['grayscale']:
+        raise ValueError('Grayscale images are not uint8; use the float32 device dtype.')
+    splits = {}
+    for split, (X, y) in data.items():
+        y = np.asarray(y).reshape(-1, 1)
+        if transforms['classes']:
+            X, y = filter_classes(X, y, transforms['classes'])
+        y = map_labels(y, transforms['positive_classes']) if transforms['positive_classes'] else y.astype(np.float32)
+        if split == 'train' and take_subset is not None:
+            X, y = take_subset((X, y))
+        splits[split] = (to_grayscale(X) if transforms['grayscale'] else np.asarray(X), y)
+
+    mean, scale = normalization(splits['train'][0], transforms['center'], transforms['sphere_scale'])
+    if device_dtype == 'uint8':
+        splits = {split: (np.ascontiguousarray(X, dtype=np.uint8), y) for split, (X, y) in splits.items()}
+        return dict(**splits, norm=(mean.astype(np.float32), np.float32(scale)))
+    return {split: (normalize(X, mean, scale), y) for split, (X, y) in splits.items()}
@@ -1,4 +1,5 @@
 import chex
+from jax.tree_util import tree_map
 
 @chex.dataclass
 class Result: 
@@ -9,4 +10,22 @@ class Result:
     test_loss_f: chex.Scalar
     test_yhat_f: chex.ArrayTree
     test_y: chex.ArrayTree
+    # full-pass training losses at training_params.train_loss_milestones, when train_losses holds 
+    # the mean minibatch losses
+    milestone_train_losses: chex.ArrayTree = None
+    eval_epochs: chex.ArrayTree = None # epochs of train_losses and test_losses
+
+
+def unbatch(result: Result) -> list[Result]:
+    """Splits a result batched over (device, replica) into one result per trial, in device-major 
+    order. In a batched result, `test_y` only has the device axis, since the replicas on a device 
+    share it, and `eval_epochs` is shared by all trials."""
+    num_devices, num_replicas = result.test_loss_f.shape[:2]
+    per_replica = result.replace(test_y=None, eval_epochs=None)
+    results = []
+    for d in range(num_devices):
+        for r in range(num_replicas):
+            trial = tree_map(lambda z: z[d, r], per_replica)
+            results.append(trial.replace(test_y=result.test_y[d], eval_epochs=result.eval_epochs))
+    return results
     # num_epochs: chex.ArrayTree
\ No newline at end of file
@@ -89,12 +89,12 @@ def train(apply_fn: Callable, params0: chex.ArrayTree,
         loss_grad_fn = value_and_grad(loss_fn, argnums=0)
         # -----------------------------------------------------------
 
-        def step(step_state: DistributedStepState, data: tuple) -> DistributedStepState:
+        def step(step_state: DistributedStepState, idx: chex.Array) -> DistributedStepState:
             """Takes an SGD step."""
         # unpack
             params = step_state.params
             opt_state = step_state.opt_state
-            batch, labels = data
+            batch, labels = Xtr[idx], ytr[idx]
 
             # update params
             # param_shape = tree_map(lambda z: z.shape, params)
@@ -108,15 +108,12 @@ def train(apply_fn: Callable, params0: chex.ArrayTree,
             return DistributedStepState(params=updated_params, opt_state=opt_state), None
     
 
-        # shuffle
-        Xtr_shuffled, ytr_shuffled = permutation(key, Xtr), permutation(key, ytr)
-        
-        # batch training data
-        Xtr_sb = Xtr_shuffled.reshape((num_batches, batch_size, *Xtr_shuffled.shape[1:]))
-        ytr_sb = ytr_shuffled.reshape((num_batches, batch_size, *ytr_shuffled.shape[1:]))
+        # shuffle: one permutation of the indices per epoch; each step gathers its minibatch, so
+        # no shuffled copy of the training data is made
+        batch_indices = permutation(key, Xtr.shape[0]).reshape((num_batches, batch_size))
 
         # SGD steps over batches in epoch
-        model_state_e, _ = scan(step, state.model_state, (Xtr_sb, ytr_sb))
+        model_state_e, _ = scan(step, state.model_state, batch_indices)
 
         return DistributedEpochState(key=other, p0=state.p0, model_state=model_state_e)
     
@@ -0,0 +1,46 @@
+from typing import Mapping, Optional
+
+import numpy as np
+import chex
+
+from jax.random import PRNGKey, choice
+
+# kinds of `EvalSchedule`
+EVERY, LOG, COUNT = 'every', 'log', 'count'
+
+
+def eval_epochs(epochs: int, schedule: Optional[Mapping] = None, every: int = 5) -> np.ndarray:
+    """Returns the sorted epochs at which the losses are evaluated, given an `EvalSchedule`:
+    every `every` epochs, `num_points` log-spaced epochs, or `num_points` evenly spaced epochs. The
+    first and last epochs are always part of the log-spaced and evenly spaced schedules."""
+    schedule = schedule or {}
+    kind = schedule.get('kind', EVERY)
+    every = schedule.get('every', every)
+    num_points = schedule.get('num_points', 0)
+
+    if kind == EVERY:
+        if every < 1:
+            raise ValueError(f'Cannot evaluate every {every} epochs.')
+        return np.arange(0, epochs, every)
+    if num_points < 1:
+        raise ValueError(f'An eval schedule of kind "{kind}" needs num_points >= 1.')
+    if kind == LOG:
+        # epoch e is placed at e + 1, so that the first epoch is at 1 on a log axis
+        points = np.geomspace(1, epochs, num_points) - 1
+    elif kind == COUNT:
+        points = np.linspace(0, epochs - 1, num_points)
+    else:
+        raise ValueError(f'Unknown eval schedule kind "{kind}".')
+    return np.unique(np.concatenate([[0, epochs - 1], np.round(points).astype(int)]))
+
+
+def eval_subset(num_points: int, schedule: Optional[Mapping] = None) -> Optional[chex.Array]:
+    """Returns the indices of the fixed random subset of the test data that the test losses are
+    evaluated on during training, or None to use all of it. The final test loss always uses all
+    of the test data."""
+    schedule = schedule or {}
+    subset_size = schedule.get('subset_size', 0)
+    if not subset_size or subset_size >= num_points:
+        return None
+    key = PRNGKey(schedule.get('subset_seed', 0))
+    return np.sort(np.asarray(choice(key, num_points, (subset_size,), replace=False)))
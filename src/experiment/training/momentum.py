@@ -1,21 +1,26 @@
-from functools import partial
-from typing import Callable
+from functools import partial, lru_cache
+from typing import Callable, NamedTuple
 from logging import info
 
 import chex
 import jax.numpy as jnp
+import numpy as np
 import math
 import optax
 
 import flax.linen as nn
+from flax.core.frozen_dict import unfreeze
 
 from jax import jit, vmap, pmap, tree_map, value_and_grad
 from jax import device_put_replicated, device_put_sharded, device_get
-from jax.lax import scan, map as lax_map
+from jax.lax import scan, cond, map as lax_map
 
 from jax.random import permutation, split
 from jaxlib.xla_extension import Device
 from src.experiment.training.Result import Result
+from src.experiment.training.eval_schedule import eval_epochs as get_eval_epochs, eval_subset
+from src.run import checkpoint as checkpoints
+from src.run.checkpoint import Checkpointer, Preempted
 from src.experiment.training.root_schedule import blocked_polynomial_schedule
 
 # from src.experiment.model.resnet import NTK_ResNet18
@@ -29,147 +34,359 @@ def mse(y, yhat):
     return jnp.mean((y - yhat) ** 2)
 
 
-def initialize(keys: chex.PRNGKey, model, devices: list[Device]) -> chex.ArrayTree:
-    assert len(keys) == len(devices)
+def prepare(X: chex.Array, norm) -> chex.Array:
+    """Returns the images `X` as the model sees them. With `norm`, a (mean image, scale) pair, `X` 
+    holds uint8 images, normalized here as (X - mean) / scale so that XLA fuses the conversion 
+    into the consumer; see `DataParams.device_dtype`. Without, `X` is already normalized."""
+    if norm is None:
+        return X
+    mean, scale = norm
+    return (X.astype(jnp.float32) - mean) / scale
 
-    CIFAR_SHAPE = (32, 32, 3)
-    # GRAY_CIFAR_SHAPE = (32, 32, 1) # change if going back to rgb
-    dummy_input = jnp.zeros((1,) + CIFAR_SHAPE) # added batch index
-    replicated_dummy = device_put_replicated(dummy_input, devices)
+
+def pmap_replicas(f: Callable, devices: list[Device], in_axes=0) -> Callable:
+    """pmaps `f` over `devices` and vmaps it over the replicas held on each device. Arguments 
+    with an `in_axes` entry of `None` are shared by all replicas on a device."""
+    return pmap(vmap(f, in_axes=in_axes), devices=devices)
+
+
+# scalars that may differ between the trials trained by one call to `apply`
+BATCHED_HYPERPARAMS = (('model_params', 'alpha'), ('training_params', 'eta_0'))
+# hyperparameters that determine the shapes of the compiled programs; see `get_trainer`
+SHAPE_HYPERPARAMS = (('model_params', 'N'), ('training_params', 'batch_size'))
+
+EVAL_EVERY = 5 # default epochs between evaluations of the train and test loss; see `EvalSchedule`
+# entries of a chunk schedule; see `chunk_schedules`
+SKIP_EPOCH, NO_EVAL = -2, -1
+
+
+# distributed pytrees
+@chex.dataclass
+class DistributedStepState:
+    params: chex.ArrayTree
+    opt_state: chex.ArrayTree
+
+@chex.dataclass
+class DistributedEpochState:
+    key: chex.PRNGKey
+    p0: chex.ArrayTree # params at time 0
+    f0_train: chex.Array # outputs at p0 on the training data
+    f0_test: chex.Array # outputs at p0 on the test data
+    alpha: chex.Scalar
+    model_state: DistributedStepState
+
+
+def build_model(N: int) -> nn.Module:
+    # MODELS --------------------------------------------------------
+    hidden_sizes = (N, 2 * N, 4 * N, 8 * N)
+    # hidden_sizes = (N, 2 * N)
+    # model = NTK_ResNet18(hidden_sizes=hidden_sizes, stage_sizes=(2, 2), n_classes=1)
+    
+    # model = MiniResNet18(num_classes=1, num_filters=N)
+    
+    # model = VGG_12(N)
+    model = WideResnet(1, N // 16, 1, conv_init=nn.initializers.normal(math.sqrt(2.0)))
+
+    # model = MyrtleNetwork(N, depth=5)
+
+    # model = ResNet18(n_classes=1)
+    # ---------------------------------------------------------------
+    return model
+
+
+def zero_grads():
+    def init_fn(_): 
+        return ()
+    def update_fn(updates, state, params=None):
+        return tree_map(jnp.zeros_like, updates), ()
+    return optax.GradientTransformation(init_fn, update_fn)
+
+
+def make_optimizer(eta_0: chex.Scalar) -> optax.GradientTransformation:
+    """Adam on the params and no updates to the scaler. The learning rate is stored in the 
+    optimizer state, so `eta_0` may be traced."""
+    # weight_decay = training_params['weight_decay'] * batch_size
+    # momentum = training_params['momentum']
+    
+    # POWER = -0.5
+    # LR_DROP_STAGE_SIZE = 512
     
-    def get_params(key, dummy):
-        w_frozen = model.init(key, dummy)
-        return w_frozen.unfreeze()
-
-    return pmap(get_params)(keys, replicated_dummy)
-
-
-def train(devices, apply_fn: Callable, params0: chex.ArrayTree, 
-        optimizer: optax.GradientTransformation, Xtr, ytr, X_val, y_val, X_test, y_test, keys: chex.PRNGKey, 
-        alpha: chex.Scalar, epochs: int = 80, batch_size: int = 128) -> tuple[chex.ArrayTree, list[chex.ArraySharded]]:
-    P = Xtr.shape[1]
-    num_batches = P // batch_size # 0 is sharding dimension
-
-    # ----------------------------------------------------------------------
-    # @chex.dataclass
-    # class StepState:
-    #     loss: chex.Scalar
-    #     params: chex.ArrayTree
-    #     opt_state: optax.OptState
-
-    # @chex.dataclass
-    # class EpochState:
-    #     key: PRNGKey
-    #     model_state: StepState
+    # block_steps = LR_DROP_STAGE_SIZE // batch_size
+    # lr_schedule = blocked_polynomial_schedule(eta_0, POWER, block_steps=block_steps)
+    # optimizer = optax.sgd(lr_schedule, momentum)
+    adam = optax.inject_hyperparams(optax.adam)(learning_rate=eta_0)
+    # sgd_fixed_eta = optax.sgd(eta_0, momentum)
+    return optax.multi_transform({'adam': adam, 'zero': zero_grads()},
+                                    {'params': 'adam', 'scaler': 'zero'})
+    # optimizer = optax.adamw(eta_0, weight_decay=weight_decay)
+
+
+def loss_and_yhat(apply_fn, alpha, params, f0, X, y, norm=None):
+    """Returns test loss and the predictions yhat. `f0` holds the outputs at the initial params; 
+    `norm` normalizes uint8 images (see `prepare`)."""
+    # vapply_fn = vmap(apply_fn)
+    # vloss = vmap(loss)
+    BATCH_SIZE = min(6400, X.shape[0])
+
+    X_batched = X.reshape((-1, BATCH_SIZE, *X.shape[1:]))
+    y_batched = y.reshape((-1, BATCH_SIZE, *y.shape[1:]))
+    f0_batched = f0.reshape((-1, BATCH_SIZE, *f0.shape[1:]))
     
-    # distributed pytrees
-    @chex.dataclass
-    class DistributedStepState:
-        params: chex.ArrayTree
-        opt_state: chex.ArrayTree
-
-    @chex.dataclass
-    class DistributedEpochState:
-        key: chex.PRNGKey
-        p0: chex.ArrayTree # params at time 0
-        model_state: DistributedStepState
+    def ly(a, b, c):
+        bhat = alpha * (apply_fn(params, prepare(a, norm)) - c)
+        return mse(b, bhat), bhat
+
+    vmap_ly = vmap(ly)
     
+    batch_losses, batch_yhats = vmap_ly(X_batched, y_batched, f0_batched)
+    return jnp.mean(batch_losses), batch_yhats.reshape((-1, *y.shape[1:]))
+
+
+class Trainer(NamedTuple):
+    """pmapped functions that initialize, train and evaluate replicas of one model. Arguments 
+    carry a (device, replica) prefix, except for data, which is shared by the replicas on a device. 
+    `norm` holds the normalization constants of uint8 images, or None; see `prepare`."""
+    devices: tuple # the devices the functions are pmapped over
+    initialize: Callable # keys -> params
+    init_opt_state: Callable # (params, eta_0) -> opt_state
+    initial_outputs: Callable # (params, Xtr, X_test, norm) -> (f0_train, f0_test)
+    test_outputs: Callable # (params, X_test, norm) -> outputs
+    update: Callable # (state, Xtr, ytr, norm) -> (state after one epoch, mean minibatch loss)
+    compute_train_loss: Callable # (state, Xtr, ytr, norm) -> loss
+    compute_test_loss: Callable # (state, X_test, y_test, norm) -> loss
+    train_chunk: Callable # (state, Xtr, ytr, X_test, y_test, norm, schedule, train_schedule) -> (state, minibatch losses, test losses, train losses)
+    loss_and_yhat: Callable # (alpha, params, f0_test, X_test, y_test, norm) -> (loss, yhat)
+
+
+@lru_cache(maxsize=None)
+def get_trainer(N: int, devices: tuple[Device], P: int, batch_size: int) -> Trainer:
+    """Returns the trainer for a model of width `N` on `devices`, with `P` training points split 
+    into batches of `batch_size`. Trainers are cached: the hyperparameters in `BATCHED_HYPERPARAMS` 
+    are inputs to the compiled programs, so one compilation serves every task with the same 
+    shapes."""
+    info(f'Building trainer for N={N} on {len(devices)} device(s) with P={P}, batch size {batch_size}.')
+    model = build_model(N)
+    apply_fn = model.apply
+    num_batches = P // batch_size
+    # the learning rate is read from the optimizer state, so each replica can use its own
+    optimizer = make_optimizer(0.0)
 
-    def compute_loss(state: DistributedEpochState, Xtr: chex.ArrayDevice, ytr: chex.ArrayDevice, batch_size):
-        """Computes the loss of the model at state `state` with data `(Xtr, ytr)`."""
-        p0 = state.p0
+    CIFAR_SHAPE = (32, 32, 3)
+    # GRAY_CIFAR_SHAPE = (32, 32, 1) # change if going back to rgb
+    def get_params(key):
+        dummy_input = jnp.zeros((1,) + CIFAR_SHAPE) # added batch index
+        w_frozen = model.init(key, dummy_input)
+        return unfreeze(w_frozen) # newer flax returns a plain dict
+
+    def outputs(params: chex.ArrayTree, X: chex.ArrayDevice, norm, batch_size) -> chex.Array:
+        """Computes the outputs of the model with params `params` on `X`, in batches."""
+        X_batched = X.reshape((-1, batch_size, *X.shape[1:]))
+        f_batched = lax_map(lambda Xin: apply_fn(params, prepare(Xin, norm)), X_batched)
+        return f_batched.reshape((-1, *f_batched.shape[2:]))
+
+    def compute_loss(state: DistributedEpochState, Xtr: chex.ArrayDevice, ytr: chex.ArrayDevice, 
+                    norm, f0: chex.Array, batch_size):
+        """Computes the loss of the model at state `state` with data `(Xtr, ytr)`, whose outputs 
+        at the initial params are `f0`."""
+        alpha = state.alpha
         params = state.model_state.params
         
         X_batched = Xtr.reshape((-1, batch_size, *Xtr.shape[1:]))
         y_batched = ytr.reshape((-1, batch_size, *ytr.shape[1:]))
+        f0_batched = f0.reshape((-1, batch_size, *f0.shape[1:]))
         
-        centered_apply = lambda vars, Xin: alpha * (apply_fn(vars, Xin) - apply_fn(p0, Xin))
+        compute_batch_loss = lambda z: mse(alpha * (apply_fn(params, prepare(z[0], norm)) - z[2]), z[1])
         
-        compute_batch_loss = lambda z: mse(centered_apply(params, z[0]), z[1])
-        
-        return jnp.mean(lax_map(compute_batch_loss, (X_batched, y_batched)))
+        return jnp.mean(lax_map(compute_batch_loss, (X_batched, y_batched, f0_batched)))
 
     MAX_LOSS_COMPUTE_BATCH_SIZE = 8192
     MAX_TEST_LOSS_COMPUTE_BATCH_SIZE = 1600
     loss_compute_batch_size = min(MAX_LOSS_COMPUTE_BATCH_SIZE, P)
-    compute_train_loss = pmap(partial(compute_loss, batch_size=loss_compute_batch_size))
-    compute_test_loss = pmap(partial(compute_loss, batch_size=MAX_TEST_LOSS_COMPUTE_BATCH_SIZE))
+    compute_train_loss = lambda state, Xtr, ytr, norm: compute_loss(state, Xtr, ytr, norm, state.f0_train, 
+                                                                     loss_compute_batch_size)
+    # the test data may be a subset of the test split; see `eval_subset`
+    test_batch_size = lambda X_test: min(MAX_TEST_LOSS_COMPUTE_BATCH_SIZE, X_test.shape[0])
+    compute_test_loss = lambda state, X_test, y_test, norm: compute_loss(state, X_test, y_test, norm, 
+                                                                          state.f0_test, test_batch_size(X_test))
+    test_outputs = lambda params, X_test, norm: outputs(params, X_test, norm, test_batch_size(X_test))
+
+    def initial_outputs(p0: chex.ArrayTree, Xtr: chex.ArrayDevice, X_test: chex.ArrayDevice, norm):
+        """The outputs at the initial params are fixed, so they are computed once per replica 
+        instead of in every step and evaluation."""
+        return outputs(p0, Xtr, norm, loss_compute_batch_size), test_outputs(p0, X_test, norm)
 
-    @partial(pmap)
     def update(state: DistributedEpochState, 
-                Xtr: chex.ArrayDevice, ytr: chex.ArrayDevice) -> DistributedEpochState:
-        """Runs one epoch."""
+                Xtr: chex.ArrayDevice, ytr: chex.ArrayDevice, norm) -> DistributedEpochState:
+        """Runs one epoch. Also returns the mean of the minibatch losses seen during the epoch, 
+        which comes for free with the gradients."""
         key, other = split(state.key, 2)
-        p0 = state.p0
-        # p0_shape = tree_map(lambda z:z.shape, p0)
+        alpha = state.alpha
         
         # loss and gradient functions -------------------------------
-        centered_apply = lambda vars, Xin: alpha * (apply_fn(vars, Xin) - apply_fn(p0, Xin))
+        centered_apply = lambda vars, Xin, f0in: alpha * (apply_fn(vars, Xin) - f0in)
         alpha_scaled_loss = lambda y, yhat: (1.0 / alpha ** 2) * mse(y, yhat)
  
-        def loss_fn(combined, Xin, yin):
-            return alpha_scaled_loss(centered_apply(combined, Xin), yin)
+        def loss_fn(combined, Xin, yin, f0in):
+            return alpha_scaled_loss(centered_apply(combined, Xin, f0in), yin)
         
         loss_grad_fn = value_and_grad(loss_fn, argnums=0)
         # -----------------------------------------------------------
 
-        def step(step_state: DistributedStepState, data: tuple) -> DistributedStepState:
+        def step(step_state: DistributedStepState, idx: chex.Array) -> DistributedStepState:
             """Takes an SGD step."""
         # unpack
             params = step_state.params
             opt_state = step_state.opt_state
-            batch, labels = data
+            batch, labels, f0_batch = Xtr[idx], ytr[idx], state.f0_train[idx]
 
             # update params
             # param_shape = tree_map(lambda z: z.shape, params)
             # data_shape = tree_map(lambda z: z.shape, batch)
-            _, grads = loss_grad_fn(params, batch, labels)
+            loss, grads = loss_grad_fn(params, prepare(batch, norm), labels, f0_batch)
             updates, opt_state = optimizer.update(grads, opt_state, params)
             
             # apply updates only to mutable params
             updated_params = optax.apply_updates(params, updates)
 
-            return DistributedStepState(params=updated_params, opt_state=opt_state), None
+            return DistributedStepState(params=updated_params, opt_state=opt_state), loss
     
 
-        # shuffle
-        Xtr_shuffled, ytr_shuffled = permutation(key, Xtr), permutation(key, ytr)
-        
-        # batch training data
-        Xtr_sb = Xtr_shuffled.reshape((num_batches, batch_size, *Xtr_shuffled.shape[1:]))
-        ytr_sb = ytr_shuffled.reshape((num_batches, batch_size, *ytr_shuffled.shape[1:]))
+        # shuffle: one permutation of the indices per epoch; each step gathers its minibatch, so
+        # no shuffled copy of the training data is made
+        batch_indices = permutation(key, Xtr.shape[0]).reshape((num_batches, batch_size))
 
         # SGD steps over batches in epoch
-        model_state_e, _ = scan(step, state.model_state, (Xtr_sb, ytr_sb))
-
-        return DistributedEpochState(key=other, p0=state.p0, model_state=model_state_e)
-    
-    # ----------------------------------------------------------------------
-
-    init_opt_state = pmap(optimizer.init)(params0)
-    init_step_state = DistributedStepState(params=params0, opt_state=init_opt_state) # TODO: question? is using params0 in both screwing things up?
-    init_epoch_state = DistributedEpochState(key=keys, p0=params0, model_state=init_step_state)
+        model_state_e, step_losses = scan(step, state.model_state, batch_indices)
+
+        # undo the 1 / alpha^2 scaling, so the loss is comparable with `compute_loss`
+        return state.replace(key=other, model_state=model_state_e), alpha ** 2 * jnp.mean(step_losses)
+
+    def train_chunk(state: DistributedEpochState, Xtr, ytr, X_test, y_test, norm, schedule: chex.Array, 
+                    train_schedule: chex.Array) -> tuple[DistributedEpochState, chex.Array, chex.Array, chex.Array]:
+        """Runs the epochs of one chunk; see `chunk_schedules`. `schedule` places the mean minibatch 
+        and test losses, `train_schedule` the full passes over the training data. Losses are written 
+        into buffers that stay on device until the chunk is done."""
+        def epoch(carry, slots):
+            state, step_buffer, test_buffer, train_buffer = carry
+            slot, train_slot = slots
+            state, step_loss = cond(slot != SKIP_EPOCH, lambda s: update(s, Xtr, ytr, norm), 
+                                    lambda s: (s, jnp.full((), jnp.nan)), state)
+            
+            def evaluate(buffers):
+                step_buffer, test_buffer = buffers
+                return (step_buffer.at[slot].set(step_loss),
+                        test_buffer.at[slot].set(compute_test_loss(state, X_test, y_test, norm)))
 
-    # early stopping rule
-    @partial(pmap)
-    def is_increasing(a, b):
-        return a < b
+            def evaluate_train(train_buffer):
+                return train_buffer.at[train_slot].set(compute_train_loss(state, Xtr, ytr, norm))
+            
+            step_buffer, test_buffer = cond(slot >= 0, evaluate, lambda buffers: buffers, (step_buffer, test_buffer))
+            train_buffer = cond(train_slot >= 0, evaluate_train, lambda buffer: buffer, train_buffer)
+            return (state, step_buffer, test_buffer, train_buffer), None
+
+        empty_buffer = jnp.full(schedule.shape, jnp.nan)
+        (state, *buffers), _ = scan(epoch, (state, empty_buffer, empty_buffer, empty_buffer), 
+                                    (schedule, train_schedule))
+        return (state, *buffers)
+
+    shared_data = (0, None, None, None)
+    return Trainer(
+        devices=devices,
+        initialize=pmap_replicas(get_params, devices),
+        init_opt_state=pmap_replicas(lambda p, eta: make_optimizer(eta).init(p), devices),
+        initial_outputs=pmap_replicas(initial_outputs, devices, in_axes=shared_data),
+        test_outputs=pmap_replicas(test_outputs, devices, in_axes=(0, None, None)),
+        update=pmap_replicas(update, devices, in_axes=shared_data),
+        compute_train_loss=pmap_replicas(compute_train_loss, devices, in_axes=shared_data),
+        compute_test_loss=pmap_replicas(compute_test_loss, devices, in_axes=shared_data),
+        train_chunk=pmap_replicas(train_chunk, devices, in_axes=(0, None, None, None, None, None, None, None)),
+        loss_and_yhat=pmap_replicas(partial(loss_and_yhat, apply_fn), devices, in_axes=(0, 0, 0, None, None, None)))
+
+
+def chunk_schedules(epochs: int, epochs_per_call: int, eval_epochs) -> list[tuple[np.ndarray, int]]:
+    """Splits `epochs` epochs into chunks of `epochs_per_call` epochs, each run by one call. A 
+    chunk's schedule holds, per epoch, the loss buffer slot that the epoch's evaluation is written 
+    to, or `NO_EVAL`. The last chunk is padded with `SKIP_EPOCH`, so that every chunk has the same 
+    shape. Returns the schedules with their number of evaluations."""
+    eval_epochs = set(eval_epochs)
+    chunks = []
+    for start in range(0, epochs, epochs_per_call):
+        schedule = np.full(epochs_per_call, SKIP_EPOCH, dtype=np.int32)
+        num_evals = 0
+        for i, e in enumerate(range(start, min(start + epochs_per_call, epochs))):
+            if e in eval_epochs:
+                schedule[i] = num_evals
+                num_evals += 1
+            else:
+                schedule[i] = NO_EVAL
+        chunks.append((schedule, num_evals))
+    return chunks
+
+
+def train(trainer: Trainer, params0: chex.ArrayTree, Xtr, ytr, X_val, y_val, X_test, y_test, 
+        keys: chex.PRNGKey, alpha: chex.Array, eta_0: chex.Array, 
+        epochs: int = 80, epochs_per_call: int = 1, eval_epochs=None, train_loss_epochs=None, 
+        checkpoint: Checkpointer = None, norm=None) -> tuple[DistributedEpochState, np.ndarray, np.ndarray, np.ndarray, jnp.ndarray]:
+    # `params0`, `keys`, `alpha` and `eta_0` carry a (device, replica) prefix; the data is shared by 
+    # the replicas on a device. Test and mean minibatch losses are recorded at `eval_epochs`, 
+    # full-pass training losses at `train_loss_epochs`, which default to `eval_epochs`. With a 
+    # `checkpoint`, training resumes from the last checkpoint and is checkpointed between chunks. 
+    # `norm` normalizes uint8 images inside the compiled programs; see `prepare`.
+    if eval_epochs is None:
+        eval_epochs = range(0, epochs, EVAL_EVERY)
+    if train_loss_epochs is None:
+        train_loss_epochs = eval_epochs
+    num_devices = keys.shape[0]
+    chunks = list(zip(chunk_schedules(epochs, epochs_per_call, eval_epochs), 
+                      chunk_schedules(epochs, epochs_per_call, train_loss_epochs)))
+    saved = checkpoint.restore() if checkpoint is not None else None
+    if saved is None:
+        init_opt_state = trainer.init_opt_state(params0, eta_0)
+        init_step_state = DistributedStepState(params=params0, opt_state=init_opt_state) # TODO: question? is using params0 in both screwing things up?
+        f0_train, f0_test = trainer.initial_outputs(params0, Xtr, X_test, norm)
+        init_epoch_state = DistributedEpochState(key=keys, p0=params0, f0_train=f0_train, f0_test=f0_test, 
+                                                 alpha=alpha, model_state=init_step_state)
+        first_chunk, losses, test_losses, step_losses = 0, [], [], []
+    else:
+        init_epoch_state = tree_map(lambda z: device_put_sharded(list(z), trainer.devices), saved['state'])
+        first_chunk, (losses, test_losses, step_losses) = saved['chunk'], saved['losses']
+        info(f'Resuming from epoch {min(first_chunk * epochs_per_call, epochs)}.')
 
     # training loop
     state = init_epoch_state
-    losses = []
-    test_losses = []
+
+    def collect(buffers, num_evals, num_train_evals):
+        step_buffer, test_buffer, train_buffer = device_get(buffers)
+        step_losses.append(step_buffer[..., :num_evals])
+        test_losses.append(test_buffer[..., :num_evals])
+        losses.append(train_buffer[..., :num_train_evals])
     
     # inf_losses = device_put_replicated(jnp.array(jnp.inf), devices)
     # TRAILING_VALIDATION_WINDOW = 2
     # trailing_validation_losses = deque((inf_losses,) * TRAILING_VALIDATION_WINDOW, maxlen=TRAILING_VALIDATION_WINDOW)
     info('Entering training loop...')
-    for e in range(epochs):
-        state = update(state, Xtr, ytr)
-        if e % 5 == 0:
-            losses.append(compute_train_loss(state, Xtr, ytr))
-            test_losses.append(compute_test_loss(state, X_test, y_test))    
-        
+    pending = None
+    for c in range(first_chunk, len(chunks)):
+        (schedule, num_evals), (train_schedule, num_train_evals) = chunks[c]
+        schedule = np.broadcast_to(schedule, (num_devices, *schedule.shape))
+        train_schedule = np.broadcast_to(train_schedule, (num_devices, *train_schedule.shape))
+        state, *buffers = trainer.train_chunk(state, Xtr, ytr, X_test, y_test, norm, schedule, train_schedule)
+        # fetch the previous chunk's losses while this chunk runs
+        if pending is not None:
+            collect(*pending)
+        pending = (buffers, num_evals, num_train_evals)
+
+        # the final state is checkpointed too, so that finished trials are not retrained
+        if checkpoint is not None and (checkpoint.due() or c == len(chunks) - 1):
+            collect(*pending)
+            pending = None
+            is_preempted = checkpoints.preempted()
+            checkpoint.save(dict(state=device_get(state), chunk=c + 1, 
+                                 losses=(list(losses), list(test_losses), list(step_losses))), 
+                            wait=is_preempted)
+            if is_preempted:
+                raise Preempted(f'Stopped after epoch {min((c + 1) * epochs_per_call, epochs) - 1}.')
+
         # validation_loss = compute_test_loss(state, X_val, y_val)
         # trailing_validation_losses.append(validation_loss)   
         
@@ -177,34 +394,13 @@ def train(devices, apply_fn: Callable, params0: chex.ArrayTree,
         # is_done = jnp.all(stopping_criterion) # consider switching to any?
         # if is_done:
         #     break
+    if pending is not None:
+        collect(*pending)
     info('...exiting loop.')
     # note that return value is a pytree
-    return state.model_state.params, losses, test_losses, jnp.array(e)
-    
-
-def loss_and_yhat(apply_fn, alpha, params, params_0, X_test, y_test):
-    """Returns test loss and the predictions yhat."""
-    # vapply_fn = vmap(apply_fn)
-    # vloss = vmap(loss)
-    BATCH_SIZE = 6400
-
-    def compute_ld(params, p0, X, y):
-        X_batched = X.reshape((-1, BATCH_SIZE, *X.shape[1:]))
-        y_batched = y.reshape((-1, BATCH_SIZE, *y.shape[1:]))
-        
-        centered_apply = lambda Xin: alpha * (apply_fn(params, Xin) - apply_fn(p0, Xin))
-        
-        def ly(a, b):
-            bhat = centered_apply(a)
-            return mse(b, bhat), bhat
-
-        vmap_ly = vmap(ly)
-        
-        batch_losses, batch_yhats = vmap_ly(X_batched, y_batched)
-        return jnp.mean(batch_losses), batch_yhats.reshape((-1, *y.shape[1:]))
+    return (state, np.concatenate(losses, axis=-1), np.concatenate(test_losses, axis=-1), 
+            np.concatenate(step_losses, axis=-1), jnp.array(epochs - 1))
     
-    return pmap(compute_ld)(params, params_0, X_test, y_test)
-
 
 def validation_test_split(data: tuple, val_P: int = 1600) -> tuple[tuple]:
     """Splits data into validation data of size val_P and test data of size P - val_P."""
@@ -215,86 +411,75 @@ def validation_test_split(data: tuple, val_P: int = 1600) -> tuple[tuple]:
     X_test, y_test = test_select(X), test_select(y)
     return (X_val, y_val), (X_test, y_test)
 
-def apply(key, data, devices, model_params, training_params):
+def apply(keys, data, devices, model_params, training_params, checkpoint: Checkpointer = None):
+    """Trains one trial per key. `keys` has shape (devices, replicas per device, 2); the replicas 
+    on a device are vmapped. The entries of `BATCHED_HYPERPARAMS` may be given either as scalars 
+    or as arrays of shape (devices, replicas per device). Returns the trial results as one result 
+    batched over (device, replica), which stays on device; see `Result.unbatch`. `checkpoint` 
+    checkpoints the training state; see `train`."""
     N = model_params['N']
+    batch_size = training_params['batch_size']
+    epochs = training_params['epochs']
+    epochs_per_call = training_params.get('epochs_per_call', 1)
+    # record the mean minibatch losses as the training curve, with full passes only at milestones
+    step_train_losses = training_params.get('step_train_losses', False)
+    eval_schedule = training_params.get('eval_schedule')
+    eval_epochs = get_eval_epochs(epochs, eval_schedule, EVAL_EVERY)
+    if step_train_losses:
+        train_loss_epochs = sorted(e for e in set(training_params.get('train_loss_milestones', ())) 
+                                   if 0 <= e < epochs)
+    else:
+        train_loss_epochs = eval_epochs
     
-    # MODELS --------------------------------------------------------
-    hidden_sizes = (N, 2 * N, 4 * N, 8 * N)
-    # hidden_sizes = (N, 2 * N)
-    # model = NTK_ResNet18(hidden_sizes=hidden_sizes, stage_sizes=(2, 2), n_classes=1)
-    
-    # model = MiniResNet18(num_classes=1, num_filters=N)
-    
-    # model = VGG_12(N)
-    model = WideResnet(1, N // 16, 1, conv_init=nn.initializers.normal(math.sqrt(2.0)))
-
-    # model = MyrtleNetwork(N, depth=5)
-
-    # model = ResNet18(n_classes=1)
-    # ---------------------------------------------------------------
-
+    P = data['train'][0].shape[1] # 0 is sharding dimension
+    if P % batch_size != 0:
+        raise ValueError(f'Batch size of {batch_size} does not divide training data size {P}.')
+    trainer = get_trainer(N, tuple(devices), P, batch_size)
 
     # get sharded keys
-    keys = split(key, num=len(devices) * 2)
-    del key
+    assert len(keys) == len(devices)
+    keys = vmap(vmap(split))(keys) # (device, replica, init / apply, 2)
 
     shard = lambda key_array: device_put_sharded(tuple(key_array), devices)
-    init_keys, apply_keys = shard(keys[:len(devices)]), shard(keys[len(devices):])
+    init_keys, apply_keys = shard(keys[:, :, 0]), shard(keys[:, :, 1])
 
     # get initial parameters
-    params_0 = initialize(init_keys, model, devices)
+    params_0 = trainer.initialize(init_keys)
     # print(tree_map(lambda z: z.shape, params_0))
 
-    # compose optimizer
-    def zero_grads():
-        def init_fn(_): 
-            return ()
-        def update_fn(updates, state, params=None):
-            return tree_map(jnp.zeros_like, updates), ()
-        return optax.GradientTransformation(init_fn, update_fn)
+    # per-replica hyperparameters
+    batched = lambda v: shard(jnp.broadcast_to(jnp.asarray(v, dtype=jnp.float32), keys.shape[:2]))
+    alpha, eta_0 = batched(model_params['alpha']), batched(training_params['eta_0'])
 
-    batch_size = training_params['batch_size']
-    eta_0 = training_params['eta_0']
-    # weight_decay = training_params['weight_decay'] * batch_size
-    # momentum = training_params['momentum']
-    
-    # POWER = -0.5
-    # LR_DROP_STAGE_SIZE = 512
-    
-    # block_steps = LR_DROP_STAGE_SIZE // batch_size
-    # lr_schedule = blocked_polynomial_schedule(eta_0, POWER, block_steps=block_steps)
-    # optimizer = optax.sgd(lr_schedule, momentum)
-    adam = optax.adam(eta_0)
-    # sgd_fixed_eta = optax.sgd(eta_0, momentum)
-    optimizer = optax.multi_transform({'adam': adam, 'zero': zero_grads()},
-                                        {'params': 'adam', 'scaler': 'zero'})
-    # optimizer = optax.adamw(eta_0, weight_decay=weight_decay)
+    # uint8 images are normalized on the fly with these constants; see `prepare`
+    norm = data.get('norm')
 
-    # compose apply function
-    apply_fn = model.apply
-    alpha = model_params['alpha']
+    # losses during training may be evaluated on a fixed subset of the test data
+    val_data, test_data = validation_test_split(data['test'])
+    subset = eval_subset(test_data[0].shape[1], eval_schedule)
+    if subset is None:
+        eval_data = test_data
+    else:
+        if len(subset) % min(len(subset), 1600) != 0:
+            raise ValueError(f'Eval subset size {len(subset)} is not a multiple of 1600.')
+        eval_data = tuple(vmap(lambda z: z[subset])(x) for x in test_data)
 
     # train!
-    epochs = training_params['epochs']
-    P = data['train'][0].shape[1] # 0 is sharding dimension
-    if P % batch_size != 0:
-        raise ValueError(f'Batch size of {batch_size} does not divide training data size {P}.')
-    val_data, test_data = validation_test_split(data['test'])
-    params_f, train_losses, test_losses, num_epochs = train(devices, apply_fn, params_0, optimizer, 
-                                    *data['train'], *val_data, *test_data, apply_keys,
-                                    alpha, epochs, batch_size)
+    state_f, full_train_losses, test_losses, step_losses, num_epochs = train(trainer, params_0, 
+                                    *data['train'], *val_data, *eval_data, apply_keys,
+                                    alpha, eta_0, epochs, epochs_per_call, eval_epochs, train_loss_epochs, 
+                                    checkpoint, norm)
+    if step_train_losses:
+        train_losses, milestone_train_losses = step_losses, full_train_losses
+    else:
+        train_losses, milestone_train_losses = full_train_losses, None
+    params_f = state_f.model_state.params
     
-    test_loss_f, test_yhat_f = loss_and_yhat(apply_fn, 
-                                            alpha, params_f, params_0, 
-                                            *test_data)
+    f0_test = state_f.f0_test if subset is None else trainer.test_outputs(params_0, test_data[0], norm)
+    test_loss_f, test_yhat_f = trainer.loss_and_yhat(alpha, params_f, f0_test, *test_data, norm)
 
-    parallel_result = Result(weight_init_key=init_keys, params_f=params_f, 
+    # test labels are shared by the replicas on a device, eval epochs by all trials
+    return Result(weight_init_key=init_keys, params_f=params_f, 
                 train_losses=train_losses, test_losses=test_losses, test_loss_f=test_loss_f, 
-                test_yhat_f=test_yhat_f, test_y=test_data[1])
-    
-    results = [None] * len(devices)
-    for d in range(len(devices)):
-        results[d] = tree_map(lambda z: z[d], parallel_result)
-    return results
-    
-
+                test_yhat_f=test_yhat_f, test_y=test_data[1], milestone_train_losses=milestone_train_losses, 
+                eval_epochs=np.asarray(eval_epochs))
@@ -73,11 +73,11 @@ def train(apply_fn: Callable, params0: chex.ArrayTree,
             return mse(centered_apply(combined, Xin), yin)
         loss_grad_fn = value_and_grad(loss_fn, argnums=0)
 
-        def step(step_state: DistributedStepState, data: tuple):
+        def step(step_state: DistributedStepState, idx: chex.Array):
         # unpack
             params = step_state.params
             opt_state = step_state.opt_state
-            batch, labels = data
+            batch, labels = Xtr[idx], ytr[idx]
 
             # update params
             # param_shape = tree_map(lambda z: z.shape, params)
@@ -93,17 +93,14 @@ def train(apply_fn: Callable, params0: chex.ArrayTree,
             return DistributedStepState(loss=loss_value, params=updated_params, p0=step_state.p0, opt_state=opt_state), None
     
 
-        # shuffle
-        Xtr_shuffled, ytr_shuffled = permutation(key, Xtr), permutation(key, ytr)
-        
-        # batch training data
-        Xtr_sb = Xtr_shuffled.reshape((num_batches, batch_size, *Xtr_shuffled.shape[1:]))
-        ytr_sb = ytr_shuffled.reshape((num_batches, batch_size, *ytr_shuffled.shape[1:]))
+        # shuffle: one permutation of the indices per epoch; each step gathers its minibatch, so
+        # no shuffled copy of the training data is made
+        batch_indices = permutation(key, Xtr.shape[0]).reshape((num_batches, batch_size))
 
         # SGD steps over batches in epoch
         step_state = state.model_state
         for b in range(num_batches):
-            step_state, _ = step(step_state, (Xtr_sb[b], ytr_sb[b]))
+            step_state, _ = step(step_state, batch_indices[b])
 
         return DistributedEpochState(key=other, model_state=step_state)
     
@@ -1,24 +1,32 @@
 from abc import ABC, abstractmethod
 import logging
+import sys
 from typing import Mapping
 import jax
 
 # from src.run.save_helpers import create_tmp_folder
 from os.path import join
 
-from src.run import constants
+from src.run import constants, data_cache
 
 from omegaconf import OmegaConf
 
 class PreprocessDevice(ABC):
+    # modules besides the subclass's own whose code determines the preprocessed data; see `data_cache`
+    preprocessing_modules = ()
+
     # TODO: does replicate belong here? Fix.
-    def __init__(self, base_dir: str, data_params: dict, replicate=True):
+    def __init__(self, base_dir: str, data_params: dict, replicate=True, cache_dir: str = ''):
         self.save_dir = join(base_dir, constants.LOCAL_RESULTS_FOLDER)
         self.data_params = dict(data_params)
         self.data_dir = join(base_dir, self.data_params['root_dir'])
+        # preprocessed data is cached here and reused by later jobs; '' disables the cache
+        self.cache_dir = cache_dir
         
         self.devices = None
         self.data = None
+        self._replicated = False
+        self._subset_data = {}
 
     def preprocess(self, parallelize=True):
         """Initializes the PreprocessDevice object."""
@@ -31,17 +39,44 @@ class PreprocessDevice(ABC):
         
         self._save_data_params(self.save_dir, self.data_params)
 
-        _data = self.load_data(self.data_params)
+        _data = self._load_cached_data()
 
         # maintains pmap order of devices
         self.devices = jax.lib.xla_bridge.get_backend().get_default_device_assignment(jax.device_count())
         replicate = parallelize
         if replicate:
-            self.data = jax.device_put_replicated(_data, self.devices)
+            # one transfer from the host to each device; replicating from device 0 would copy twice
+            self.data = jax.device_put_sharded([_data] * len(self.devices), self.devices)
             logging.info('Replicated data onto devices.')
         else: # no loading onto device
             self.data = _data
+        self._replicated = replicate
+
+    def data_for(self, devices):
+        """Returns the data replicated onto `devices`, which must be a subset of `self.devices`. 
+        The shards are taken from the existing replicas, so no data is copied."""
+        devices = tuple(devices)
+        if not self._replicated or devices == tuple(self.devices):
+            return self.data
+        
+        if devices not in self._subset_data:
+            idx = [self.devices.index(d) for d in devices]
+            shards = [jax.tree_map(lambda z: z[i], self.data) for i in idx]
+            self._subset_data[devices] = jax.device_put_sharded(shards, list(devices))
+        return self._subset_data[devices]
 
+    def _load_cached_data(self):
+        if not self.cache_dir:
+            return self.load_data(self.data_params)
+        modules = (sys.modules[type(self).__module__], *self.preprocessing_modules)
+        key = data_cache.fingerprint(self.data_params, modules)
+        data = data_cache.load(self.cache_dir, key)
+        if data is not None:
+            logging.info(f'Loaded preprocessed data from the cache ({key}).')
+            return data
+        data = self.load_data(self.data_params)
+        data_cache.save(self.cache_dir, key, data, self.data_params)
+        return data
 
     @abstractmethod
     def load_data(self, data_params: Mapping):
@@ -1,72 +1,201 @@
 import logging
-from jax.random import split
-from jax import device_get
+import chex
+import jax.numpy as jnp
+from jax.random import fold_in
+from jax import device_get, vmap
 from src.experiment.training.momentum import Result
 from src.run.PreprocessDevice import PreprocessDevice
+from src.run import checkpoint
+from src.run.ledger import Ledger, task_hash
+from src.run.result_writer import ResultWriter
+from src.run.result_store import TaskStoreWriter, TaskResults, META_FNAME
+from src.run.catalog import Catalog, trial_metrics, config_columns
+from src.run.pack import PackWriter, open_pack
 
 from src.tasks.task import Task, Task_ConfigSubset
+from src.tasks.batching import pack_trials
 
-from os.path import join, exists
+from os.path import join, exists, basename
 from os import mkdir
-
-from pickle import dump
+from shutil import rmtree
 
 from omegaconf import OmegaConf
 
 class TaskRunner:
-    def __init__(self, PD: PreprocessDevice) -> None:
+    def __init__(self, PD: PreprocessDevice, devices=None, ledger: Ledger = None, save_params: bool = True, 
+                 catalog: Catalog = None, pack: PackWriter = None) -> None:
         self.preprocess_device = PD
+        # subset of the preprocessed devices that this runner's tasks are pmapped over
+        self.devices = tuple(devices) if devices is not None else tuple(PD.devices)
+        # trials listed in the ledger are not run again
+        self.ledger = ledger
+        self.save_params = save_params
+        # one row per finished trial, for queries that do not read the results
+        self.catalog = catalog
+        # complete task folders are moved into the run's pack
+        self.pack = pack
 
     def run_serial_task(self, task: Task):
-        key = task.seed
-        keys = split(key, num=task.repeat).reshape((task.repeat, 2))
-        data = self.preprocess_device.data
-
-        save_folder = join(self.preprocess_device.save_dir, f'task-{task._id}')
-        for r in range(task.repeat):            
-            result = task.apply_callback(keys[r], data)
-            
-            repeat_save_folder = join(save_folder, f'trial-{r}')
-            task.save_callback(repeat_save_folder, result)
+        """Runs the trials of `task` one at a time on a single device."""
+        self._run_trials(task, parallel=False)
 
     def run_repeat_task(self, task: Task):
-        devices = self.preprocess_device.devices
-        num_devices = len(devices)
-        
-        iters = task.repeat // num_devices
-        # TODO: num_devices doesn't actually have to divide task.repeat!
-        key = task.seed
-        iter_keys = split(key, num=iters)
-        del key
-
+        """Runs the trials of `task` in parallel across the devices."""
+        self._run_trials(task, parallel=True)
+
+    def prewarm_task(self, task: Task):
+        """Compiles the programs for every batch shape of `task` by training one epoch of each. 
+        The results are discarded."""
+        targets = task.fused or (task,)
+        tp = dict(targets[0].training_params, epochs=1)
+        keys = trial_keys(targets[0].seed, len(self.devices) * task.replicas_per_device)
+
+        batches = pack_trials(task.repeat, len(self.devices), task.replicas_per_device)
+        for num_devices, replicas in dict.fromkeys((n, r) for _, n, r in batches):
+            devices = self.devices[:num_devices]
+            data = self.preprocess_device.data_for(devices)
+            batch_keys = keys[:num_devices * replicas].reshape((num_devices, replicas, -1))
+            device_get(task.apply_callback(batch_keys, data, devices, dict(task.model_params), tp))
+
+    def _run_trials(self, task: Task, parallel: bool):
+        # a fused task runs the trials of its member tasks, whose results are saved separately
+        targets = task.fused or (task,)
+        hashes = {t._id: task_hash(t, self.preprocess_device.data_params) for t in targets}
+        names = {t._id: self._save_folder_name(t, hashes[t._id]) for t in targets}
+        if self.pack is not None:
+            packed = [t for t in targets if self._is_packed(t, names[t._id])]
+            if packed:
+                logging.info(f'Task {task._id}: {len(packed)} task(s) already done and packed.')
+            targets = [t for t in targets if t not in packed]
+            for t in targets:
+                self._unpack(t, names[t._id])
+        save_folders = {t._id: self._make_save_folder(t, names[t._id]) for t in targets}
+        # one row per trial; see `result_store`
+        stores = {t._id: TaskStoreWriter(save_folders[t._id], t.repeat, self.save_params) for t in targets}
+
+        # recall `apply` is (trial keys, data, devices, model_params, training_params) -> results 
+        # batched over (device, replica)
         apply = task.apply_callback
-
-        save_folder = join(self.preprocess_device.save_dir, f'task-{task._id}')
+        trials = [(t, r) for t in targets for r in range(t.repeat) 
+                    if not self._is_done(hashes[t._id], r, stores[t._id])]
+        num_done = sum(t.repeat for t in targets) - len(trials)
+        if num_done:
+            logging.info(f'Task {task._id}: {num_done} trial(s) already done.')
+        if not trials:
+            self._pack_complete(targets, stores, save_folders)
+            return
+        all_keys = {t._id: trial_keys(t.seed, t.repeat) for t in targets}
+        keys = jnp.stack([all_keys[t._id][r] for t, r in trials])
+
+        if parallel:
+            batches = pack_trials(len(trials), len(self.devices), task.replicas_per_device)
+        else:
+            batches = [(i, 1, 1) for i in range(len(trials))]
+
+        def save(target: tuple[Task, int], result: Result):
+            t, trial = target
+            stores[t._id].write(trial, result)
+            folder = basename(save_folders[t._id])
+            if self.catalog is not None:
+                self.catalog.insert(hashes[t._id], trial, folder, join(folder, META_FNAME), 
+                                    self._catalog_columns(t, result))
+            if self.ledger is not None:
+                self.ledger.record(hashes[t._id], trial, folder)
+        
+        # results are saved in the background while the next batch trains
+        with ResultWriter(save) as writer:
+            for start, num_devices, replicas in batches:
+                devices = self.devices[:num_devices]
+                # data is replicated across devices, everything else is not
+                data = self.preprocess_device.data_for(devices)
+                
+                batch_trials = trials[start:start + num_devices * replicas]
+                batch_keys = keys[start:start + num_devices * replicas].reshape((num_devices, replicas, -1))
+                mp, tp = batch_params([t for t, _ in batch_trials], (num_devices, replicas))
+                # keyed by the batch's first trial, which a requeue that skips finished trials keeps
+                first_task, first_trial = batch_trials[0]
+                ckpt = checkpoint.for_batch(hashes[first_task._id], first_trial, num_devices, replicas, 
+                                            [(t.model_params, t.training_params, r) for t, r in batch_trials],
+                                            device_get(batch_keys).tolist())
+                batch_result = apply(batch_keys, data, devices, mp, tp, checkpoint=ckpt)
+                writer.submit(batch_result, batch_trials)
+        self._pack_complete(targets, stores, save_folders)
+
+    def _pack_complete(self, targets: list[Task], stores: dict, save_folders: dict):
+        if self.pack is None:
+            return
+        for t in targets:
+            if all(stores[t._id].is_done(r) for r in range(t.repeat)):
+                del stores[t._id] # closes the store's memory maps
+                self.pack.add_folder(save_folders[t._id], basename(save_folders[t._id]))
+                rmtree(save_folders[t._id])
+
+    def _is_packed(self, task: Task, name: str) -> bool:
+        """Whether the pack holds every trial of `task` in its folder `name`."""
+        if not self.pack.has_folder(name):
+            return False
+        done = TaskResults(join(self.pack.folder, name), open_pack(self.pack.folder)).done
+        return len(done) >= task.repeat and bool(done[:task.repeat].all())
+
+    def _unpack(self, task: Task, name: str):
+        # a task packed with a smaller `repeat` trains its new trials in its restored folder, and
+        # is packed again once they are done; readers take the last entry of each file in the pack
+        save_folder = join(self.preprocess_device.save_dir, name)
+        if self.pack.has_folder(name) and not exists(save_folder):
+            num_files = open_pack(self.pack.folder).extract(name, save_folder)
+            logging.info(f'Task {task._id}: restored {num_files} file(s) of its packed folder.')
+
+    def _catalog_columns(self, task: Task, result: Result) -> dict:
+        return dict(**config_columns('data_params', self.preprocess_device.data_params),
+                    **config_columns('model_params', task.model_params),
+                    **config_columns('training_params', task.training_params),
+                    seed=str(tuple(map(int, task.seed))), repeat=task.repeat,
+                    **trial_metrics(result))
+
+    def _is_done(self, hash: str, trial: int, store: TaskStoreWriter) -> bool:
+        if self.ledger is not None:
+            return self.ledger.is_done(hash, trial)
+        # without a ledger, a requeued job still keeps the results it saved before it was stopped
+        return store.is_done(trial)
+
+    def _save_folder_name(self, task: Task, hash: str) -> str:
+        # a task keeps its folder across runs; see `Ledger`
+        name = f'task-{task._id}'
+        if self.ledger is not None:
+            if self.ledger.folder(hash) is not None:
+                name = self.ledger.folder(hash)
+            elif self.ledger.is_folder_taken(name, hash):
+                name = f'{name}-{hash[:8]}'
+        return name
+
+    def _make_save_folder(self, task: Task, name: str) -> str:
+        save_folder = join(self.preprocess_device.save_dir, name)
         if exists(save_folder):
-            raise RuntimeError(f'Save folder for task {task._id} already exists.')
+            # left by an earlier run of the same job; see `checkpoint`
+            logging.info(f'Save folder for task {task._id} already exists; reusing it.')
         else:
             mkdir(save_folder)
             save_config(save_folder, task)
-            
+        return save_folder
 
-        # TODO: this is hacky. separate into grid-search hyperparams
-        # recall `apply` is (RNG, data, model_params, training_params) -> result
-        # papply = pmap(apply, static_broadcasted_argnums=(2, 3)) # apply (key, data) -> result
 
-        data = self.preprocess_device.data
-        
-        mp, tp = dict(task.model_params), dict(task.training_params)
-        
-        
-        for batch in range(0, iters):
-            key = iter_keys[batch]
-            # data is replicated across devices, everything else is not
-            batch_results = apply(key, data, devices, mp, tp)
+def batch_params(tasks: list[Task], shape: tuple) -> tuple[dict, dict]:
+    """Returns the model and training params for a batch of trials, given the task of each trial. 
+    Scalars that differ between the trials become arrays of shape `shape`."""
+    def merge(params: list[dict]) -> dict:
+        merged = dict(params[0])
+        for name, value in merged.items():
+            values = [p[name] for p in params]
+            if any(v != value for v in values):
+                merged[name] = jnp.array(values, dtype=jnp.float32).reshape(shape)
+        return merged
+    return merge([t.model_params for t in tasks]), merge([t.training_params for t in tasks])
 
-            idx = batch * num_devices
-            for replica, result in enumerate(batch_results):
-                local_result = device_get(result)
-                save_result(save_folder, local_result, fname = f'trial_{idx + replica}_result.pkl')
+
+def trial_keys(seed: chex.PRNGKey, num_trials: int) -> chex.PRNGKey:
+    """Returns one key per trial. Trial `i` always gets the same key, regardless of how many 
+    trials are run or how they are batched across devices."""
+    return vmap(fold_in, in_axes=(None, 0))(seed, jnp.arange(num_trials))
 
 
 def save_config(dir: str, task: Task):
@@ -81,12 +210,3 @@ def save_config(dir: str, task: Task):
     except OSError:
         logging.error('Could not write task config file.')
         raise
-
-def save_result(dir: str, result: Result, fname):
-    abs_path_fname = join(dir, fname)
-    try:
-        with open(abs_path_fname, 'xb') as f:
-            dump(result, f)
-    except OSError:
-        logging.error(f'Could not write task result file "{fname}" in directory "{dir}".')
-        raise
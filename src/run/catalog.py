@@ -0,0 +1,150 @@
+"""SQLite catalog of the trials in a results folder, written by `TaskRunner` as trials finish.
+
+Each row is one trial and holds:
+- the flattened data and task configs, one column per entry, e.g. `data_params.P` or
+  `model_params.alpha`
+- scalar metrics
+- the location of the full result
+Queries return numpy arrays, so sweeps can be analysed without walking the results folders or
+reading any results.
+"""
+import json
+import logging
+import sqlite3
+import threading
+
+from os.path import join, exists, isdir
+from os import listdir
+from typing import Mapping, Sequence
+
+import numpy as np
+
+from src.run.result_store import flatten
+
+CATALOG_FNAME = 'catalog.sqlite'
+KEY_COLUMNS = ('task_hash', 'trial')
+METRIC_COLUMNS = ('test_loss_f', 'is_nan', 'final_train_loss', 'test_accuracy')
+# the settings that tell the trials of a sweep apart; see `aggregate.TABLE_KEYS`
+LOSS_GROUPING = ('data_params.data_seed', 'data_params.P', 'model_params.alpha', 'model_params.N',
+                 'training_params.eta_0')
+
+
+def trial_metrics(result: Mapping) -> dict:
+    """Scalar metrics of a trial's result on the host. Accuracy counts the test points whose
+    prediction has the sign of the label."""
+    test_loss_f = float(np.asarray(result['test_loss_f']))
+    train_losses = np.asarray(result['train_losses'])
+    y, yhat = np.asarray(result['test_y']), np.asarray(result['test_yhat_f'])
+    return dict(test_loss_f=test_loss_f, is_nan=bool(np.isnan(test_loss_f)),
+                final_train_loss=float(train_losses[-1]) if train_losses.size else float('nan'),
+                test_accuracy=float(np.mean(y * yhat > 0)))
+
+
+def config_columns(section: str, config: Mapping) -> dict:
+    """Flattens `config` into columns named `section.path.to.entry`."""
+    columns = {}
+    for path, value in flatten(config).items():
+        if isinstance(value, (list, tuple)):
+            value = json.dumps(value)
+        columns[f'{section}.' + path.replace('/', '.')] = value
+    return columns
+
+
+class Catalog:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock() # runners on several scheduler threads insert trials
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS trials (task_hash TEXT, trial INTEGER, folder TEXT, '
+                'location TEXT, PRIMARY KEY (task_hash, trial))')
+        self._columns = self._read_columns()
+
+    def _read_columns(self) -> set:
+        return {row[1] for row in self._connection.execute('PRAGMA table_info(trials)')}
+
+    def insert(self, task_hash: str, trial: int, folder: str, location: str, columns: Mapping):
+        """Inserts or replaces the row of a trial; `columns` holds its configs and metrics. Columns
+        that the catalog lacks are added."""
+        row = dict(task_hash=task_hash, trial=trial, folder=folder, location=location, **columns)
+        with self._lock, self._connection:
+            for name in row.keys() - self._columns:
+                self._connection.execute(f'ALTER TABLE trials ADD COLUMN {_quote(name)}')
+                self._columns.add(name)
+            names = ', '.join(map(_quote, row))
+            self._connection.execute(f'INSERT OR REPLACE INTO trials ({names}) VALUES '
+                                     f'({", ".join("?" * len(row))})', tuple(row.values()))
+
+    def query(self, columns: Sequence[str], where: str = '', params: tuple = ()) -> dict[str, np.ndarray]:
+        """Returns `columns` of the rows matching the SQL condition `where`, one array per column."""
+        missing = set(columns) - self._columns
+        if missing:
+            raise KeyError(f'The catalog has no column(s) {sorted(missing)}.')
+        sql = f'SELECT {", ".join(map(_quote, columns))} FROM trials' + (f' WHERE {where}' if where else '')
+        with self._lock:
+            rows = self._connection.execute(sql, params).fetchall()
+        values = list(zip(*rows)) if rows else [()] * len(columns)
+        return {name: np.array(column) for name, column in zip(columns, values)}
+
+    def backup(self, path: str):
+        """Writes a consistent copy of the catalog to `path`, between inserts."""
+        with self._lock:
+            target = sqlite3.connect(path)
+            try:
+                self._connection.backup(target)
+            finally:
+                target.close()
+
+    def close(self):
+        self._connection.close()
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def group_mean(rows: Mapping[str, np.ndarray], keys: Sequence[str], metric: str):
+    """Averages `metric` over the trials with equal `keys`, leaving out NaN trials. Returns the
+    distinct keys, one array per key, the means and the number of NaN trials per group."""
+    key_rows = np.stack([np.asarray(rows[k], dtype=float) for k in keys], axis=1)
+    groups, inverse = np.unique(key_rows, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    values = np.asarray(rows[metric], dtype=float)
+    is_nan = np.isnan(values)
+    totals = np.bincount(inverse, np.where(is_nan, 0.0, values), minlength=len(groups))
+    counts = np.bincount(inverse, ~is_nan, minlength=len(groups))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = totals / counts
+    num_nan = np.bincount(inverse, is_nan, minlength=len(groups)).astype(int)
+    return tuple(groups.T), means, num_nan
+
+
+def open_catalogs(results_dir: str, prefix: str = 'results-') -> list[Catalog]:
+    """Opens the catalogs of the results folders in `results_dir`."""
+    paths = [join(results_dir, name, CATALOG_FNAME) for name in sorted(listdir(results_dir))
+                if name.startswith(prefix) and isdir(join(results_dir, name))]
+    return [Catalog(path) for path in paths if exists(path)]
+
+
+def query_all(catalogs: Sequence[Catalog], columns: Sequence[str], where: str = '',
+              params: tuple = ()) -> dict[str, np.ndarray]:
+    """`Catalog.query` over several catalogs, concatenated."""
+    parts = [c.query(columns, where, params) for c in catalogs]
+    if not parts:
+        logging.warning('No catalogs to query.')
+        return {name: np.array([]) for name in columns}
+    return {name: np.concatenate([p[name] for p in parts]) for name in columns}
+
+
+def losses(catalogs: Sequence[Catalog], keys: Sequence[str] = LOSS_GROUPING):
+    """Mean final test loss and number of NaN trials per group of `keys`."""
+    rows = query_all(catalogs, [*keys, 'test_loss_f'])
+    return group_mean(rows, keys, 'test_loss_f')
+
+
+def accuracies(catalogs: Sequence[Catalog], keys: Sequence[str] = LOSS_GROUPING):
+    """Mean test accuracy of the non-NaN trials and number of NaN trials per group of `keys`."""
+    rows = query_all(catalogs, [*keys, 'test_accuracy', 'is_nan'])
+    rows['test_accuracy'] = np.where(rows['is_nan'].astype(bool), np.nan, rows['test_accuracy'])
+    return group_mean(rows, keys, 'test_accuracy')
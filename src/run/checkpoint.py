@@ -0,0 +1,117 @@
+"""Periodic checkpoints of the training state, so that requeued jobs resume where they stopped.
+
+Each batch of trials has its own checkpoint file in the checkpoint directory, which should be on
+persistent storage. The file is named after the task hash and index of the batch's first trial,
+which stay the same when a requeued job skips the trials that are already done. Checkpoints are written by a background thread every `every_seconds`, and once
+more, synchronously, when the job receives SIGTERM or SIGUSR1; training then stops with
+`Preempted`. The final state of a batch is checkpointed too, so a requeued job only recomputes the
+results of finished batches. The directory is removed once all results are safe.
+"""
+import hashlib
+import logging
+import os
+import pickle
+import shutil
+import signal
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from os.path import join, exists
+from typing import Optional
+
+_dir = None
+_every_seconds = None
+_writer = None # one thread writes all checkpoints, in order
+_preempted = threading.Event()
+
+
+class Preempted(Exception):
+    """Raised by training loops after the final checkpoint of a preempted job is written."""
+
+
+def initialize(dir: str, every_seconds: float = 1800.0, signals=(signal.SIGTERM, signal.SIGUSR1)):
+    """Enables checkpoints in `dir` and installs the preemption handlers. Must be called from the
+    main thread."""
+    global _dir, _every_seconds, _writer
+    _dir, _every_seconds = dir, every_seconds
+    os.makedirs(dir, exist_ok=True)
+    _writer = ThreadPoolExecutor(max_workers=1)
+    for signum in signals:
+        signal.signal(signum, _handle_signal)
+
+
+def _handle_signal(signum, frame):
+    logging.warning(f'Received signal {signum}; checkpointing and stopping.')
+    _preempted.set()
+
+
+def is_initialized() -> bool:
+    return _dir is not None
+
+
+def preempted() -> bool:
+    return _preempted.is_set()
+
+
+def for_batch(task_hash: str, first_trial: int, *identity) -> Optional['Checkpointer']:
+    """Returns the checkpointer for the batch of trials that starts at trial `first_trial` of the
+    task with hash `task_hash`, or None if checkpoints are disabled. A checkpoint is only restored
+    if `identity` (the batch's hyperparameters, keys, ...) matches the one it was written with."""
+    if _dir is None:
+        return None
+    fingerprint = hashlib.sha1(repr(identity).encode()).hexdigest()
+    return Checkpointer(join(_dir, f'task-{task_hash}', f'trial-{first_trial}.pkl'), fingerprint, 
+                        _every_seconds)
+
+
+def clear():
+    """Removes all checkpoints; call once the results are saved permanently."""
+    if _dir is not None and exists(_dir):
+        shutil.rmtree(_dir)
+
+
+class Checkpointer:
+    def __init__(self, path: str, fingerprint: str, every_seconds: float) -> None:
+        self.path = path
+        self.fingerprint = fingerprint
+        self.every_seconds = every_seconds
+        self._last_save = time.monotonic()
+
+    def restore(self) -> Optional[dict]:
+        """Returns the last saved payload, or None if there is no usable checkpoint."""
+        if not exists(self.path):
+            return None
+        try:
+            with open(self.path, 'rb') as f:
+                checkpoint = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            logging.warning(f'Could not read checkpoint {self.path}; starting over.')
+            return None
+        if checkpoint['fingerprint'] != self.fingerprint:
+            logging.warning(f'Checkpoint {self.path} belongs to a different configuration; starting over.')
+            return None
+        return checkpoint['payload']
+
+    def due(self) -> bool:
+        """Whether a checkpoint should be written now."""
+        return preempted() or time.monotonic() - self._last_save >= self.every_seconds
+
+    def save(self, payload: dict, wait: bool = False):
+        """Writes `payload` in the background; `payload` must not be modified afterwards. With
+        `wait`, returns once it is written."""
+        self._last_save = time.monotonic()
+        future = _writer.submit(self._write, {'fingerprint': self.fingerprint, 'payload': payload})
+        if wait:
+            future.result()
+
+    def _write(self, checkpoint: dict):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f'{self.path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp, 'wb') as f:
+                pickle.dump(checkpoint, f)
+            os.replace(tmp, self.path)
+        except OSError:
+            logging.error(f'Could not write checkpoint {self.path}.')
+            raise
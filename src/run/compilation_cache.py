@@ -0,0 +1,213 @@
+"""Persistent XLA compilation cache with a node-local tier backed by a shared tier.
+
+JAX reads and writes the node-local directory. Entries that are missing locally are pulled from the
+shared directory at startup, and new local entries are pushed back after every task, so jobs on
+other nodes can reuse them. Cache hits, misses and compile seconds saved are counted per task from
+JAX's compilation log messages.
+
+The pinned JAX (0.3.23) only uses the cache on GPU when XLA runs compiled programs through its
+runtime, so `initialize` turns that on in XLA_FLAGS. XLA reads the flags when the backend starts, so
+`initialize` must be called before the first use of a device.
+"""
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+
+from dataclasses import dataclass
+from os.path import join, isdir, exists
+
+COMPILE_TIMES_FNAME = 'compile_times.json'
+GPU_CACHE_FLAG = '--xla_gpu_enable_xla_runtime_executable=true'
+
+# JAX 0.3.x logs through absl, which writes to the 'absl' logger; 0.4.x has one logger per module.
+# A hit is logged at INFO, and is followed in the same thread by the compile time, logged at DEBUG.
+_LOGGERS = ('absl', 'jax._src.compiler', 'jax._src.dispatch')
+_HIT = re.compile(r"^Persistent compilation cache hit for '.+'$")
+_FINISHED = re.compile(r'^Finished XLA compilation of (.+) in ([0-9.eE+-]+) sec$')
+
+_local_dir = None
+_shared_dir = None
+_monitor = None
+_logger_state = {} # logger name -> (level, propagate) before the monitor was attached
+_push_lock = threading.Lock() # tasks finish on several scheduler threads
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    seconds_saved: float = 0.0
+
+
+class _CompileMonitor(logging.Handler):
+    """Counts cache hits and misses from JAX's log records, per thread. It replaces propagation on
+    the loggers it is attached to, so it passes on the records they would have let through."""
+    def __init__(self, compile_times: dict, levels: dict):
+        super().__init__(logging.DEBUG)
+        self.compile_times = compile_times # function name -> seconds to compile
+        self.levels = levels # logger name -> level of the records passed on
+        self.stats = {} # thread id -> CacheStats
+        self._hit = {} # thread id -> whether the next compile time is that of a cache hit
+        self._lock = threading.Lock()
+
+    def emit(self, record: logging.LogRecord):
+        msg = record.getMessage()
+        if _HIT.match(msg) is not None:
+            with self._lock:
+                self.stats.setdefault(record.thread, CacheStats()).hits += 1
+                self._hit[record.thread] = True
+        elif (m := _FINISHED.match(msg)) is not None:
+            name, elapsed = m.group(1), float(m.group(2))
+            with self._lock:
+                stats = self.stats.setdefault(record.thread, CacheStats())
+                if self._hit.pop(record.thread, False):
+                    stats.seconds_saved += max(self.compile_times.get(name, 0.0) - elapsed, 0.0)
+                else:
+                    stats.misses += 1
+                    self.compile_times[name] = elapsed
+
+        logger = logging.getLogger(record.name)
+        if record.levelno >= self.levels.get(record.name, logging.NOTSET) and logger.parent is not None:
+            logger.parent.callHandlers(record)
+
+    def reset(self):
+        with self._lock:
+            self.stats[threading.get_ident()] = CacheStats()
+
+    def current(self) -> CacheStats:
+        with self._lock:
+            return self.stats.get(threading.get_ident(), CacheStats())
+
+    def compile_times_snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.compile_times)
+
+
+def initialize(local_dir: str, shared_dir: str = ''):
+    """Enables the persistent compilation cache in `local_dir`, after pulling the entries of
+    `shared_dir` that are missing locally. Call before the backend starts; see the module doc."""
+    import jax
+    from jax.experimental.compilation_cache import compilation_cache as cc
+
+    global _local_dir, _shared_dir, _monitor
+    _local_dir, _shared_dir = local_dir, shared_dir or None
+    os.makedirs(local_dir, exist_ok=True)
+
+    # later versions cache on GPU without the flag, and their XLA may not know it
+    if tuple(map(int, jax.__version__.split('.')[:2])) < (0, 4):
+        flags = os.environ.get('XLA_FLAGS', '')
+        if GPU_CACHE_FLAG not in flags:
+            os.environ['XLA_FLAGS'] = f'{flags} {GPU_CACHE_FLAG}'.strip()
+
+    pulled = _copy_missing(_shared_dir, _local_dir)
+    compile_times = _merge_compile_times(_shared_dir, _local_dir)
+    logging.info(f'Pulled {pulled} compilation cache entries into {local_dir}.')
+
+    cc.initialize_cache(local_dir)
+
+    loggers = [logging.getLogger(name) for name in _LOGGERS]
+    _logger_state.update({l.name: (l.level, l.propagate) for l in loggers})
+    _monitor = _CompileMonitor(compile_times, {l.name: l.getEffectiveLevel() for l in loggers})
+    for logger in loggers:
+        logger.setLevel(logging.DEBUG) # compile times are logged at DEBUG
+        logger.propagate = False
+        logger.addHandler(_monitor)
+
+
+def close():
+    """Stops counting cache hits and restores JAX's loggers. The cache itself stays enabled."""
+    global _monitor
+    if _monitor is None:
+        return
+    for name, (level, propagate) in _logger_state.items():
+        logger = logging.getLogger(name)
+        logger.removeHandler(_monitor)
+        logger.setLevel(level)
+        logger.propagate = propagate
+    _logger_state.clear()
+    _monitor = None
+
+
+def is_initialized() -> bool:
+    return _monitor is not None
+
+
+def begin_task():
+    """Resets the cache statistics of the calling thread."""
+    if _monitor is not None:
+        _monitor.reset()
+
+
+def end_task(task_id) -> CacheStats:
+    """Logs and returns the cache statistics of the calling thread, and pushes new entries to the
+    shared tier."""
+    if _monitor is None:
+        return CacheStats()
+    stats = _monitor.current()
+    logging.info(f'Task {task_id}: {stats.hits} compilation cache hit(s), {stats.misses} miss(es), '
+                 f'{stats.seconds_saved:.1f} compile seconds saved.')
+    push()
+    return stats
+
+
+def push():
+    """Copies new local cache entries and compile times to the shared tier."""
+    if _monitor is None or _shared_dir is None:
+        return
+    try:
+        with _push_lock:
+            _write_compile_times(_local_dir, _monitor.compile_times_snapshot())
+            pushed = _copy_missing(_local_dir, _shared_dir)
+            _merge_compile_times(_local_dir, _shared_dir)
+    except OSError:
+        logging.warning(f'Could not push compilation cache entries to {_shared_dir}.')
+        return
+    if pushed:
+        logging.info(f'Pushed {pushed} compilation cache entries to {_shared_dir}.')
+
+
+def _copy_missing(src_dir: str, dst_dir: str) -> int:
+    """Copies the entries of `src_dir` that `dst_dir` lacks. Entries are written under a temporary
+    name and then renamed, so readers never see a partial entry."""
+    if src_dir is None or not isdir(src_dir):
+        return 0
+    os.makedirs(dst_dir, exist_ok=True)
+    existing = set(os.listdir(dst_dir))
+    copied = 0
+    for name in os.listdir(src_dir):
+        if name in existing or name.startswith('.') or name == COMPILE_TIMES_FNAME:
+            continue
+        tmp = join(dst_dir, f'.{name}.{os.getpid()}.tmp')
+        shutil.copyfile(join(src_dir, name), tmp)
+        os.replace(tmp, join(dst_dir, name))
+        copied += 1
+    return copied
+
+
+def _read_compile_times(dir: str) -> dict:
+    if dir is None or not exists(join(dir, COMPILE_TIMES_FNAME)):
+        return {}
+    try:
+        with open(join(dir, COMPILE_TIMES_FNAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_compile_times(dir: str, compile_times: dict):
+    tmp = join(dir, f'.{COMPILE_TIMES_FNAME}.{os.getpid()}.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(compile_times, f)
+    os.replace(tmp, join(dir, COMPILE_TIMES_FNAME))
+
+
+def _merge_compile_times(src_dir: str, dst_dir: str) -> dict:
+    """Merges the compile times recorded in `src_dir` into those of `dst_dir`."""
+    compile_times = _read_compile_times(dst_dir)
+    compile_times.update(_read_compile_times(src_dir))
+    if dst_dir is not None:
+        _write_compile_times(dst_dir, compile_times)
+    return compile_times
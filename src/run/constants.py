@@ -1,3 +1,4 @@
 CIFAR_FOLDER = "/n/holystore01/LABS/pehlevan_lab/Users/sab/cifar-10-batches-py"
 LOCAL_RESULTS_FOLDER = "results"
-REMOTE_RESULTS_FOLDER = "/n/holystore01/LABS/pehlevan_lab/Users/sab/results"
\ No newline at end of file
+REMOTE_RESULTS_FOLDER = "/n/holystore01/LABS/pehlevan_lab/Users/sab/results"
+PREEMPTED_EXIT_CODE = 75 # main.py exits with this after checkpointing; the sbatch script requeues
\ No newline at end of file
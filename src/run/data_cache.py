@@ -0,0 +1,65 @@
+"""On-disk cache of preprocessed datasets, keyed by the data params and the preprocessing code.
+
+Every job of a sweep loads and preprocesses the same dataset. The final arrays are stored once under
+`<cache dir>/<key>/`, one `.npy` file per array, and later jobs memory-map them instead of
+decoding and preprocessing again. The key hashes the data params together with the source of the
+modules that do the preprocessing, so editing either invalidates the cache. Entries are written
+to a temporary folder and renamed into place, so concurrent jobs never read a partial entry.
+"""
+import hashlib
+import inspect
+import json
+import logging
+import os
+import shutil
+
+from os.path import join, exists
+from types import ModuleType
+from typing import Mapping, Optional, Sequence
+
+import numpy as np
+
+META_FNAME = 'meta.json'
+
+
+def fingerprint(data_params: Mapping, modules: Sequence[ModuleType]) -> str:
+    """Hashes `data_params` and the source of the preprocessing `modules`."""
+    h = hashlib.sha1(json.dumps(dict(data_params), sort_keys=True, default=str).encode())
+    for module in modules:
+        h.update(inspect.getsource(module).encode())
+    return h.hexdigest()[:16]
+
+
+def load(cache_dir: str, key: str) -> Optional[dict]:
+    """Returns the cached dataset `key` as a dict of tuples of memory-mapped arrays, or None."""
+    folder = join(cache_dir, key)
+    if not exists(join(folder, META_FNAME)):
+        return None
+    with open(join(folder, META_FNAME)) as f:
+        meta = json.load(f)
+    return {split: tuple(np.load(join(folder, f'{split}_{i}.npy'), mmap_mode='r') for i in range(n))
+            for split, n in meta['splits'].items()}
+
+
+def save(cache_dir: str, key: str, data: Mapping, data_params: Mapping):
+    """Caches `data`, a mapping from split names to tuples of arrays, as dataset `key`."""
+    folder = join(cache_dir, key)
+    if exists(folder):
+        return
+    tmp = f'{folder}.{os.getpid()}.tmp'
+    os.makedirs(tmp, exist_ok=True)
+    try:
+        for split, arrays in data.items():
+            for i, array in enumerate(arrays):
+                np.save(join(tmp, f'{split}_{i}.npy'), np.asarray(array))
+        with open(join(tmp, META_FNAME), 'w') as f:
+            json.dump(dict(splits={split: len(arrays) for split, arrays in data.items()},
+                           data_params=dict(data_params)), f, indent=1, default=str)
+        os.rename(tmp, folder)
+        logging.info(f'Cached preprocessed data as {folder}.')
+    except OSError:
+        # another job cached the same data first, or the cache is not writable
+        logging.warning(f'Could not cache preprocessed data as {folder}.')
+    finally:
+        if exists(tmp):
+            shutil.rmtree(tmp)
@@ -0,0 +1,63 @@
+"""Record of the trials whose results are saved, so that re-runs only train the missing ones.
+
+The ledger is a JSON-lines file in the results folder, with one entry per finished trial. Trials
+are keyed by a hash of their task's configuration, which leaves out `repeat`, and the trial index.
+Trial `i` of a task always gets the same key (see `TaskRunner.trial_keys`), so raising `repeat`
+only adds trials.
+"""
+import hashlib
+import json
+import logging
+import threading
+
+from os.path import exists
+from typing import Optional
+
+from src.tasks.task import Task
+
+LEDGER_FNAME = 'ledger.jsonl'
+
+
+def task_hash(task: Task, data_params: dict) -> str:
+    """Hashes everything that determines the results of a task's trials."""
+    config = dict(model=task.model, dataset=task.dataset, model_params=task.model_params,
+                  training_params=task.training_params, seed=list(map(int, task.seed)),
+                  data_params=data_params)
+    return hashlib.sha1(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+class Ledger:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._entries = {} # (task hash, trial) -> entry
+        self._folders = {} # task hash -> save folder name
+        self._lock = threading.Lock() # runners on several scheduler threads record trials
+        if exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        self._add(json.loads(line))
+            logging.info(f'Ledger lists {len(self._entries)} finished trial(s).')
+
+    def _add(self, entry: dict):
+        self._entries[entry['task'], entry['trial']] = entry
+        self._folders.setdefault(entry['task'], entry['folder'])
+
+    def is_done(self, task_hash: str, trial: int) -> bool:
+        return (task_hash, trial) in self._entries
+
+    def folder(self, task_hash: str) -> Optional[str]:
+        """Returns the name of the folder that the trials of the task were saved in, if any."""
+        return self._folders.get(task_hash)
+
+    def is_folder_taken(self, folder: str, task_hash: str) -> bool:
+        """Whether `folder` holds the trials of a task other than `task_hash`."""
+        return any(f == folder and h != task_hash for h, f in self._folders.items())
+
+    def record(self, task_hash: str, trial: int, folder: str, fname: Optional[str] = None):
+        # `fname` is the file the result was saved in, or None if it was saved into a result store
+        entry = dict(task=task_hash, trial=trial, folder=folder, file=fname)
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+            self._add(entry)
@@ -0,0 +1,156 @@
+"""Append-only container that packs the files of a run's finished tasks into one data file.
+
+A results folder otherwise holds many small files per task (configs, the columns of the result
+store, one file per parameter), and on the shared filesystem their metadata operations dominate.
+`TaskRunner` appends a task folder's files to `results.pack` once all of the task's trials are
+done, and then removes the folder. `results.pack.index` lists each file's name, offset, size and
+sha256, one JSON line per file. Both files only grow, so a sync copies just their new bytes, and
+readers ignore index entries whose bytes are not all there yet.
+"""
+import hashlib
+import io
+import json
+import os
+import threading
+
+from functools import lru_cache
+
+from os.path import join, exists, relpath
+from typing import Optional
+
+import numpy as np
+
+PACK_FNAME = 'results.pack'
+INDEX_FNAME = 'results.pack.index'
+CHUNK_BYTES = 2 ** 20
+
+
+def _read_index(folder: str) -> tuple[dict, int]:
+    """Returns the complete entries of the index in `folder` by name, the last entry of a name
+    winning, and the length of the index up to its last complete line."""
+    entries, length = {}, 0
+    path = join(folder, INDEX_FNAME)
+    if not exists(path):
+        return entries, length
+    data_size = os.path.getsize(join(folder, PACK_FNAME)) if exists(join(folder, PACK_FNAME)) else 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                break # cut off by a crash or an unfinished sync
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            if entry['offset'] + entry['size'] > data_size:
+                break
+            entries[entry['name']] = entry
+            length += len(line)
+    return entries, length
+
+
+def has_pack(folder: str) -> bool:
+    return exists(join(folder, INDEX_FNAME))
+
+
+class PackWriter:
+    """Appends files to the pack in the results folder `folder`. Bytes left after the last
+    complete index entry, e.g. by a job killed while packing, are dropped when it is opened."""
+    def __init__(self, folder: str) -> None:
+        self.folder = folder
+        self._lock = threading.Lock() # runners on several scheduler threads pack tasks
+        self.entries, index_length = _read_index(folder)
+        self._end = max((e['offset'] + e['size'] for e in self.entries.values()), default=0)
+        for fname, length in ((PACK_FNAME, self._end), (INDEX_FNAME, index_length)):
+            with open(join(folder, fname), 'ab') as f:
+                f.truncate(length)
+
+    def has_folder(self, name: str) -> bool:
+        return any(entry.startswith(name + '/') for entry in self.entries)
+
+    def add_file(self, name: str, path: str):
+        """Appends the file at `path` under `name`."""
+        with self._lock:
+            checksum, size = hashlib.sha256(), 0
+            with open(path, 'rb') as fin, open(join(self.folder, PACK_FNAME), 'ab') as fout:
+                while chunk := fin.read(CHUNK_BYTES):
+                    fout.write(chunk)
+                    checksum.update(chunk)
+                    size += len(chunk)
+                fout.flush()
+                os.fsync(fout.fileno())
+            # the data is on disk before the index lists it
+            entry = dict(name=name, offset=self._end, size=size, sha256=checksum.hexdigest())
+            with open(join(self.folder, INDEX_FNAME), 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+            self.entries[name] = entry
+            self._end += size
+
+    def add_folder(self, folder: str, name: str) -> int:
+        """Appends every file in `folder` as `name/<path relative to folder>`. Returns their number."""
+        paths = sorted(join(root, fname) for root, _, fnames in os.walk(folder) for fname in fnames)
+        for path in paths:
+            self.add_file(f'{name}/' + relpath(path, folder).replace(os.sep, '/'), path)
+        return len(paths)
+
+
+class PackReader:
+    """Random access to the files in the pack of the results folder `folder`."""
+    def __init__(self, folder: str) -> None:
+        self.folder = folder
+        self.entries, _ = _read_index(folder)
+        self.path = join(folder, PACK_FNAME)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.entries
+
+    def folders(self) -> list[str]:
+        """Names of the task folders in the pack."""
+        return sorted({name.split('/', 1)[0] for name in self.entries if '/' in name})
+
+    def read(self, name: str, verify: bool = False) -> bytes:
+        entry = self.entries[name]
+        with open(self.path, 'rb') as f:
+            f.seek(entry['offset'])
+            data = f.read(entry['size'])
+        if verify and hashlib.sha256(data).hexdigest() != entry['sha256']:
+            raise OSError(f'Checksum mismatch for {name} in {self.path}.')
+        return data
+
+    def extract(self, name: str, folder: str) -> int:
+        """Writes the files of the packed folder `name` into `folder`. Returns their number."""
+        names = [n for n in self.entries if n.startswith(name + '/')]
+        for n in names:
+            path = join(folder, *n[len(name) + 1:].split('/'))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(self.read(n, verify=True))
+        return len(names)
+
+    def load(self, name: str, mmap: bool = True) -> np.ndarray:
+        """Loads the `.npy` file `name`, memory-mapped from the pack unless `mmap` is False."""
+        if not mmap:
+            return np.load(io.BytesIO(self.read(name)))
+        entry = self.entries[name]
+        with open(self.path, 'rb') as f:
+            f.seek(entry['offset'])
+            version = np.lib.format.read_magic(f)
+            read_header = (np.lib.format.read_array_header_1_0 if version == (1, 0)
+                           else np.lib.format.read_array_header_2_0)
+            shape, fortran_order, dtype = read_header(f)
+            header_size = f.tell() - entry['offset']
+        return np.memmap(self.path, dtype=dtype, mode='r', shape=shape,
+                         order='F' if fortran_order else 'C', offset=entry['offset'] + header_size)
+
+
+def open_pack(folder: str) -> Optional[PackReader]:
+    """The reader of the pack in `folder`, if any. Readers are reused until the pack grows."""
+    if not has_pack(folder):
+        return None
+    sizes = [os.path.getsize(join(folder, fname)) if exists(join(folder, fname)) else 0
+                for fname in (PACK_FNAME, INDEX_FNAME)]
+    return _reader(folder, *sizes)
+
+
+@lru_cache(maxsize=64)
+def _reader(folder: str, *_version) -> PackReader:
+    return PackReader(folder)
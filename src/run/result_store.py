@@ -0,0 +1,256 @@
+"""Columnar store for the results of a task's trials.
+
+Each field of `Result` is stacked along a leading trial axis into one `.npy` file in the task
+folder, so a reader can memory-map a single metric without unpickling whole results. `test_y` is
+the same for every trial and is stored once, and `params_f` goes into an optional `params/` folder
+with one file per parameter. `meta.json` describes the fields; `done.npy` marks the rows that hold
+a finished trial. Only numpy is needed to read a store.
+
+Once a task is complete, its folder may be moved into the run's pack (see `src.run.pack`); the
+readers here find it there.
+"""
+import json
+import os
+import threading
+
+from os import listdir
+from os.path import join, exists, isdir, basename, dirname, normpath
+from typing import Mapping, Optional
+
+import numpy as np
+
+from src.run.pack import PackReader, open_pack
+
+META_FNAME = 'meta.json'
+DONE_FNAME = 'done.npy'
+PARAMS_DIR = 'params'
+SHARED_FIELDS = ('test_y', 'eval_epochs') # stored once per task
+PARAMS_FIELD = 'params_f'
+VERSION = 1
+
+
+def _packed(folder: str) -> Optional[PackReader]:
+    """The pack holding the task folder `folder`, if it was packed."""
+    folder = normpath(folder)
+    pack = open_pack(dirname(folder))
+    return pack if pack is not None and f'{basename(folder)}/{META_FNAME}' in pack else None
+
+
+def is_store(folder: str) -> bool:
+    return exists(join(folder, META_FNAME)) or _packed(folder) is not None
+
+
+def task_folders(results_folder: str) -> list[str]:
+    """Names of the task folders in `results_folder`, whether packed or not."""
+    names = {name for name in listdir(results_folder)
+                if name.startswith('task-') and isdir(join(results_folder, name))}
+    pack = open_pack(results_folder)
+    if pack is not None:
+        names.update(pack.folders())
+    return sorted(names)
+
+
+def read_file(folder: str, fname: str) -> bytes:
+    """Reads the file `fname` of the task folder `folder`, whether packed or not."""
+    if exists(join(folder, fname)):
+        with open(join(folder, fname), 'rb') as f:
+            return f.read()
+    pack = open_pack(dirname(normpath(folder)))
+    if pack is None or f'{basename(normpath(folder))}/{fname}' not in pack:
+        raise FileNotFoundError(join(folder, fname))
+    return pack.read(f'{basename(normpath(folder))}/{fname}')
+
+
+def flatten(tree: Mapping, prefix: str = '') -> dict:
+    """Flattens nested mappings into a dict keyed by '/'-joined paths."""
+    flat = {}
+    for key, value in tree.items():
+        path = f'{prefix}{key}'
+        if isinstance(value, Mapping):
+            flat.update(flatten(value, path + '/'))
+        else:
+            flat[path] = value
+    return flat
+
+
+def unflatten(flat: Mapping) -> dict:
+    tree = {}
+    for path, value in flat.items():
+        *parents, name = path.split('/')
+        node = tree
+        for parent in parents:
+            node = node.setdefault(parent, {})
+        node[name] = value
+    return tree
+
+
+def _empty(dtype) -> object:
+    return np.nan if np.issubdtype(dtype, np.inexact) else 0
+
+
+class TaskStoreWriter:
+    """Writes trials into the store in `folder`, creating it or growing it to `num_trials` rows.
+    Trials may be written in any order and from several threads."""
+    def __init__(self, folder: str, num_trials: int, save_params: bool = True) -> None:
+        self.folder = folder
+        self.save_params = save_params
+        self._lock = threading.Lock()
+        if exists(join(folder, META_FNAME)):
+            with open(join(folder, META_FNAME)) as f:
+                self.meta = json.load(f)
+        else:
+            self.meta = dict(version=VERSION, num_trials=0, fields={}, params={}, eval_epochs=None)
+            os.makedirs(folder, exist_ok=True)
+        self._arrays = {} # file name -> writable memmap
+        self._resize(max(num_trials, self.meta['num_trials']))
+
+    def is_done(self, trial: int) -> bool:
+        return trial < self.meta['num_trials'] and bool(self._array(DONE_FNAME, np.bool_, ())[trial])
+
+    def write(self, trial: int, result: Mapping):
+        """Writes the fields of `result`, a `Result` or a mapping of its fields, into row `trial`."""
+        if trial >= self.meta['num_trials']:
+            raise IndexError(f'Trial {trial} does not fit in a store of {self.meta["num_trials"]} trials.')
+        with self._lock:
+            for name, value in result.items():
+                if value is None:
+                    continue
+                if name == PARAMS_FIELD:
+                    if self.save_params:
+                        for path, leaf in flatten(value).items():
+                            self._write_row(self.meta['params'], path, join(PARAMS_DIR, f'{path}.npy'), trial, leaf)
+                elif name == 'eval_epochs':
+                    self.meta['eval_epochs'] = np.asarray(value).tolist()
+                elif name in SHARED_FIELDS:
+                    if not exists(join(self.folder, f'{name}.npy')):
+                        np.save(join(self.folder, f'{name}.npy'), np.asarray(value))
+                else:
+                    self._write_row(self.meta['fields'], name, f'{name}.npy', trial, value)
+            done = self._array(DONE_FNAME, np.bool_, ())
+            done[trial] = True
+            for array in self._arrays.values():
+                array.flush()
+            self._write_meta()
+
+    def _write_row(self, fields: dict, name: str, fname: str, trial: int, value):
+        value = np.asarray(value)
+        if name not in fields:
+            fields[name] = dict(dtype=value.dtype.str, shape=list(value.shape), file=fname)
+        spec = fields[name]
+        self._array(fname, np.dtype(spec['dtype']), tuple(spec['shape']))[trial] = value
+
+    def _array(self, fname: str, dtype, shape: tuple) -> np.memmap:
+        if fname not in self._arrays:
+            path = join(self.folder, fname)
+            if exists(path):
+                self._arrays[fname] = np.load(path, mmap_mode='r+')
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                array = np.lib.format.open_memmap(path, mode='w+', dtype=dtype,
+                                                  shape=(self.meta['num_trials'], *shape))
+                array[:] = _empty(dtype)
+                self._arrays[fname] = array
+        return self._arrays[fname]
+
+    def _resize(self, num_trials: int):
+        """Grows every array to `num_trials` rows; new rows are empty."""
+        old = self.meta['num_trials']
+        if num_trials > old:
+            specs = [(DONE_FNAME, np.dtype(np.bool_))] if exists(join(self.folder, DONE_FNAME)) else []
+            specs += [(spec['file'], np.dtype(spec['dtype']))
+                        for spec in (*self.meta['fields'].values(), *self.meta['params'].values())]
+            for fname, dtype in specs:
+                path = join(self.folder, fname)
+                previous = np.load(path, mmap_mode='r')
+                tmp = f'{path}.{os.getpid()}.tmp'
+                grown = np.lib.format.open_memmap(tmp, mode='w+', dtype=dtype,
+                                                  shape=(num_trials, *previous.shape[1:]))
+                grown[:old] = previous
+                grown[old:] = _empty(dtype)
+                grown.flush()
+                del grown, previous
+                os.replace(tmp, path)
+            self.meta['num_trials'] = num_trials
+        self._write_meta()
+
+    def _write_meta(self):
+        tmp = join(self.folder, f'.{META_FNAME}.{os.getpid()}.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.meta, f, indent=1)
+        os.replace(tmp, join(self.folder, META_FNAME))
+
+
+class TaskResults:
+    """Read-only view of the store in `folder`, or of the store packed into `pack`. Fields are
+    memory-mapped when first accessed, and indexed by the finished trials in `trials`."""
+    def __init__(self, folder: str, pack: Optional[PackReader] = None) -> None:
+        self.folder = folder
+        self.pack = pack
+        self.meta = json.loads(self._read(META_FNAME))
+        self.done = (np.array(self._load(DONE_FNAME)) if self._exists(DONE_FNAME)
+                        else np.zeros(self.meta['num_trials'], bool))
+        self.trials = np.flatnonzero(self.done)
+
+    def _name(self, fname: str) -> str:
+        return f'{basename(normpath(self.folder))}/{fname}'
+
+    def _exists(self, fname: str) -> bool:
+        return self._name(fname) in self.pack if self.pack is not None else exists(join(self.folder, fname))
+
+    def _read(self, fname: str) -> bytes:
+        if self.pack is not None:
+            return self.pack.read(self._name(fname))
+        with open(join(self.folder, fname), 'rb') as f:
+            return f.read()
+
+    def _load(self, fname: str) -> np.ndarray:
+        if self.pack is not None:
+            return self.pack.load(self._name(fname))
+        return np.load(join(self.folder, fname), mmap_mode='r')
+
+    @property
+    def fields(self) -> list[str]:
+        return list(self.meta['fields'])
+
+    @property
+    def eval_epochs(self) -> Optional[np.ndarray]:
+        epochs = self.meta.get('eval_epochs')
+        return None if epochs is None else np.asarray(epochs)
+
+    @property
+    def test_y(self) -> Optional[np.ndarray]:
+        return self._load('test_y.npy') if self._exists('test_y.npy') else None
+
+    def field(self, name: str, rows: bool = False) -> np.ndarray:
+        """Returns field `name` of the finished trials. With `rows`, returns all rows, including
+        the empty rows of unfinished trials, as a memory map."""
+        if name in SHARED_FIELDS:
+            return self.eval_epochs if name == 'eval_epochs' else self.test_y
+        array = self._load(self.meta['fields'][name]['file'])
+        return array if rows or self.done.all() else array[self.trials]
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.field(name)
+
+    def params(self, trial: Optional[int] = None) -> Optional[dict]:
+        """Returns the final params of `trial`, or of every finished trial stacked, as nested dicts;
+        None if params were not saved."""
+        if not self.meta['params']:
+            return None
+        flat = {}
+        for path, spec in self.meta['params'].items():
+            array = self._load(spec['file'])
+            flat[path] = array[self.trials] if trial is None else array[trial]
+        return unflatten(flat)
+
+    def __len__(self) -> int:
+        return len(self.trials)
+
+
+def load_task(folder: str) -> TaskResults:
+    if exists(join(folder, META_FNAME)):
+        return TaskResults(folder)
+    pack = _packed(folder)
+    if pack is None:
+        raise FileNotFoundError(f'No result store in {folder}.')
+    return TaskResults(folder, pack)
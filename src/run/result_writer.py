@@ -0,0 +1,68 @@
+import logging
+import queue
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from jax import device_get
+
+from src.experiment.training.Result import Result, unbatch
+
+
+class ResultWriter:
+    """Saves batched results in the background, so the next batch of trials can train meanwhile.
+    Each batch is fetched from the devices in one transfer when it is submitted, so queued results
+    hold no device memory. It is split into trials on the host, and the trials are saved on a
+    thread pool. At most `max_pending` batches wait to be saved; `submit` blocks when that many
+    are waiting, which caps the host memory held by unsaved results."""
+    def __init__(self, save: Callable, max_pending: int = 2, num_workers: int = 4) -> None:
+        self._save = save # (target, result) -> None
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._pool = ThreadPoolExecutor(max_workers=num_workers)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, batched_result: Result, targets: list):
+        """Queues `batched_result` for saving; `targets` says where each of its trials goes, in
+        device-major order."""
+        self._raise_error()
+        self._queue.put((device_get(batched_result), targets))
+
+    def close(self, raise_errors: bool = True):
+        """Waits until everything submitted is saved. A failed save is raised, or only logged 
+        without `raise_errors`."""
+        self._queue.put(None)
+        self._thread.join()
+        self._pool.shutdown()
+        if raise_errors:
+            self._raise_error()
+        elif self._error is not None:
+            logging.error(f'Some results were not saved: {self._error!r}')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # a failed save must not hide the exception that ended the block, e.g. `Preempted`
+        self.close(raise_errors=exc_type is None)
+
+    def _run(self):
+        while (item := self._queue.get()) is not None:
+            if self._error is not None:
+                continue # drain the queue, so that `submit` does not block
+            batched_result, targets = item
+            try:
+                results = unbatch(batched_result)
+                futures = [self._pool.submit(self._save, target, result)
+                            for target, result in zip(targets, results)]
+                for future in futures:
+                    future.result()
+            except BaseException as e:
+                logging.error('Could not save a batch of results.')
+                self._error = e
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
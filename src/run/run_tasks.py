@@ -1,29 +1,17 @@
-from functools import partial
-import time
-
 from src.tasks.task import Task
 from src.run.PreprocessDevice import PreprocessDevice
-from src.run.TaskRunner import TaskRunner
+from src.run.scheduler import Scheduler
+from src.run.ledger import Ledger
+from src.run.catalog import Catalog
+from src.run.pack import PackWriter
 
-from logging import info, error
 
-def _run_task(task: Task, runner: TaskRunner):
-    info(f'Task {task._id} starting...')
-    start = time.time()
-    try:
-        if task.parallelize:
-            runner.run_repeat_task(task)
-        else:
-            runner.run_serial_task(task)
-    except BaseException as e:
-            error(f'Task {task._id} raised an exception.') 
-            raise
-    end = time.time()
-    elapsed = end - start
-    info(f'Task {task._id} completed. Elapsed time (s): {elapsed}.')
+def run_tasks(tasks: list[Task], specs: PreprocessDevice, devices_per_task: int = 0, ledger: Ledger = None, 
+              save_params: bool = True, catalog: Catalog = None, pack: PackWriter = None):
+    scheduler = Scheduler(specs, devices_per_task, ledger, save_params, catalog, pack)
+    scheduler.run(tasks)
 
-def run_tasks(tasks: list[Task], specs: PreprocessDevice):
-    runner = TaskRunner(specs)
 
-    for task in tasks:
-        _run_task(task, runner)
+def prewarm_tasks(tasks: list[Task], specs: PreprocessDevice, devices_per_task: int = 0):
+    scheduler = Scheduler(specs, devices_per_task)
+    scheduler.prewarm(tasks)
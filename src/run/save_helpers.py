@@ -18,6 +18,7 @@ import src.run.constants as constants
 def copy_results_into_permanent(local_results_folder, remote_results_dirname, 
                                 remote_results_directory = constants.REMOTE_RESULTS_FOLDER):
     """Copies the contents of 'local_results_folder' to a folder named 
-        'remote_results_dirname' located within 'remote_results_directory'."""
+        'remote_results_dirname' located within 'remote_results_directory'. Files already in 
+        that folder are kept unless the local folder has a file of the same name."""
     RESULTS_FOLDER = os.path.join(remote_results_directory, remote_results_dirname)
-    return shutil.copytree(local_results_folder, RESULTS_FOLDER)
\ No newline at end of file
+    return shutil.copytree(local_results_folder, RESULTS_FOLDER, dirs_exist_ok=True)
\ No newline at end of file
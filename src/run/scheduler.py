@@ -0,0 +1,102 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from src.tasks.task import Task, Status
+from src.tasks.build_task_graph import order_tasks
+from src.run.PreprocessDevice import PreprocessDevice
+from src.run.TaskRunner import TaskRunner
+from src.run.ledger import Ledger
+from src.run.catalog import Catalog
+from src.run.pack import PackWriter
+from src.run import compilation_cache
+
+from logging import info, error
+
+
+def split_devices(devices, devices_per_task: int) -> list[tuple]:
+    """Splits `devices` into disjoint pools of `devices_per_task` devices. A non-positive
+    `devices_per_task` places every device into a single pool."""
+    devices = tuple(devices)
+    if devices_per_task <= 0 or devices_per_task >= len(devices):
+        return [devices]
+    if len(devices) % devices_per_task != 0:
+        raise ValueError(f"'devices_per_task' ({devices_per_task}) does not divide the number of devices ({len(devices)}).")
+    return [devices[i:i + devices_per_task] for i in range(0, len(devices), devices_per_task)]
+
+
+def _run_task(task: Task, runner: TaskRunner):
+    info(f'Task {task._id} starting on {len(runner.devices)} device(s)...')
+    start = time.time()
+    compilation_cache.begin_task()
+    try:
+        if task.parallelize:
+            runner.run_repeat_task(task)
+        else:
+            runner.run_serial_task(task)
+    except BaseException:
+        error(f'Task {task._id} raised an exception.')
+        raise
+    finally:
+        # a preempted task's programs are pushed too, so the requeued job does not compile them again
+        compilation_cache.end_task(task._id)
+    end = time.time()
+    elapsed = end - start
+    info(f'Task {task._id} completed. Elapsed time (s): {elapsed}.')
+
+
+class Scheduler:
+    """Runs tasks concurrently on disjoint pools of devices. A task is submitted to a free pool
+    once all of its dependencies are done; among ready tasks, topological order is kept."""
+    def __init__(self, PD: PreprocessDevice, devices_per_task: int = 0, ledger: Ledger = None, 
+                 save_params: bool = True, catalog: Catalog = None, pack: PackWriter = None) -> None:
+        self.preprocess_device = PD
+        self.pools = split_devices(PD.devices, devices_per_task)
+        self.runners = [TaskRunner(PD, pool, ledger, save_params, catalog, pack) for pool in self.pools]
+
+    def run(self, tasks: list[Task]):
+        by_id = {task._id: task for task in tasks}
+        for task in tasks:
+            unknown = set(task.dependencies) - by_id.keys()
+            if unknown:
+                raise ValueError(f'Task {task._id} depends on unknown task(s) {sorted(unknown)}.')
+
+        order = order_tasks({task._id: set(task.dependencies) for task in tasks})
+        waiting = [by_id[i] for i in order]
+
+        free_runners = list(self.runners)
+        running = {} # future -> (task, runner)
+
+        with ThreadPoolExecutor(max_workers=len(self.runners)) as executor:
+            while waiting or running:
+                for task in [t for t in waiting if self._is_ready(t, by_id)]:
+                    if not free_runners:
+                        break
+                    runner = free_runners.pop(0)
+                    waiting.remove(task)
+                    task._status = Status.SUBMITTED
+                    running[executor.submit(_run_task, task, runner)] = (task, runner)
+
+                if not running:
+                    raise RuntimeError('No task is ready to run, but some tasks are still waiting.')
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task, runner = running.pop(future)
+                    free_runners.append(runner)
+                    future.result() # re-raises; running tasks finish before the executor exits
+                    task._status = Status.DONE
+
+    def prewarm(self, tasks: list[Task]):
+        """Compiles the programs that `tasks` need on every pool, ignoring dependencies. Nothing 
+        is saved."""
+        def prewarm_pool(runner: TaskRunner):
+            for task in tasks:
+                runner.prewarm_task(task)
+
+        with ThreadPoolExecutor(max_workers=len(self.runners)) as executor:
+            for future in [executor.submit(prewarm_pool, runner) for runner in self.runners]:
+                future.result()
+
+    @staticmethod
+    def _is_ready(task: Task, by_id: dict) -> bool:
+        return all(by_id[d]._status is Status.DONE for d in task.dependencies)
@@ -0,0 +1,253 @@
+"""Background mirroring of the local results folder to permanent storage while tasks run.
+
+Every `interval` seconds, the files that are new or changed since they were last synced are copied.
+A file is written under a temporary name, its checksum is compared with the source's, and it is
+then renamed into place, so the permanent folder never holds a partial file. Failed copies are
+retried with exponential backoff, and the copy rate can be capped. `finish` copies what is left.
+`restore` first copies the results of earlier runs back, so that a re-run extends them.
+
+Files that only grow, like the run's pack (see `src.run.pack`), can be listed as `append_only`:
+only their new bytes are appended to the permanent copy, provided it is a prefix of the local file.
+It is not when the local file was cut back since the last sync, e.g. when a requeued job drops an
+unfinished pack entry, and the file is then copied whole. Files that the syncer copied and that are
+then removed locally, like the folders of packed tasks, are removed from permanent storage too.
+
+Files that are changed in place while they are read, like the SQLite catalog, get a snapshot
+writer (see `add_snapshot`): the syncer copies a consistent snapshot rather than the live file.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from os.path import join, relpath, dirname, exists, getsize
+from typing import Callable, Optional, Sequence
+
+CHUNK_BYTES = 2 ** 20
+# SQLite's side files, whose changes the snapshot of a database already holds
+SQLITE_SIDE_FILES = ('-journal', '-wal', '-shm')
+
+
+class ResultSyncer:
+    def __init__(self, local_dir: str, remote_dir: str, interval: float = 300.0,
+                 max_bytes_per_second: float = 0, retries: int = 5, backoff: float = 2.0,
+                 append_only: Sequence[str] = ()) -> None:
+        self.local_dir = local_dir
+        self.remote_dir = remote_dir
+        self.interval = interval
+        self.max_bytes_per_second = max_bytes_per_second # 0 does not cap
+        self.retries = retries
+        self.backoff = backoff
+        self.append_only = set(append_only) # relative paths
+        self._synced = {} # relative path -> (size, mtime) of the last synced version
+        self._prefixes = {} # destination of an append-only file -> size known to match its source
+        self._snapshots = {} # relative path -> function that writes a snapshot to a given path
+        self._stop = threading.Event()
+        self._lock = threading.Lock() # one pass at a time
+        self._thread = None
+
+    def add_snapshot(self, path: str, write: Callable[[str], None]):
+        """Syncs the local file `path` by copying what `write(snapshot_path)` writes instead of
+        the file itself. The file's SQLite side files are not synced."""
+        self._snapshots[path] = write
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def finish(self) -> int:
+        """Stops the background thread and syncs the remaining files. Returns their number."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.sync()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sync()
+            except OSError:
+                logging.warning(f'Could not sync {self.local_dir} to {self.remote_dir}; will retry.')
+
+    def restore(self) -> int:
+        """Copies the files of the remote folder that are missing locally, e.g. the results of an
+        earlier run into the same folder. Returns their number."""
+        if not os.path.isdir(self.remote_dir):
+            return 0
+        with self._lock:
+            restored = 0
+            for path in _files(self.remote_dir):
+                # a side file copied mid-transaction would make SQLite roll the database back
+                if path.endswith(SQLITE_SIDE_FILES):
+                    continue
+                if not exists(join(self.local_dir, path)):
+                    self._copy_with_retries(path, self.remote_dir, self.local_dir)
+                    self._synced[path] = self._version(path)
+                    restored += 1
+            if restored:
+                logging.info(f'Restored {restored} file(s) from {self.remote_dir}.')
+            return restored
+
+    def pending(self) -> list[str]:
+        """Relative paths of the local files that are new or changed since they were last synced."""
+        side_files = {path + suffix for path in self._snapshots for suffix in SQLITE_SIDE_FILES}
+        files = []
+        for path in _files(self.local_dir):
+            if path in side_files:
+                continue
+            try:
+                version = self._version(path)
+            except FileNotFoundError:
+                continue
+            if self._synced.get(path) != version:
+                files.append(path)
+        return files
+
+    def sync(self) -> int:
+        """Copies the pending files and removes the permanent copies of the files removed locally.
+        Returns the number of files copied."""
+        with self._lock:
+            # listed before the copies, so that what replaced them, e.g. a pack, is copied first
+            removed = [path for path in self._synced if not exists(join(self.local_dir, path))]
+            copied = 0
+            for path in self.pending():
+                try:
+                    version = self._version(path)
+                    self._copy_with_retries(path, self.local_dir, self.remote_dir)
+                except FileNotFoundError:
+                    continue # removed while the pass ran; see the next pass
+                self._synced[path] = version
+                copied += 1
+            for path in removed:
+                self._remove(path)
+            if copied or removed:
+                logging.info(f'Synced {copied} file(s) to {self.remote_dir}, removed {len(removed)}.')
+            return copied
+
+    def _remove(self, path: str):
+        """Removes the permanent copy of `path`, and its folders once they are empty."""
+        del self._synced[path]
+        try:
+            os.remove(join(self.remote_dir, path))
+        except FileNotFoundError:
+            pass
+        folder = dirname(path)
+        while folder:
+            try:
+                os.rmdir(join(self.remote_dir, folder))
+            except OSError:
+                break # not empty
+            folder = dirname(folder)
+
+    def _version(self, path: str) -> tuple:
+        stat = os.stat(join(self.local_dir, path))
+        return stat.st_size, stat.st_mtime_ns
+
+    def _copy_with_retries(self, path: str, src_dir: str, dst_dir: str):
+        delay = 1.0
+        for attempt in range(self.retries + 1):
+            try:
+                return self._copy(path, src_dir, dst_dir)
+            except OSError:
+                if not exists(join(src_dir, path)):
+                    raise FileNotFoundError(join(src_dir, path))
+                if attempt == self.retries:
+                    logging.error(f'Could not sync {path} after {self.retries + 1} attempts.')
+                    raise
+                logging.warning(f'Could not sync {path}; retrying in {delay:.0f} s.')
+                time.sleep(delay)
+                delay *= self.backoff
+
+    def _copy(self, path: str, src_dir: str, dst_dir: str):
+        src, dst = join(src_dir, path), join(dst_dir, path)
+        if path in self.append_only and exists(dst) and self._is_prefix(src, dst):
+            self._append(src, dst)
+            self._prefixes[dst] = getsize(dst)
+            return
+        if src_dir == self.local_dir and path in self._snapshots:
+            snapshot = join(dirname(src), f'.{os.path.basename(src)}.{os.getpid()}.snapshot')
+            try:
+                self._snapshots[path](snapshot)
+                return self._copy_whole(snapshot, dst)
+            finally:
+                if exists(snapshot):
+                    os.remove(snapshot)
+        self._copy_whole(src, dst)
+
+    def _copy_whole(self, src: str, dst: str):
+        os.makedirs(dirname(dst), exist_ok=True)
+        tmp = join(dirname(dst), f'.{os.path.basename(dst)}.{os.getpid()}.tmp')
+        checksum = hashlib.sha256()
+        start, copied = time.monotonic(), 0
+        try:
+            with open(src, 'rb') as fin, open(tmp, 'wb') as fout:
+                while chunk := fin.read(CHUNK_BYTES):
+                    fout.write(chunk)
+                    checksum.update(chunk)
+                    copied += len(chunk)
+                    self._throttle(copied, start)
+            if file_checksum(tmp) != checksum.hexdigest():
+                raise OSError(f'Checksum mismatch for {dst}.')
+            os.replace(tmp, dst)
+            self._prefixes[dst] = copied
+        finally:
+            if exists(tmp):
+                os.remove(tmp)
+
+    def _is_prefix(self, src: str, dst: str) -> bool:
+        """Whether `dst` holds the first bytes of `src`. Checked by checksum unless `dst` has not
+        changed since this syncer last wrote it, as `src` only grows while the syncer runs."""
+        size = getsize(dst)
+        if size > getsize(src):
+            return False
+        if self._prefixes.get(dst) == size:
+            return True
+        return file_checksum(dst) == file_checksum(src, length=size)
+
+    def _append(self, src: str, dst: str):
+        """Appends the bytes of `src` past the end of `dst` to `dst`."""
+        offset = getsize(dst)
+        checksum = hashlib.sha256()
+        start, copied = time.monotonic(), 0
+        try:
+            with open(src, 'rb') as fin, open(dst, 'ab') as fout:
+                fin.seek(offset)
+                while chunk := fin.read(CHUNK_BYTES):
+                    fout.write(chunk)
+                    checksum.update(chunk)
+                    copied += len(chunk)
+                    self._throttle(copied, start)
+            if file_checksum(dst, offset) != checksum.hexdigest():
+                raise OSError(f'Checksum mismatch for {dst}.')
+        except OSError:
+            with open(dst, 'ab') as f:
+                f.truncate(offset)
+            raise
+
+    def _throttle(self, copied: int, start: float):
+        if self.max_bytes_per_second > 0:
+            ahead = copied / self.max_bytes_per_second - (time.monotonic() - start)
+            if ahead > 0:
+                time.sleep(ahead)
+
+
+def _files(folder: str) -> list[str]:
+    """Relative paths of the files in `folder`, leaving out the temporary files of atomic writes."""
+    files = []
+    for root, _, names in os.walk(folder):
+        files += [relpath(join(root, name), folder) for name in names
+                    if not (name.startswith('.') or name.endswith('.tmp'))]
+    return sorted(files)
+
+
+def file_checksum(path: str, offset: int = 0, length: Optional[int] = None) -> str:
+    """sha256 of the bytes of `path` from `offset` on, or of the `length` bytes from `offset`."""
+    checksum = hashlib.sha256()
+    remaining = float('inf') if length is None else length
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        while remaining > 0 and (chunk := f.read(int(min(CHUNK_BYTES, remaining)))):
+            checksum.update(chunk)
+            remaining -= len(chunk)
+    return checksum.hexdigest()
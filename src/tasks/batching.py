@@ -0,0 +1,18 @@
+def pack_trials(num_trials: int, num_devices: int, replicas_per_device: int = 1) -> list[tuple[int, int, int]]:
+    """Packs trials into batches of `(first trial, number of devices, replicas per device)`. 
+    Trials left over after the full batches run with fewer replicas per device, and finally on a 
+    subset of the devices, so that no pmap replica is idle."""
+    batch_size = num_devices * replicas_per_device
+    batches = [(start, num_devices, replicas_per_device) 
+                for start in range(0, num_trials - batch_size + 1, batch_size)]
+    start = len(batches) * batch_size
+    
+    replicas = (num_trials - start) // num_devices
+    if replicas:
+        batches.append((start, num_devices, replicas))
+        start += num_devices * replicas
+    
+    remainder = num_trials - start
+    if remainder:
+        batches.append((start, remainder, 1))
+    return batches
@@ -1,16 +1,30 @@
 from abc import abstractmethod, ABC
+from logging import info
 from typing import Mapping
 
 from src.tasks.task import Task
 from src.tasks.build_task_graph import order_tasks
+from src.tasks.batching import pack_trials
 
 from jax import device_count
 
 
 class TaskReader(ABC):
-    def __init__(self, config_list: list[Mapping]):
-        self.tasks = config_list
+    # (section, name) pairs of scalars that the apply callback accepts per trial; tasks that differ
+    # only in these, their seeds and their repeats can be fused into a single task
+    batched_hyperparams: tuple = ()
+    # (section, name) pairs of hyperparameters that fix the shapes of the compiled programs; tasks
+    # are ordered by these so that tasks sharing compiled programs run back to back
+    shape_hyperparams: tuple = ()
+
+    def __init__(self, config_list: list[Mapping], data_params: Mapping = None, fuse: bool = False, 
+                 devices_per_task: int = 0):
         self._num_devices = device_count()
+        self.data_params = data_params
+        self.fuse = fuse
+        # the devices each task is pmapped over; see `scheduler.split_devices`
+        self._task_devices = devices_per_task if 0 < devices_per_task < self._num_devices else self._num_devices
+        self.tasks = config_list
 
     @property
     def tasks(self) -> tuple[Task]:
@@ -26,9 +40,73 @@ class TaskReader(ABC):
 
     def _read_tasks(self, config_list: list[Mapping]) -> tuple:
         task_tuple = tuple(self._read_task(hp) for hp in config_list)
-        map(self.validate_task, task_tuple)
+        # dependencies are configured as indices into the task list
+        for task in task_tuple:
+            task.dependencies = {task_tuple[i]._id for i in task.dependencies}
+        for task in task_tuple:
+            self.validate_task(task)
         order_tasks(dict(map(lambda t: (t._id, t.dependencies), task_tuple)))
-        return task_tuple
+        if self.fuse:
+            task_tuple = self._fuse_tasks(task_tuple)
+        return tuple(sorted(task_tuple, key=self._shape_signature))
+
+    def _fuse_tasks(self, tasks: tuple) -> tuple:
+        """Replaces each group of tasks that differ only in `batched_hyperparams`, seed and repeat 
+        by one task whose trials are the trials of the group, if that takes fewer batches than 
+        running the tasks one by one; otherwise fusing would only change the layout of the results. 
+        Tasks with dependencies, or that other tasks depend on, are never fused."""
+        in_graph = {d for t in tasks for d in t.dependencies} | {t._id for t in tasks if t.dependencies}
+        
+        groups = {} # dicts keep the order in which each group is first seen
+        for task in tasks:
+            fusible = task.parallelize and task._id not in in_graph
+            key = self._fusion_signature(task) if fusible else task._id
+            groups.setdefault(key, []).append(task)
+
+        fused_tasks = []
+        for group in groups.values():
+            first = group[0]
+            if len(group) == 1 or not self._fusing_saves_batches(group):
+                fused_tasks.extend(group)
+                continue
+            fused = Task(model=first.model,
+                        dataset=first.dataset,
+                        model_params=first.model_params,
+                        training_params=first.training_params,
+                        type_=first.type_,
+                        seed=first.seed,
+                        apply_callback=first.apply_callback,
+                        repeat=sum(t.repeat for t in group),
+                        parallelize=True,
+                        replicas_per_device=first.replicas_per_device,
+                        fused=tuple(group))
+            info(f'Fused tasks {[t._id for t in group]} into task {fused._id}.')
+            fused_tasks.append(fused)
+        return tuple(fused_tasks)
+
+    def _fusing_saves_batches(self, group: list[Task]) -> bool:
+        num_batches = lambda repeat: len(pack_trials(repeat, self._task_devices, group[0].replicas_per_device))
+        return num_batches(sum(t.repeat for t in group)) < sum(num_batches(t.repeat) for t in group)
+
+    def distinct_shapes(self) -> tuple[Task]:
+        """Returns one task for each combination of shapes that the tasks compile."""
+        shapes = {}
+        for task in self.tasks:
+            key = (self._shape_signature(task), task.replicas_per_device, task.repeat)
+            shapes.setdefault(key, task)
+        return tuple(shapes.values())
+
+    def _shape_signature(self, task: Task) -> tuple:
+        values = tuple(getattr(task, section).get(name) for section, name in self.shape_hyperparams)
+        return (task.model, task.dataset, values)
+
+    def _fusion_signature(self, task: Task) -> tuple:
+        batched = set(self.batched_hyperparams)
+        params = tuple((section, name, _freeze(value)) 
+                        for section in ('model_params', 'training_params')
+                        for name, value in sorted(getattr(task, section).items())
+                        if (section, name) not in batched)
+        return (task.model, task.dataset, task.type_, task.replicas_per_device, params)
 
     @abstractmethod
     def _read_task(self, hyperparams: dict) -> Task:
@@ -36,12 +114,25 @@ class TaskReader(ABC):
 
     @abstractmethod
     def validate_task(self, task: Task) -> None:
-        if task.parallelize and task.repeat % self._num_devices != 0:
-            raise ValueError('Number of repeats is not a multiple of the number of devices.')
-        
-        bs = task.training_params['batch_size']
-        P = task.data_params['P']
-        if P % bs != 0:
-            raise ValueError("'batch_size' does not divide 'P'.")
+        # `repeat` need not be a multiple of the number of devices; see `batching.pack_trials`
+        if task.repeat < 1:
+            raise ValueError("'repeat' must be positive.")
+        if task.replicas_per_device < 1:
+            raise ValueError("'replicas_per_device' must be positive.")
+        if task.training_params.get('epochs_per_call', 1) < 1:
+            raise ValueError("'epochs_per_call' must be positive.")
         
+        if self.data_params is not None:
+            bs = task.training_params['batch_size']
+            P = self.data_params['P']
+            if P % bs != 0:
+                raise ValueError("'batch_size' does not divide 'P'.")
+
 
+def _freeze(value):
+    """Converts nested dicts and lists into hashable tuples."""
+    if isinstance(value, Mapping):
+        return tuple((k, _freeze(v)) for k, v in sorted(value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(map(_freeze, value))
+    return value
@@ -29,7 +29,9 @@ class Task:
 
     repeat: int = 1 
     parallelize: bool = True
+    replicas_per_device: int = 1 # trials vmapped together on each device
     dependencies: Set = field(default_factory=set)
+    fused: tuple = () # tasks whose trials this task runs together; see `TaskReader._fuse_tasks`
     
     _status: Status = field(default=Status.WAITING, init=False)
     
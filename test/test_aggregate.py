@@ -0,0 +1,29 @@
+import numpy as np
+
+from src.analysis.aggregate import task_metrics, to_table, TABLE_KEYS
+
+
+def test_task_metrics():
+    y = np.array([[1.0], [-1.0]])
+    yhat = np.array([[[1.0], [-1.0]], [[0.0], [1.0]], [[5.0], [5.0]]])
+    metrics = task_metrics(np.array([0.0, 2.5, np.nan]), np.array([0.1, 0.3, np.nan]), yhat, y)
+
+    assert metrics['num_nan'] == 1 and metrics['num_trials'] == 3
+    assert metrics['mean_loss'] == 1.25 and np.isclose(metrics['mean_train_loss'], 0.2)
+    # ensemble of the two finite trials predicts [0.5, 0]
+    assert metrics['ensemble_loss'] == np.mean([0.25, 1.0])
+    assert metrics['ensemble_accuracy'] == 0.5 and metrics['mean_accuracy'] == 0.5
+
+
+def test_all_nan():
+    metrics = task_metrics(np.array([np.nan]), np.array([np.nan]), np.zeros((1, 2, 1)), np.ones((2, 1)))
+    assert np.isnan(metrics['ensemble_loss']) and metrics['num_nan'] == 1
+
+
+def test_table_sorted_by_keys():
+    base = dict(zip(TABLE_KEYS, (1, 512, 1.0, 64, 1e-3)))
+    metrics = task_metrics(np.array([0.0]), np.array([0.0]), np.zeros((1, 1)), np.zeros(1))
+    rows = [dict(base, alpha=1.0, **metrics), dict(base, alpha=0.1, **metrics), dict(base, P=256, **metrics)]
+    table = to_table(rows)
+    assert list(table['P']) == [256, 512, 512]
+    assert list(table['alpha']) == [1.0, 0.1, 1.0]
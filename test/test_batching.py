@@ -0,0 +1,13 @@
+from src.tasks.batching import pack_trials
+
+
+def test_pack_trials():
+    assert pack_trials(8, 4) == [(0, 4, 1), (4, 4, 1)]
+    assert pack_trials(10, 4) == [(0, 4, 1), (4, 4, 1), (8, 2, 1)]
+    assert pack_trials(3, 4) == [(0, 3, 1)]
+
+
+def test_pack_trials_with_replicas():
+    assert pack_trials(20, 4, 5) == [(0, 4, 5)]
+    assert pack_trials(20, 4, 3) == [(0, 4, 3), (12, 4, 2)]
+    assert pack_trials(23, 4, 5) == [(0, 4, 5), (20, 3, 1)]
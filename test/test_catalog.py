@@ -0,0 +1,43 @@
+import numpy as np
+
+from src.run.catalog import Catalog, config_columns, trial_metrics, group_mean, losses
+
+
+def _columns(P, alpha, loss, N=64):
+    result = dict(test_loss_f=loss, train_losses=np.array([1.0, 0.5]),
+                  test_y=np.array([[1.0], [-1.0]]), test_yhat_f=np.array([[0.3], [0.2]]))
+    return dict(**config_columns('data_params', {'P': P, 'data_seed': 7}),
+                **config_columns('model_params', {'N': N, 'alpha': alpha}), 
+                **config_columns('training_params', {'eta_0': 1e-3}), **trial_metrics(result))
+
+
+def test_insert_and_query(tmp_path):
+    catalog = Catalog(str(tmp_path / 'catalog.sqlite'))
+    catalog.insert('a', 0, 'task-0', 'task-0/meta.json', _columns(512, 1.0, 0.25))
+    catalog.insert('a', 1, 'task-0', 'task-0/meta.json', _columns(512, 1.0, 0.75))
+    catalog.insert('b', 0, 'task-1', 'task-1/meta.json', _columns(512, 0.1, float('nan')))
+    catalog.insert('a', 1, 'task-0', 'task-0/meta.json', _columns(512, 1.0, 0.5)) # replaces
+
+    rows = catalog.query(['trial', 'test_loss_f'], 'task_hash = ?', ('a',))
+    assert list(rows['test_loss_f']) == [0.25, 0.5]
+    assert Catalog(catalog.path).query(['final_train_loss'])['final_train_loss'][0] == 0.5
+
+    # a different width is a different group
+    catalog.insert('c', 0, 'task-2', 'task-2/meta.json', _columns(512, 1.0, 2.0, N=128))
+
+    (seeds, Ps, alphas, Ns, etas), means, num_nan = losses([catalog])
+    assert list(zip(alphas, Ns)) == [(0.1, 64), (1.0, 64), (1.0, 128)]
+    assert np.isnan(means[0]) and list(means[1:]) == [0.375, 2.0]
+    assert list(num_nan) == [1, 0, 0]
+
+
+def test_trial_metrics_accuracy():
+    metrics = trial_metrics(dict(test_loss_f=np.float32(0.1), train_losses=np.array([]),
+                                 test_y=np.array([1.0, -1.0]), test_yhat_f=np.array([0.5, 0.5])))
+    assert metrics['test_accuracy'] == 0.5 and np.isnan(metrics['final_train_loss'])
+
+
+def test_group_mean():
+    rows = {'k': np.array([1, 2, 1]), 'v': np.array([1.0, 3.0, 2.0])}
+    (keys,), means, num_nan = group_mean(rows, ['k'], 'v')
+    assert list(keys) == [1, 2] and list(means) == [1.5, 3.0] and list(num_nan) == [0, 0]
@@ -0,0 +1,29 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import src.run.checkpoint as checkpoint
+
+
+def test_save_and_restore(tmp_path, monkeypatch):
+    monkeypatch.setattr(checkpoint, '_writer', ThreadPoolExecutor(max_workers=1))
+    path = str(tmp_path / 'task-abc' / 'trial-0.pkl')
+    ckpt = checkpoint.Checkpointer(path, 'a', every_seconds=3600)
+    assert ckpt.restore() is None
+    assert not ckpt.due()
+
+    ckpt.save({'chunk': 3}, wait=True)
+    assert checkpoint.Checkpointer(path, 'a', 3600).restore() == {'chunk': 3}
+    # written for a different configuration
+    assert checkpoint.Checkpointer(path, 'b', 3600).restore() is None
+
+
+def test_for_batch_fingerprints_identity(tmp_path, monkeypatch):
+    monkeypatch.setattr(checkpoint, '_dir', str(tmp_path))
+    monkeypatch.setattr(checkpoint, '_every_seconds', 60.0)
+    a = checkpoint.for_batch('abc', 8, {'alpha': 1.0}, [[0, 1]])
+    b = checkpoint.for_batch('abc', 8, {'alpha': 0.1}, [[0, 1]])
+    assert a.path == b.path and a.path.endswith('task-abc/trial-8.pkl')
+    assert a.fingerprint != b.fingerprint
+
+
+def test_disabled():
+    assert checkpoint.for_batch('abc', 0) is None
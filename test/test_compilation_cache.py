@@ -0,0 +1,71 @@
+import json
+import logging
+import os
+import subprocess
+import sys
+from dataclasses import asdict
+
+import jax
+import jax.numpy as jnp
+
+import src.run.compilation_cache as cc
+
+
+def _make_update():
+    # a new function object each call, so jax compiles it again rather than reusing its own cache
+    def update(x):
+        return jnp.sin(x) * 2.0
+    return jax.jit(update)
+
+
+def _hits_and_misses(cache_dir):
+    """Compiles the same function in two tasks, and prints their stats and the records passed on."""
+    messages = []
+    handler = logging.Handler()
+    handler.emit = lambda record: messages.append(record.getMessage())
+    logging.getLogger().addHandler(handler)
+    logging.getLogger().setLevel(logging.INFO)
+    jax.config.update('jax_persistent_cache_min_compile_time_secs', 0)
+    x = jnp.ones(3)
+
+    cc.initialize(cache_dir)
+    cc.begin_task()
+    _make_update()(x).block_until_ready()
+    first = cc.end_task('first')
+    cc.begin_task()
+    _make_update()(x).block_until_ready()
+    second = cc.end_task('second')
+    cc.close()
+    print(json.dumps({'first': asdict(first), 'second': asdict(second), 'messages': messages}))
+
+
+def test_monitor_counts_hits_and_misses(tmp_path):
+    # on CPU, jax only uses the cache with XLA's runtime flag, and once the backend has started
+    # with it every later compilation in the process uses that runtime, so this runs on its own
+    env = dict(os.environ, XLA_FLAGS='--xla_cpu_use_xla_runtime=true')
+    code = f'import test.test_compilation_cache as t; t._hits_and_misses({str(tmp_path / "local")!r})'
+    out = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True,
+                         check=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    stats = json.loads(out.stdout.splitlines()[-1])
+    first, second, messages = stats['first'], stats['second'], stats['messages']
+
+    assert (first['hits'], first['misses']) == (0, 1)
+    assert (second['hits'], second['misses']) == (1, 0)
+    assert second['seconds_saved'] >= 0.0
+    # records the loggers would have shown are passed on, and compile times are not
+    assert any(m.startswith('Persistent compilation cache hit') for m in messages)
+    assert not any(m.startswith('Finished XLA compilation') for m in messages)
+
+
+def test_copy_missing(tmp_path):
+    src, dst = tmp_path / 'shared', tmp_path / 'local'
+    src.mkdir()
+    (src / 'a').write_text('a')
+    (src / 'b').write_text('b')
+    dst.mkdir()
+    (dst / 'a').write_text('local a')
+
+    assert cc._copy_missing(str(src), str(dst)) == 1
+    assert (dst / 'a').read_text() == 'local a'
+    assert (dst / 'b').read_text() == 'b'
+    assert cc._copy_missing(None, str(dst)) == 0
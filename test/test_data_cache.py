@@ -0,0 +1,24 @@
+import json
+
+import numpy as np
+
+from src.run import data_cache
+
+
+def test_save_and_load(tmp_path):
+    data = {'train': (np.arange(6.0).reshape(3, 2), np.ones((3, 1))), 'test': (np.zeros((2, 2)), np.ones((2, 1)))}
+    key = data_cache.fingerprint({'P': 3, 'data_seed': 0}, [data_cache])
+    assert data_cache.load(str(tmp_path), key) is None
+
+    data_cache.save(str(tmp_path), key, data, {'P': 3, 'data_seed': 0})
+    cached = data_cache.load(str(tmp_path), key)
+    assert set(cached) == {'train', 'test'} and isinstance(cached['train'][0], np.memmap)
+    np.testing.assert_array_equal(cached['train'][0], data['train'][0])
+    assert not [p for p in tmp_path.iterdir() if p.name.endswith('.tmp')]
+
+
+def test_fingerprint_depends_on_params_and_code():
+    key = data_cache.fingerprint({'P': 3}, [data_cache])
+    assert key == data_cache.fingerprint({'P': 3}, [data_cache])
+    assert key != data_cache.fingerprint({'P': 4}, [data_cache])
+    assert key != data_cache.fingerprint({'P': 3}, [data_cache, json])
@@ -0,0 +1,30 @@
+import numpy as np
+
+from src.analysis.ensemble_curves import ensemble_curves
+
+
+def test_identical_trials_have_flat_curves():
+    y = np.array([[1.0], [-1.0], [1.0]])
+    yhat = np.repeat(np.array([[[0.5], [-0.5], [-1.0]]]), 4, axis=0)
+    curves = ensemble_curves(yhat, y, num_samples=16)
+    assert list(curves['k']) == [1, 2, 3, 4]
+    assert np.allclose(curves['loss'], np.mean([0.25, 0.25, 4.0]))
+    assert np.allclose(curves['accuracy'], 2 / 3)
+    assert np.allclose(curves['loss_ci'][0], curves['loss_ci'][1])
+
+
+def test_ensembling_reduces_loss():
+    rng = np.random.default_rng(0)
+    y = rng.standard_normal((50, 1))
+    yhat = y + rng.standard_normal((8, 50, 1))
+    curves = ensemble_curves(yhat, y, num_samples=64)
+    assert curves['loss'][-1] < curves['loss'][0]
+    assert curves['loss_ci'].shape == (2, 8)
+    assert np.all(curves['loss_ci'][0] <= curves['loss_ci'][1])
+
+
+def test_nan_trials_are_dropped():
+    y = np.ones((2, 1))
+    yhat = np.stack([np.ones((2, 1)), np.full((2, 1), np.nan)])
+    curves = ensemble_curves(yhat, y, np.array([0.0, np.nan]), num_samples=4)
+    assert list(curves['k']) == [1] and curves['loss'][0] == 0.0
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from src.experiment.training.eval_schedule import eval_epochs
+
+
+def test_every_k_epochs():
+    assert list(eval_epochs(12, None)) == [0, 5, 10]
+    assert list(eval_epochs(12, {'kind': 'every', 'every': 4})) == [0, 4, 8]
+
+
+def test_log_spaced_epochs():
+    epochs = eval_epochs(12000, {'kind': 'log', 'num_points': 50})
+    assert epochs[0] == 0 and epochs[-1] == 11999
+    assert len(epochs) <= 52 and np.all(np.diff(epochs) > 0)
+    # denser early on
+    assert np.sum(epochs < 100) > np.sum(epochs >= 6000)
+
+
+def test_fixed_number_of_epochs():
+    assert list(eval_epochs(10, {'kind': 'count', 'num_points': 4})) == [0, 3, 6, 9]
+
+
+def test_bad_schedules():
+    with pytest.raises(ValueError):
+        eval_epochs(10, {'kind': 'log'})
+    with pytest.raises(ValueError):
+        eval_epochs(10, {'kind': 'sometimes', 'num_points': 3})
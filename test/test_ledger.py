@@ -0,0 +1,28 @@
+from jax.random import PRNGKey
+
+from src.run.ledger import Ledger, task_hash
+from src.tasks.task import Task
+
+
+def _task(repeat=20, alpha=1.0):
+    return Task('m', 'd', {'N': 64, 'alpha': alpha}, {'eta_0': 1e-3}, 0, PRNGKey(0), None, repeat=repeat)
+
+
+def test_task_hash_ignores_repeat():
+    data_params = {'P': 512, 'data_seed': 1}
+    assert task_hash(_task(20), data_params) == task_hash(_task(40), data_params)
+    assert task_hash(_task(alpha=0.1), data_params) != task_hash(_task(), data_params)
+    assert task_hash(_task(), {'P': 1024, 'data_seed': 1}) != task_hash(_task(), data_params)
+
+
+def test_record_and_reload(tmp_path):
+    path = str(tmp_path / 'ledger.jsonl')
+    ledger = Ledger(path)
+    ledger.record('abc', 0, 'task-3', 'trial_0_result.pkl')
+    ledger.record('abc', 1, 'task-3', 'trial_1_result.pkl')
+
+    reloaded = Ledger(path)
+    assert reloaded.is_done('abc', 1) and not reloaded.is_done('abc', 2)
+    assert reloaded.folder('abc') == 'task-3'
+    assert reloaded.is_folder_taken('task-3', 'other') and not reloaded.is_folder_taken('task-3', 'abc')
+
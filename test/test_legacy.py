@@ -0,0 +1,34 @@
+import pickle
+
+import numpy as np
+
+from src.analysis import legacy
+from src.experiment.training.Result import Result
+from src.run.result_store import load_task
+
+
+def _write_trials(folder, num_trials):
+    folder.mkdir()
+    for i in range(num_trials):
+        result = Result(weight_init_key=np.zeros(2), params_f={'w': np.ones(3)},
+                        train_losses=np.array([1.0, 0.5 * i]), test_losses=np.zeros(2),
+                        test_loss_f=np.float32(i), test_yhat_f=np.full((4, 1), i),
+                        test_y=np.ones((4, 1)))
+        with open(folder / f'trial_{i}_result.pkl', 'wb') as f:
+            pickle.dump(result, f)
+
+
+def test_load_task_keeps_requested_fields(tmp_path):
+    _write_trials(tmp_path / 'task-0', 3)
+    loaded = legacy.load_task(str(tmp_path / 'task-0'), ('test_loss_f', 'test_yhat_f', 'test_y'))
+    assert list(loaded['trials']) == [0, 1, 2]
+    assert loaded['test_yhat_f'].shape == (3, 4, 1) and loaded['test_y'].shape == (4, 1)
+    assert 'params_f' not in loaded
+
+
+def test_convert_task(tmp_path):
+    _write_trials(tmp_path / 'task-0', 2)
+    assert legacy.convert_task(str(tmp_path / 'task-0')) == 2
+    task = load_task(str(tmp_path / 'task-0'))
+    assert list(task['test_loss_f']) == [0.0, 1.0]
+    assert task.params() is None
@@ -0,0 +1,38 @@
+import pickle
+from unittest.mock import patch
+
+import numpy as np
+
+import src.experiment.dataset.cifar10 as cifar10
+
+
+def _write_batches(data_dir, per_batch=4):
+    folder = data_dir / cifar10.BATCHES_FOLDER
+    folder.mkdir(parents=True)
+    for i, name in enumerate(cifar10.TRAIN_BATCHES + cifar10.TEST_BATCHES):
+        images = np.arange(per_batch * 3072).reshape(per_batch, 3072) % 251 + i
+        batch = {b'data': images.astype(np.uint8), b'labels': [i] * per_batch}
+        with open(folder / name, 'wb') as f:
+            pickle.dump(batch, f)
+
+
+def test_read_batches(tmp_path):
+    _write_batches(tmp_path)
+    data = cifar10.read_batches(str(tmp_path))
+    X, y = data['train']
+    assert X.shape == (20, 32, 32, 3) and X.dtype == np.uint8 and y.dtype == np.uint8
+    assert list(y[::4]) == [0, 1, 2, 3, 4] and list(data['test'][1]) == [5] * 4
+    # the first 1024 values of a row are the red plane
+    assert X[0, 0, 1, 0] == 1 and X[0, 0, 0, 1] == 1024 % 251
+
+
+def test_flat_file_round_trip(tmp_path):
+    _write_batches(tmp_path)
+    with patch.object(cifar10, 'NUM_TRAIN', 20), patch.object(cifar10, 'NUM_TEST', 4):
+        cifar10.write_flat(str(tmp_path))
+        flat = cifar10.read_cifar10(str(tmp_path))
+        batches = cifar10.read_batches(str(tmp_path))
+    assert isinstance(flat['train'][0], np.memmap)
+    for split in ('train', 'test'):
+        for a, b in zip(flat[split], batches[split]):
+            np.testing.assert_array_equal(a, b)
@@ -0,0 +1,54 @@
+import numpy as np
+
+from src.run.pack import PackWriter, PackReader, PACK_FNAME, INDEX_FNAME
+from src.run.result_store import TaskStoreWriter, load_task, task_folders, read_file
+
+
+def test_add_and_read(tmp_path):
+    task = tmp_path / 'src'
+    (task / 'params').mkdir(parents=True)
+    (task / 'task_config.yaml').write_text('model: m\n')
+    np.save(str(task / 'params' / 'w.npy'), np.arange(6.0).reshape(2, 3))
+
+    writer = PackWriter(str(tmp_path))
+    assert writer.add_folder(str(task), 'task-0') == 2
+    assert writer.has_folder('task-0') and not writer.has_folder('task-1')
+
+    reader = PackReader(str(tmp_path))
+    assert reader.folders() == ['task-0']
+    assert reader.read('task-0/task_config.yaml', verify=True) == b'model: m\n'
+    w = reader.load('task-0/params/w.npy')
+    assert isinstance(w, np.memmap) and w[1, 2] == 5.0
+
+
+def test_incomplete_tail_is_dropped(tmp_path):
+    (tmp_path / 'a').write_bytes(b'abc')
+    writer = PackWriter(str(tmp_path))
+    writer.add_file('task-0/a', str(tmp_path / 'a'))
+    with open(tmp_path / PACK_FNAME, 'ab') as f:
+        f.write(b'partial')
+    with open(tmp_path / INDEX_FNAME, 'a') as f:
+        f.write('{"name": "task-1/b", "offs')
+
+    writer = PackWriter(str(tmp_path))
+    assert list(writer.entries) == ['task-0/a']
+    assert (tmp_path / PACK_FNAME).read_bytes() == b'abc'
+
+
+def test_packed_task_reads_like_a_store(tmp_path):
+    folder = tmp_path / 'task-3'
+    store = TaskStoreWriter(str(folder), 2)
+    for trial in range(2):
+        store.write(trial, dict(test_loss_f=np.float32(trial), test_y=np.ones((4, 1))))
+    (folder / 'task_config.yaml').write_text('repeat: 2\n')
+    del store
+    PackWriter(str(tmp_path)).add_folder(str(folder), 'task-3')
+    for path in sorted(folder.rglob('*'), reverse=True):
+        path.unlink() if path.is_file() else path.rmdir()
+    folder.rmdir()
+
+    assert task_folders(str(tmp_path)) == ['task-3']
+    assert read_file(str(folder), 'task_config.yaml') == b'repeat: 2\n'
+    task = load_task(str(folder))
+    assert list(task.trials) == [0, 1] and list(task['test_loss_f']) == [0.0, 1.0]
+    assert task.test_y.shape == (4, 1)
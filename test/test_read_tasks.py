@@ -0,0 +1,59 @@
+from src.tasks.read_tasks import TaskReader
+from src.tasks.task import Task
+
+
+class _Reader(TaskReader):
+    batched_hyperparams = (('model_params', 'alpha'), ('training_params', 'eta_0'))
+
+    def _read_task(self, config):
+        return Task('m', 'd', dict(config['model_params']), dict(config['training_params']),
+                    0, config['seed'], None, repeat=config['repeat'],
+                    dependencies=set(config.get('dependencies', ())))
+
+    def validate_task(self, task):
+        super().validate_task(task)
+
+
+def _config(alpha, N=64, seed=0, repeat=2, **kwargs):
+    return dict(model_params={'N': N, 'alpha': alpha},
+                training_params={'eta_0': 1e-3, 'batch_size': 4},
+                repeat=repeat, seed=seed, **kwargs)
+
+
+def test_fuse_tasks(monkeypatch):
+    monkeypatch.setattr('src.tasks.read_tasks.device_count', lambda: 4)
+    configs = [_config(0.1), _config(1.0), _config(0.1, N=128), _config(10.0)]
+    tasks = _Reader(configs, fuse=True).tasks
+
+    assert len(tasks) == 2
+    fused, single = tasks
+    assert [t.model_params['alpha'] for t in fused.fused] == [0.1, 1.0, 10.0]
+    assert fused.repeat == 6
+    assert single.fused == () and single.model_params['N'] == 128
+
+
+def test_fuse_tasks_only_when_it_saves_batches(monkeypatch):
+    monkeypatch.setattr('src.tasks.read_tasks.device_count', lambda: 4)
+    # each task fills the devices once, so fusing them would still take three batches
+    configs = [_config(0.1, repeat=4), _config(1.0, repeat=4), _config(10.0, repeat=4)]
+    assert all(t.fused == () for t in _Reader(configs, fuse=True).tasks)
+    # two devices per task leave a device idle in each task's batch
+    configs = [_config(0.1, repeat=3), _config(1.0, repeat=3)]
+    tasks = _Reader(configs, fuse=True, devices_per_task=2).tasks
+    assert len(tasks) == 1 and tasks[0].repeat == 6
+
+
+def test_fuse_tasks_skips_dependencies(monkeypatch):
+    monkeypatch.setattr('src.tasks.read_tasks.device_count', lambda: 4)
+    configs = [_config(0.1), _config(1.0, dependencies=[0]), _config(10.0)]
+    tasks = _Reader(configs, fuse=True).tasks
+    assert len(tasks) == 3
+    assert all(t.fused == () for t in tasks)
+
+
+def test_tasks_ordered_by_shape():
+    class ShapeReader(_Reader):
+        shape_hyperparams = (('model_params', 'N'),)
+    configs = [_config(0.1, N=128), _config(0.1, N=64), _config(1.0, N=128)]
+    tasks = ShapeReader(configs).tasks
+    assert [t.model_params['N'] for t in tasks] == [64, 128, 128]
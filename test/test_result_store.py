@@ -0,0 +1,46 @@
+import numpy as np
+
+from src.run.result_store import TaskStoreWriter, load_task, flatten, unflatten
+
+
+def _result(trial):
+    return dict(weight_init_key=np.array([0, trial], dtype=np.uint32),
+                params_f={'params': {'dense': {'kernel': np.full((2, 3), float(trial))}}},
+                train_losses=np.arange(3.0) + trial, test_losses=np.arange(3.0), test_loss_f=np.float32(trial),
+                test_yhat_f=np.zeros((4, 1)), test_y=np.ones((4, 1)), milestone_train_losses=None,
+                eval_epochs=np.array([0, 5, 10]))
+
+
+def test_write_and_read(tmp_path):
+    writer = TaskStoreWriter(str(tmp_path), 3)
+    writer.write(2, _result(2))
+    writer.write(0, _result(0))
+    assert writer.is_done(2) and not writer.is_done(1)
+
+    task = load_task(str(tmp_path))
+    assert list(task.trials) == [0, 2]
+    assert list(task['test_loss_f']) == [0.0, 2.0]
+    assert task.field('train_losses', rows=True).shape == (3, 3)
+    assert np.isnan(task.field('train_losses', rows=True)[1]).all()
+    assert task.test_y.shape == (4, 1) and list(task.eval_epochs) == [0, 5, 10]
+    assert 'milestone_train_losses' not in task.fields
+    assert task.params(2)['params']['dense']['kernel'][0, 0] == 2.0
+
+
+def test_grow_store(tmp_path):
+    TaskStoreWriter(str(tmp_path), 2).write(1, _result(1))
+    writer = TaskStoreWriter(str(tmp_path), 4)
+    assert writer.is_done(1)
+    writer.write(3, _result(3))
+    assert list(load_task(str(tmp_path)).trials) == [1, 3]
+
+
+def test_without_params(tmp_path):
+    TaskStoreWriter(str(tmp_path), 1, save_params=False).write(0, _result(0))
+    assert load_task(str(tmp_path)).params() is None
+
+
+def test_flatten():
+    tree = {'a': {'b': 1, 'c': {'d': 2}}, 'e': 3}
+    assert flatten(tree) == {'a/b': 1, 'a/c/d': 2, 'e': 3}
+    assert unflatten(flatten(tree)) == tree
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from src.experiment.training.Result import Result
+from src.run.result_writer import ResultWriter
+from src.run.checkpoint import Preempted
+
+
+def _batched_result(num_devices, num_replicas):
+    shape = (num_devices, num_replicas)
+    return Result(weight_init_key=np.zeros((*shape, 2)), params_f={'w': np.arange(np.prod(shape)).reshape(shape)},
+                  train_losses=np.zeros((*shape, 3)), test_losses=np.zeros((*shape, 3)),
+                  test_loss_f=np.zeros(shape), test_yhat_f=np.zeros((*shape, 4, 1)),
+                  test_y=np.arange(num_devices)[:, None] * np.ones((1, 4)), eval_epochs=np.array([0, 5, 10]))
+
+
+def test_writer_splits_and_saves():
+    saved = {}
+    with ResultWriter(lambda target, result: saved.__setitem__(target, result), max_pending=1) as writer:
+        writer.submit(_batched_result(2, 3), list(range(6)))
+        writer.submit(_batched_result(1, 2), [6, 7])
+
+    assert sorted(saved) == list(range(8))
+    assert int(saved[4].params_f['w']) == 4 # device-major
+    assert saved[4].test_y[0] == 1 and saved[4].train_losses.shape == (3,)
+    assert list(saved[7].eval_epochs) == [0, 5, 10]
+
+
+def test_failed_save_does_not_hide_the_exception_that_ended_the_block():
+
+    def save(target, result):
+        raise OSError('disk full')
+
+    with pytest.raises(Preempted):
+        with ResultWriter(save) as writer:
+            writer.submit(_batched_result(1, 1), [0])
+            raise Preempted()
+    with pytest.raises(OSError):
+        with ResultWriter(save) as writer:
+            writer.submit(_batched_result(1, 1), [0])
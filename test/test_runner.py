@@ -1,4 +1,5 @@
 from genericpath import exists
+import numpy as np
 import src.run.TaskRunner as tr
 from src.tasks.task import Task
 
@@ -12,4 +13,118 @@ def test_tcs_yaml(tmp_path):
     t = Task('m', 'd', {'erg': 2.0}, {'werg': False}, None, None, None)
     tr.save_config(str(tmp_path), t)
     assert exists(str(tmp_path / "task_config.yaml"))
-    print((tmp_path / "task_config.yaml").read_content())
\ No newline at end of file
+    print((tmp_path / "task_config.yaml").read_content())
+
+def test_trial_keys_are_stable():
+    from jax.random import PRNGKey
+    import jax.numpy as jnp
+    seed = PRNGKey(3)
+    assert jnp.array_equal(tr.trial_keys(seed, 20), tr.trial_keys(seed, 40)[:20])
+
+
+class _PD:
+    def __init__(self, save_dir):
+        self.save_dir = save_dir
+        self.data_params = {'P': 8, 'data_seed': 0}
+        self.devices = ('d0', 'd1')
+
+    def data_for(self, devices):
+        return None
+
+
+class _DroppingWriter:
+    def __init__(self, save):
+        pass
+
+    def submit(self, batched_result, targets):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+def test_requeue_resumes_from_the_checkpoint_of_its_batch(tmp_path, monkeypatch):
+    from jax.random import PRNGKey
+    from src.run import checkpoint
+    from src.run.checkpoint import Preempted
+    from src.run.ledger import Ledger, task_hash
+
+    monkeypatch.setattr(checkpoint, '_dir', str(tmp_path / 'checkpoints'))
+    monkeypatch.setattr(checkpoint, '_every_seconds', 60.0)
+    monkeypatch.setattr(tr, 'ResultWriter', _DroppingWriter)
+    paths = []
+
+    def preempted_at(batch):
+        def apply(keys, data, devices, mp, tp, checkpoint):
+            paths.append(checkpoint.path)
+            if len(paths) == batch:
+                raise Preempted()
+        return apply
+
+    PD = _PD(str(tmp_path))
+    ledger = Ledger(str(tmp_path / 'ledger.jsonl'))
+    # two batches of two trials; the job is killed while the second trains
+    task = Task('m', 'd', {'N': 4}, {'eta_0': 1.0}, 0, PRNGKey(0), preempted_at(2), repeat=4)
+    runner = tr.TaskRunner(PD, ledger=ledger)
+    try:
+        runner.run_repeat_task(task)
+    except Preempted:
+        pass
+    hash = task_hash(task, PD.data_params)
+    for trial in (0, 1):
+        ledger.record(hash, trial, f'task-{task._id}')
+
+    # the requeued job only runs the second batch, which must find its checkpoint
+    task.apply_callback = preempted_at(3)
+    try:
+        runner.run_repeat_task(task)
+    except Preempted:
+        pass
+    assert paths[2] == paths[1] != paths[0]
+
+
+class _SavingWriter:
+    def __init__(self, save):
+        self.save = save
+
+    def submit(self, batched_result, targets):
+        for target in targets:
+            self.save(target, {'test_loss_f': np.float32(target[1])})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+def test_raising_repeat_of_a_packed_task_trains_the_new_trials(tmp_path, monkeypatch):
+    from jax.random import PRNGKey
+    from src.run import checkpoint
+    from src.run.pack import PackWriter
+    from src.run.result_store import load_task
+
+    monkeypatch.setattr(checkpoint, '_dir', str(tmp_path / 'checkpoints'))
+    monkeypatch.setattr(tr, 'ResultWriter', _SavingWriter)
+    trained = []
+
+    def apply(keys, data, devices, mp, tp, checkpoint):
+        trained.append(keys.shape[:2])
+
+    runner = tr.TaskRunner(_PD(str(tmp_path)), pack=PackWriter(str(tmp_path)))
+    task = Task('m', 'd', {'N': 4}, {'eta_0': 1.0}, 0, PRNGKey(0), apply, repeat=2)
+    runner.run_repeat_task(task)
+    assert trained == [(2, 1)] and not exists(str(tmp_path / f'task-{task._id}'))
+
+    runner.run_repeat_task(task)
+    assert trained == [(2, 1)]
+
+    task.repeat = 4
+    runner.run_repeat_task(task)
+    assert trained == [(2, 1), (2, 1)] and not exists(str(tmp_path / f'task-{task._id}'))
+    results = load_task(str(tmp_path / f'task-{task._id}'))
+    assert list(results.trials) == [0, 1, 2, 3]
+    assert list(results['test_loss_f']) == [0.0, 1.0, 2.0, 3.0]
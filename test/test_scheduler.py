@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+
+import pytest
+
+import src.run.scheduler as scheduler
+from src.run.scheduler import Scheduler, split_devices
+from src.tasks.task import Task, Status
+
+
+def test_split_devices():
+    assert split_devices(range(4), 0) == [(0, 1, 2, 3)]
+    assert split_devices(range(4), 2) == [(0, 1), (2, 3)]
+    assert split_devices(range(4), 1) == [(0,), (1,), (2,), (3,)]
+    with pytest.raises(ValueError):
+        split_devices(range(4), 3)
+
+
+def test_scheduler_respects_dependencies(monkeypatch):
+    finished = []
+    def fake_run_task(task, runner):
+        assert task._status is Status.SUBMITTED
+        assert all(d in finished for d in task.dependencies)
+        finished.append(task._id)
+    monkeypatch.setattr(scheduler, '_run_task', fake_run_task)
+
+    a = Task('m', 'd', {}, {}, None, None, None)
+    b = Task('m', 'd', {}, {}, None, None, None, dependencies={a._id})
+    c = Task('m', 'd', {}, {}, None, None, None)
+    PD = SimpleNamespace(devices=[0, 1, 2, 3])
+    Scheduler(PD, devices_per_task=2).run([b, a, c])
+
+    assert sorted(finished) == sorted([a._id, b._id, c._id])
+    assert finished.index(a._id) < finished.index(b._id)
+    assert all(t._status is Status.DONE for t in (a, b, c))
+
+
+def test_preempted_task_still_pushes_its_compiled_programs(monkeypatch):
+    from src.run.checkpoint import Preempted
+
+    ended = []
+    monkeypatch.setattr(scheduler.compilation_cache, 'end_task', ended.append)
+    def preempted(task):
+        raise Preempted()
+    runner = SimpleNamespace(devices=(0,), run_repeat_task=preempted)
+
+    task = Task('m', 'd', {}, {}, None, None, None)
+    with pytest.raises(Preempted):
+        scheduler._run_task(task, runner)
+    assert ended == [task._id]
@@ -0,0 +1,118 @@
+import os
+
+from src.run.syncer import ResultSyncer, file_checksum
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def test_sync_copies_only_new_and_changed_files(tmp_path):
+    local, remote = tmp_path / 'local', tmp_path / 'remote'
+    _write(str(local / 'task-0' / 'a.npy'), b'a' * 100)
+    _write(str(local / 'ledger.jsonl'), b'{}\n')
+    syncer = ResultSyncer(str(local), str(remote))
+
+    assert syncer.sync() == 2
+    assert (remote / 'task-0' / 'a.npy').read_bytes() == b'a' * 100
+    assert syncer.sync() == 0
+
+    _write(str(local / 'ledger.jsonl'), b'{}\n{}\n')
+    _write(str(local / 'task-1' / 'b.npy'), b'b')
+    assert syncer.pending() == ['ledger.jsonl', os.path.join('task-1', 'b.npy')]
+    assert syncer.finish() == 2
+    assert file_checksum(str(remote / 'ledger.jsonl')) == file_checksum(str(local / 'ledger.jsonl'))
+    assert not [name for name in os.listdir(remote) if name.endswith('.tmp')]
+
+
+def test_sync_retries_failed_copies(tmp_path, monkeypatch):
+    local, remote = tmp_path / 'local', tmp_path / 'remote'
+    _write(str(local / 'a.npy'), b'a')
+    syncer = ResultSyncer(str(local), str(remote), retries=2, backoff=1.0)
+    monkeypatch.setattr('src.run.syncer.time.sleep', lambda _: None)
+
+    copy, failures = syncer._copy, []
+    def flaky_copy(path, *dirs):
+        if not failures:
+            failures.append(path)
+            raise OSError('transient')
+        return copy(path, *dirs)
+    monkeypatch.setattr(syncer, '_copy', flaky_copy)
+
+    assert syncer.sync() == 1
+    assert failures == ['a.npy'] and (remote / 'a.npy').read_bytes() == b'a'
+
+
+def test_restore_copies_missing_files_back(tmp_path):
+    local, remote = tmp_path / 'local', tmp_path / 'remote'
+    _write(str(remote / 'task-0' / 'done.npy'), b'earlier run')
+    _write(str(remote / 'ledger.jsonl'), b'old\n')
+    _write(str(local / 'ledger.jsonl'), b'new\n')
+    syncer = ResultSyncer(str(local), str(remote))
+
+    assert syncer.restore() == 1
+    assert (local / 'task-0' / 'done.npy').read_bytes() == b'earlier run'
+    assert syncer.pending() == ['ledger.jsonl']
+
+
+def test_append_only_files_get_their_tail_and_removed_files_go(tmp_path):
+    local, remote = tmp_path / 'local', tmp_path / 'remote'
+    _write(str(local / 'results.pack'), b'first')
+    _write(str(local / 'task-0' / 'meta.json'), b'{}')
+    syncer = ResultSyncer(str(local), str(remote), append_only=['results.pack'])
+    syncer.sync()
+
+    with open(local / 'results.pack', 'ab') as f:
+        f.write(b'second')
+    os.remove(local / 'task-0' / 'meta.json')
+    os.rmdir(local / 'task-0')
+    appended = []
+    append = syncer._append
+    syncer._append = lambda src, dst: appended.append(dst) or append(src, dst)
+
+    assert syncer.sync() == 1
+    assert (remote / 'results.pack').read_bytes() == b'firstsecond' and len(appended) == 1
+    assert not (remote / 'task-0').exists()
+
+
+def test_append_only_file_cut_back_locally_is_copied_whole(tmp_path):
+    local, remote = tmp_path / 'local', tmp_path / 'remote'
+    # synced with the bytes of an entry whose index line was never written
+    _write(str(local / 'results.pack'), b'doneXX')
+    ResultSyncer(str(local), str(remote), append_only=['results.pack']).sync()
+
+    # the requeued job restores the pack, drops the unfinished entry and packs more
+    syncer = ResultSyncer(str(local), str(remote), append_only=['results.pack'])
+    syncer.restore()
+    _write(str(local / 'results.pack'), b'done')
+    with open(local / 'results.pack', 'ab') as f:
+        f.write(b'next')
+
+    assert syncer.sync() == 1
+    assert (remote / 'results.pack').read_bytes() == b'donenext'
+    with open(local / 'results.pack', 'ab') as f:
+        f.write(b'more')
+    assert syncer.sync() == 1
+    assert (remote / 'results.pack').read_bytes() == b'donenextmore'
+
+
+def test_snapshot_is_synced_instead_of_the_live_database(tmp_path):
+    import sqlite3
+    from src.run.catalog import Catalog
+
+    local, remote = tmp_path / 'local', tmp_path / 'remote'
+    local.mkdir()
+    catalog = Catalog(str(local / 'catalog.sqlite'))
+    catalog.insert('a', 0, 'task-0', 'task-0/meta.json', {'test_loss_f': 0.5})
+    _write(str(local / 'catalog.sqlite-journal'), b'mid-transaction')
+    syncer = ResultSyncer(str(local), str(remote))
+    syncer.add_snapshot('catalog.sqlite', catalog.backup)
+
+    assert syncer.pending() == ['catalog.sqlite']
+    assert syncer.sync() == 1
+    catalog.close()
+    with sqlite3.connect(str(remote / 'catalog.sqlite')) as connection:
+        assert connection.execute('SELECT test_loss_f FROM trials').fetchall() == [(0.5,)]
+    assert sorted(os.listdir(remote)) == ['catalog.sqlite']
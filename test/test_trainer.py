@@ -0,0 +1,86 @@
+import jax
+import jax.numpy as jnp
+import numpy as np
+import flax.linen as nn
+import pytest
+
+from jax.random import PRNGKey, split
+
+import src.experiment.training.momentum as momentum
+from src.experiment.dataset.transforms import normalization, normalize
+from src.experiment.model.common import NTK_Dense
+
+NUM_TRAIN, NUM_VAL, NUM_TEST = 64, 1600, 64 # the first 1600 test points are held out; see `validation_test_split`
+REPLICAS = 2
+
+
+class _MLP(nn.Module):
+    width: int
+
+    @nn.compact
+    def __call__(self, x):
+        x = x.reshape((x.shape[0], -1))
+        return NTK_Dense(1)(nn.relu(NTK_Dense(self.width)(x)))
+
+
+@pytest.fixture(autouse=True)
+def toy_model(monkeypatch):
+    monkeypatch.setattr(momentum, 'build_model', _MLP)
+    momentum.get_trainer.cache_clear()
+    yield
+    momentum.get_trainer.cache_clear()
+
+
+def _images(device_dtype='float32'):
+    rng = np.random.default_rng(0)
+    X = {s: rng.integers(0, 256, (n, 32, 32, 3), dtype=np.uint8) 
+            for s, n in (('train', NUM_TRAIN), ('test', NUM_VAL + NUM_TEST))}
+    y = {s: rng.normal(size=(len(X[s]), 1)).astype(np.float32) for s in X}
+    mean, scale = normalization(X['train'], center=True, sphere_scale=True)
+    if device_dtype == 'uint8':
+        data = {s: (X[s], y[s]) for s in X}
+        data['norm'] = (mean.astype(np.float32), np.float32(scale))
+    else:
+        data = {s: (normalize(X[s], mean, scale), y[s]) for s in X}
+    # replicated onto the devices, as by `PreprocessDevice`
+    return jax.tree_map(lambda z: jax.device_put_sharded([z], jax.devices()[:1]), data)
+
+
+def _apply(data, alpha=2.0, **training_params):
+    keys = split(PRNGKey(0), REPLICAS).reshape((1, REPLICAS, -1))
+    tp = {'batch_size': 16, 'epochs': 3, 'eta_0': 1e-3, 'eval_schedule': {'every': 1}, **training_params}
+    return momentum.apply(keys, data, jax.devices()[:1], {'N': 8, 'alpha': alpha}, tp)
+
+
+def test_cached_initial_outputs_match_recomputed_ones():
+    data = _images()
+    result = _apply(data)
+    X_test, y_test = data['test'][0][0, NUM_VAL:], data['test'][1][0, NUM_VAL:]
+    model = _MLP(8)
+    for r in range(REPLICAS):
+        p0 = model.init(result.weight_init_key[0, r], jnp.zeros((1, 32, 32, 3)))
+        params_f = jax.tree_map(lambda z: z[0, r], result.params_f)
+        yhat = 2.0 * (model.apply(params_f, X_test) - model.apply(p0, X_test))
+        np.testing.assert_allclose(result.test_yhat_f[0, r], yhat, rtol=1e-4, atol=1e-5)
+        np.testing.assert_allclose(result.test_loss_f[0, r], jnp.mean((yhat - y_test) ** 2), rtol=1e-4)
+        # the last evaluation is of the final params
+        np.testing.assert_allclose(result.test_losses[0, r, -1], result.test_loss_f[0, r], rtol=1e-4)
+
+
+def test_step_losses_match_full_pass_losses():
+    # without updates, every minibatch sees the initial params, so the mean minibatch loss of an 
+    # epoch is the full-pass loss; the centered outputs are 0, so both are the mean squared label
+    data = _images()
+    result = _apply(data, eta_0=0.0, step_train_losses=True, train_loss_milestones=[0, 2], 
+                    epochs_per_call=2)
+    expected = np.mean(np.asarray(data['train'][1]) ** 2)
+    assert result.train_losses.shape == (1, REPLICAS, 3)
+    np.testing.assert_allclose(result.train_losses, expected, rtol=1e-5)
+    np.testing.assert_allclose(result.milestone_train_losses, expected, rtol=1e-5)
+
+
+def test_uint8_images_train_like_float32_images():
+    float_result = _apply(_images('float32'), epochs_per_call=2)
+    uint8_result = _apply(_images('uint8'), epochs_per_call=2)
+    for name in ('train_losses', 'test_losses', 'test_loss_f', 'test_yhat_f'):
+        np.testing.assert_allclose(uint8_result[name], float_result[name], rtol=1e-4, atol=1e-5)
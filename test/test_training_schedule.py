@@ -0,0 +1,16 @@
+import numpy as np
+
+from src.experiment.training.momentum import chunk_schedules, SKIP_EPOCH, NO_EVAL
+
+
+def test_chunk_schedules():
+    chunks = chunk_schedules(7, 3, range(0, 7, 2))
+    schedules = [list(schedule) for schedule, _ in chunks]
+    assert schedules == [[0, NO_EVAL, 1], [NO_EVAL, 0, NO_EVAL], [0, SKIP_EPOCH, SKIP_EPOCH]]
+    assert [num_evals for _, num_evals in chunks] == [2, 1, 1]
+
+
+def test_single_epoch_chunks():
+    chunks = chunk_schedules(4, 1, [0])
+    assert [int(schedule[0]) for schedule, _ in chunks] == [0, NO_EVAL, NO_EVAL, NO_EVAL]
+    assert all(schedule.dtype == np.int32 for schedule, _ in chunks)
@@ -0,0 +1,37 @@
+import numpy as np
+
+from src.experiment.dataset.transforms import apply_transforms, transforms_for, DEFAULT_TRANSFORMS
+
+
+def _data():
+    rng = np.random.default_rng(0)
+    X = rng.integers(0, 256, (40, 4, 4, 3), dtype=np.uint8)
+    y = np.arange(40, dtype=np.uint8) % 10
+    return dict(train=(X, y), test=(X[:20], y[:20]))
+
+
+def test_four_class_split():
+    data = apply_transforms(_data(), DEFAULT_TRANSFORMS)
+    (X, y), (X_test, y_test) = data['train'], data['test']
+    assert X.dtype == np.float32 and y.shape == (32, 1) and X_test.shape == (16, 4, 4, 3)
+    assert set(np.unique(y)) == {-1.0, 1.0} and y[0, 0] == 1.0 and y[2, 0] == -1.0
+    np.testing.assert_allclose(X.mean(axis=0), 0.0, atol=1e-5)
+    np.testing.assert_allclose(np.linalg.norm(X.reshape(32, -1), axis=1).mean(), 1.0, rtol=1e-5)
+
+
+def test_subset_grayscale_and_defaults():
+    transforms = transforms_for({'transforms': {'classes': [], 'positive_classes': [0], 'grayscale': True,
+                                                'center': False, 'sphere_scale': False}})
+    data = apply_transforms(_data(), transforms, lambda train: (train[0][:8], train[1][:8]))
+    X, y = data['train']
+    assert X.shape == (8, 4, 4, 1) and X.max() <= 1.0 and list(y[:2, 0]) == [1.0, -1.0]
+    assert transforms_for({}) == DEFAULT_TRANSFORMS
+
+
+def test_uint8_images_with_normalization_constants():
+    float_data = apply_transforms(_data(), DEFAULT_TRANSFORMS)
+    data = apply_transforms(_data(), DEFAULT_TRANSFORMS, device_dtype='uint8')
+    X, _ = data['train']
+    mean, scale = data['norm']
+    assert X.dtype == np.uint8 and mean.shape == (4, 4, 3) and mean.dtype == np.float32
+    np.testing.assert_allclose((X.astype(np.float32) - mean) / scale, float_data['train'][0], atol=1e-6)